@@ -68,14 +68,25 @@ bl_info = {
 
 import os
 import bpy
+from mathutils import Matrix, Vector
+from . import generator, transforms, compression, atlas, textures, production, preview, bundle, profiler, budget, headless
+from . import lightmaps as lightmap_encoding
+import numpy as np
 import shutil
 import math
-from string import Template
-import http.server
-import urllib.request
-import socketserver
 import threading
 import json
+import argparse
+import subprocess
+import tempfile
+import time
+import hashlib
+import struct
+import urllib.parse
+import base64
+import concurrent.futures
+import functools
+from array import array
 
 PORT = 8001
 
@@ -87,6 +98,22 @@ PATH_MEDIA = "media/"
 PATH_ENVIRONMENT = "env/"
 PATH_LIGHTMAPS = "lightmaps/"
 PATH_JAVASCRIPT = "js/"
+PATH_TEXTURES = "textures/"
+PATH_TEXTURE_CACHE = ".texture_cache/"
+PATH_VENDOR_CACHE = ".vendor_cache/"
+PATH_MANIFEST = "export_manifest.json"
+PATH_DESCRIPTION = "scene_description.json"
+PATH_ATLAS_MANIFEST = "atlas.json"
+ATLAS_PADDING = 2
+MANIFEST_VERSION = 4
+COMBINED_SCENE_NAME = "scene"
+# meshes with fewer polygons are not worth a LOD chain
+LOD_MIN_POLYGONS = 256
+GLTF_FORMATS = [
+    ('GLTF_EMBEDDED', "glTF Embedded (.gltf)", "Buffers and textures base64 encoded inside the .gltf file"),
+    ('GLB', "glTF Binary (.glb)", "Binary glTF, textures written once to the shared textures directory"),
+    ('GLTF_SEPARATE', "glTF Separate (.gltf + .bin)", "JSON glTF with external .bin buffers and shared textures"),
+]
 AFRAME_ENABLED = "AFRAME_ENABLED"
 AFRAME_HTTP_LINK = "AFRAME_HTTP_LINK"
 AFRAME_ANIMATION = "AFRAME_ANIMATION"
@@ -101,41 +128,816 @@ entities = []
 lights = []
 showstats = ""
 
-# Need to subclass SimpleHTTPRequestHandler so we can serve cache-busting headers
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_my_headers()
-        http.server.SimpleHTTPRequestHandler.end_headers(self)
+LIGHTMAP_FORMATS = [
+    ('PNG', "PNG", "8 bit PNG, lossless"),
+    ('WEBP', "WebP", "Lossy WebP, smaller files (needs Pillow, PNG without it)"),
+    ('RGBM', "RGBM (HDR)", "High dynamic range in an 8 bit PNG, decoded in the shader"),
+]
+PATH_LIGHTMAP_MANIFEST = "lightmaps.json"
+LOG_LEVELS = [
+    ('QUIET', "Quiet", "Only the export summary"),
+    ('NORMAL', "Normal", "One line per export stage"),
+    ('VERBOSE', "Verbose", "One line per exported object"),
+]
+log_level = 1
 
-    def send_my_headers(self):
-        self.send_header("Cache-Control", "no-cache, no-store, must-revalidate")
-        self.send_header("Pragma", "no-cache")
-        self.send_header("Expires", "0")
+def log(message, verbose = False):
+    if log_level >= ( 2 if verbose else 1 ):
+        print(message)
 
+# Preview server (preview.py): threads, keep-alive, precompressed files and byte ranges
+# (production builds: hashed files cached for good, the others revalidated)
 class Server(threading.Thread):
     instance = None
-    folder = ""
-    should_stop = False
-        
-    def set_folder(self, folder):
-        self.folder = folder
-        
+
+    def __init__(self, folder, production_build = False):
+        threading.Thread.__init__(self, daemon=True)
+        cache_control = functools.partial(production.cache_control, production=True) if production_build else None
+        self.httpd = preview.PreviewServer(("", PORT), folder, cache_control)
+
     def run(self):
-        Handler = MyHTTPRequestHandler
-        socketserver.TCPServer.allow_reuse_address = True
-        with socketserver.TCPServer(("", PORT), Handler) as httpd:
-            os.chdir(self.folder)
-            while True:
-                if self.should_stop:
-                    httpd.server_close()
-                    break
-                httpd.handle_request()
+        self.httpd.serve_forever()
 
     def stop(self):
-        self.should_stop = True
-        # Consume the last handle_request call that's still pending
-        with urllib.request.urlopen(f'http://localhost:{PORT}/') as response:
-            html = response.read()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.join()
+
+
+# Export manifest: content hash of every exported object, used to skip unchanged glTF files
+def _hash_array(h, collection, attr, size, typecode):
+    data = array(typecode, [0]) * (len(collection) * size)
+    collection.foreach_get(attr, data)
+    h.update(data.tobytes())
+
+def _hash_value(h, value):
+    try:
+        h.update(array('f', value).tobytes())
+    except TypeError:
+        h.update(repr(value).encode())
+
+def _hash_rna(h, struct):
+    # every RNA property of a modifier, the pointers (boolean operand, curve...) by name
+    for prop in struct.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        value = getattr(struct, prop.identifier, None)
+        if prop.type == 'POINTER':
+            value = getattr(value, "name", None)
+        elif prop.type == 'COLLECTION':
+            value = [ getattr(item, "name", "") for item in value ]
+        h.update(prop.identifier.encode())
+        _hash_value(h, value)
+
+def _evaluated(obj):
+    # the mesh changes without obj.data changing: modifiers, shape keys, drivers
+    mesh = obj.data
+    return len(obj.modifiers) > 0 or mesh.shape_keys is not None or obj.animation_data is not None or mesh.animation_data is not None
+
+def _hash_mesh(h, mesh):
+    _hash_array(h, mesh.vertices, "co", 3, 'f')
+    _hash_array(h, mesh.loops, "vertex_index", 1, 'i')
+    _hash_array(h, mesh.polygons, "loop_total", 1, 'i')
+    _hash_array(h, mesh.polygons, "material_index", 1, 'i')
+    for uv_layer in mesh.uv_layers:
+        _hash_array(h, uv_layer.data, "uv", 2, 'f')
+
+def _hash_material(h, mat):
+    if mat is None:
+        h.update(b"<no material>")
+        return
+    h.update(mat.name.encode())
+    _hash_value(h, mat.diffuse_color)
+    if mat.use_nodes and mat.node_tree:
+        for node in mat.node_tree.nodes:
+            h.update(node.bl_idname.encode())
+            image = getattr(node, "image", None)
+            if image:
+                h.update((image.name + image.filepath).encode())
+            for socket in node.inputs:
+                if hasattr(socket, "default_value"):
+                    _hash_value(h, socket.default_value)
+        for link in mat.node_tree.links:
+            h.update((link.from_node.name+link.from_socket.identifier+link.to_node.name+link.to_socket.identifier).encode())
+
+def object_hash(obj):
+    h = hashlib.sha1()
+    h.update(obj.type.encode())
+    if obj.type == 'MESH':
+        if _evaluated(obj):
+            # the mesh the glTF exporter writes: modifiers, shape keys and drivers applied
+            evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+            _hash_mesh(h, evaluated.to_mesh())
+            evaluated.to_mesh_clear()
+        else:
+            _hash_mesh(h, obj.data)
+        for modifier in obj.modifiers:
+            h.update(modifier.type.encode())
+            _hash_rna(h, modifier)
+        for slot in obj.material_slots:
+            _hash_material(h, slot.material)
+    for K in sorted(obj.keys()):
+        if K.startswith('AFRAME_'):
+            h.update((K+"="+str(obj[K])).encode())
+    return h.hexdigest()
+
+def gltf_export_settings(scene):
+    # every setting that changes the content of the exported glTF files
+    return { "export_format": scene.e_gltf_format }
+
+def compression_enabled(scene):
+    # the quantized glTF files are read by A-Frame 1.1+ only
+    return scene.b_compress and generator.quantization_supported({ "s_aframe_version": scene.s_aframe_version })
+
+def gltf_settings_key(scene):
+    return json.dumps(dict(gltf_export_settings(scene), compress=compression_enabled(scene), lods=lod_ratios(scene), textures=texture_settings(scene)), sort_keys=True)
+
+def lod_ratios(scene):
+    # triangle ratio of every lower LOD level, one per switch distance
+    if not scene.b_lod:
+        return []
+    ratios = generator.parse_numbers(scene.s_lod_ratios)[:len(generator.parse_numbers(scene.s_lod_distances))]
+    return [ r for r in ratios if 0.0 < r < 1.0 ]
+
+def lod_file(asset_file, level):
+    name, ext = os.path.splitext(asset_file)
+    return name + ".lod%d" % level + ext
+
+def new_manifest(settings = ""):
+    return { "version": MANIFEST_VERSION, "settings": settings, "objects": {} }
+
+def load_manifest(dest):
+    try:
+        with open( os.path.join ( dest, PATH_MANIFEST ), "r") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return new_manifest()
+    if manifest.get("version") != MANIFEST_VERSION:
+        return new_manifest()
+    return manifest
+
+def save_manifest(dest, manifest):
+    with open( os.path.join ( dest, PATH_MANIFEST ), "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+
+def _entry_files(entry):
+    return [ PATH_ASSETS + f for f in [ entry["file"] ] + entry.get("lods", []) ] + entry.get("resources", [])
+
+def prune_assets(dest, previous_objects, objects):
+    # delete the files referenced by the previous export only
+    stale = set()
+    for e in previous_objects.values():
+        stale.update(_entry_files(e))
+    for e in objects.values():
+        stale.difference_update(_entry_files(e))
+    for fname in stale:
+        filename = os.path.join ( dest, fname )
+        if os.path.exists(filename):
+            os.remove(filename)
+            log("[MANIFEST] Pruned stale asset "+fname, verbose=True)
+    return len(stale)
+
+
+# glTF output: GLB or .gltf + .bin, every texture stored once in textures/ keyed by content hash
+def gltf_extension(scene):
+    return ".glb" if scene.e_gltf_format == 'GLB' else ".gltf"
+
+def geometry_center(obj):
+    # mean of the vertices, where origin_set(type='ORIGIN_GEOMETRY') would move the origin
+    if obj.type != 'MESH' or len(obj.data.vertices) == 0:
+        return Vector(( 0.0, 0.0, 0.0 ))
+    co = np.empty(len(obj.data.vertices) * 3, dtype=np.float32)
+    obj.data.vertices.foreach_get("co", co)
+    return Vector(co.reshape(-1, 3).mean(axis=0))
+
+def _rename_gltf_nodes(filepath, names):
+    if filepath.endswith(".glb"):
+        gltf, binary = _read_glb(filepath)
+    else:
+        with open(filepath, "r") as file:
+            gltf = json.load(file)
+    for node in gltf.get("nodes", []):
+        if node.get("name") in names:
+            node["name"] = names[node["name"]]
+    if filepath.endswith(".glb"):
+        _write_glb(filepath, gltf, binary)
+    else:
+        with open(filepath, "w") as file:
+            json.dump(gltf, file, separators=(",", ":"))
+
+def _decimate(tmp, ratio, view_layer):
+    # LOD level: a decimate modifier on the copy, applied to a new mesh
+    modifier = tmp.modifiers.new("aframe_lod", 'DECIMATE')
+    modifier.ratio = ratio
+    depsgraph = view_layer.depsgraph
+    depsgraph.update()
+    data = bpy.data.meshes.new_from_object(tmp.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+    tmp.modifiers.remove(modifier)
+    full = tmp.data
+    tmp.data = data
+    bpy.data.meshes.remove(full)
+
+def export_gltf(filepath, settings, objects, ratio = 1.0):
+    # exports copies of the evaluated objects, centered on their geometry and without
+    # their world transform (written on the entities), from a temporary scene: the
+    # user's objects, selection and undo history are never touched. With a ratio
+    # below 1 the copies are decimated (LOD levels).
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    tmp_scene = bpy.data.scenes.new("aframe_export")
+    view_layer = tmp_scene.view_layers[0]
+    names = {}
+    created = []
+    try:
+        for obj in objects:
+            data = None
+            if obj.type == 'MESH':
+                data = bpy.data.meshes.new_from_object(obj.evaluated_get(depsgraph), preserve_all_data_layers=True, depsgraph=depsgraph)
+                data.transform(Matrix.Translation(-geometry_center(obj)))
+                for i, slot in enumerate(obj.material_slots):
+                    if slot.link == 'OBJECT' and i < len(data.materials):
+                        data.materials[i] = slot.material
+            tmp = bpy.data.objects.new("aframe_export_%d" % len(created), data)
+            created.append(tmp)
+            tmp_scene.collection.objects.link(tmp)
+            if data and ratio < 1.0:
+                _decimate(tmp, ratio, view_layer)
+            tmp.select_set(True, view_layer=view_layer)
+            names[tmp.name] = obj.name
+        override = { "scene": tmp_scene, "view_layer": view_layer }
+        if hasattr(bpy.context, "temp_override"):
+            # Blender 3.2+, the positional override dict was removed in 4.0
+            with bpy.context.temp_override(**override):
+                bpy.ops.export_scene.gltf(filepath=filepath, use_selection=True, **settings)
+        else:
+            bpy.ops.export_scene.gltf(override, filepath=filepath, use_selection=True, **settings)
+    finally:
+        for tmp in created:
+            data = tmp.data
+            bpy.data.objects.remove(tmp)
+            if data:
+                bpy.data.meshes.remove(data)
+        bpy.data.scenes.remove(tmp_scene)
+    # the glTF nodes keep the names of the original objects (used by gltf-part)
+    _rename_gltf_nodes(filepath, names)
+
+def _b64_size(size):
+    return 4 * ((size + 2) // 3)
+
+def store_texture(dest, data, ext):
+    fname = hashlib.sha1(data).hexdigest()[:16] + ext
+    filename = os.path.join ( dest, PATH_TEXTURES, fname )
+    if not os.path.exists(filename):
+        with open(filename, "wb") as file:
+            file.write(data)
+    return PATH_TEXTURES + fname
+
+def _read_glb(filename):
+    with open(filename, "rb") as file:
+        data = file.read()
+    magic, version, length = struct.unpack_from("<4sII", data, 0)
+    if magic != b"glTF":
+        raise ValueError(filename+" is not a GLB file")
+    gltf, binary = None, b""
+    offset = 12
+    while offset < length:
+        chunk_length, chunk_type = struct.unpack_from("<II", data, offset)
+        chunk = data[offset+8:offset+8+chunk_length]
+        if chunk_type == 0x4E4F534A:
+            gltf = json.loads(chunk.decode("utf-8"))
+        elif chunk_type == 0x004E4942:
+            binary = chunk
+        offset += 8 + chunk_length
+    return gltf, binary
+
+def _write_glb(filename, gltf, binary):
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    binary = bytes(binary) + b"\0" * (-len(binary) % 4)
+    length = 12 + 8 + len(json_chunk) + (8 + len(binary) if binary else 0)
+    with open(filename, "wb") as file:
+        file.write(struct.pack("<4sII", b"glTF", 2, length))
+        file.write(struct.pack("<II", len(json_chunk), 0x4E4F534A))
+        file.write(json_chunk)
+        if binary:
+            file.write(struct.pack("<II", len(binary), 0x004E4942))
+            file.write(binary)
+
+def _remap_buffer_views(node, mapping):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "bufferView" and isinstance(value, int):
+                node[key] = mapping[value]
+            else:
+                _remap_buffer_views(value, mapping)
+    elif isinstance(node, list):
+        for value in node:
+            _remap_buffer_views(value, mapping)
+
+def _image_extension(image):
+    return { "image/jpeg": ".jpg", "image/png": ".png", "image/ktx2": ".ktx2" }.get(image.get("mimeType"), ".png")
+
+def _externalize_glb(dest, filename):
+    gltf, binary = _read_glb(filename)
+    views = gltf.get("bufferViews", [])
+    textures = []
+    image_bytes = 0
+    removed = set()
+    for image in gltf.get("images", []):
+        if "bufferView" not in image:
+            continue
+        view = views[image["bufferView"]]
+        data = binary[view.get("byteOffset", 0):view.get("byteOffset", 0)+view["byteLength"]]
+        textures.append(store_texture(dest, data, _image_extension(image)))
+        image_bytes += len(data)
+        removed.add(image.pop("bufferView"))
+        image.pop("mimeType", None)
+        image["uri"] = "../" + textures[-1]
+    if removed:
+        # repack the binary chunk without the image data
+        mapping = {}
+        packed = bytearray()
+        kept = []
+        for index, view in enumerate(views):
+            if index in removed:
+                continue
+            packed += b"\0" * (-len(packed) % 4)
+            start = view.get("byteOffset", 0)
+            chunk = binary[start:start+view["byteLength"]]
+            view["byteOffset"] = len(packed)
+            packed += chunk
+            mapping[index] = len(kept)
+            kept.append(view)
+        gltf["bufferViews"] = kept
+        _remap_buffer_views({ k: v for k, v in gltf.items() if k != "bufferViews" }, mapping)
+        binary = bytes(packed)
+        if gltf.get("buffers"):
+            gltf["buffers"][0]["byteLength"] = len(binary)
+        _write_glb(filename, gltf, binary)
+    json_size = len(json.dumps(gltf, separators=(",", ":")))
+    return { "resources": textures, "embedded_bytes": json_size + _b64_size(len(binary)) + _b64_size(image_bytes) }
+
+def _externalize_gltf(dest, filename):
+    with open(filename, "r") as file:
+        gltf = json.load(file)
+    folder = os.path.dirname(filename)
+    resources = []
+    embedded_bytes = 0
+    for image in gltf.get("images", []):
+        uri = image.get("uri")
+        if not uri or uri.startswith("data:") or uri.startswith("../"):
+            continue
+        source = os.path.join ( folder, urllib.parse.unquote(uri) )
+        with open(source, "rb") as file:
+            data = file.read()
+        os.remove(source)
+        resources.append(store_texture(dest, data, os.path.splitext(source)[1].lower()))
+        image["uri"] = "../" + resources[-1]
+        embedded_bytes += _b64_size(len(data))
+    for buffer in gltf.get("buffers", []):
+        uri = buffer.get("uri")
+        if uri and not uri.startswith("data:"):
+            resources.append(PATH_ASSETS + urllib.parse.unquote(uri))
+            embedded_bytes += _b64_size(buffer["byteLength"])
+    with open(filename, "w") as file:
+        json.dump(gltf, file, separators=(",", ":"))
+    embedded_bytes += len(json.dumps(gltf, separators=(",", ":")))
+    return { "resources": resources, "embedded_bytes": embedded_bytes }
+
+def _read_gltf(filename):
+    # ( gltf, binary buffer, .bin file or None ) of a GLB, embedded or separate glTF file
+    if filename.endswith(".glb"):
+        gltf, binary = _read_glb(filename)
+        return gltf, binary, None
+    with open(filename, "r") as file:
+        gltf = json.load(file)
+    uri = gltf["buffers"][0].get("uri", "") if gltf.get("buffers") else ""
+    if not uri:
+        return gltf, b"", None
+    if uri.startswith("data:"):
+        return gltf, base64.b64decode(uri.split(",", 1)[1]), None
+    bin_file = os.path.join ( os.path.dirname(filename), urllib.parse.unquote(uri) )
+    with open(bin_file, "rb") as file:
+        return gltf, file.read(), bin_file
+
+def _write_gltf(filename, gltf, binary, bin_file):
+    if filename.endswith(".glb"):
+        _write_glb(filename, gltf, binary)
+        return
+    if bin_file:
+        with open(bin_file, "wb") as file:
+            file.write(binary)
+    elif gltf.get("buffers"):
+        gltf["buffers"][0]["uri"] = "data:application/octet-stream;base64," + base64.b64encode(binary).decode("ascii")
+    with open(filename, "w") as file:
+        json.dump(gltf, file, separators=(",", ":"))
+
+def compress_asset(filename):
+    # mesh compression stage (compression.py), run on the file written by the glTF exporter
+    start = time.perf_counter()
+    gltf, binary, bin_file = _read_gltf(filename)
+    files = [ filename ] + ( [ bin_file ] if bin_file else [] )
+    before = sum(os.path.getsize(f) for f in files)
+    binary = compression.compress(gltf, binary)
+    _write_gltf(filename, gltf, binary, bin_file)
+    stats = { "bytes_before": before, "bytes": sum(os.path.getsize(f) for f in files), "seconds": time.perf_counter() - start }
+    log("[COMPRESSION] %s: %d KB -> %d KB in %.2f s" % ( os.path.basename(filename), stats["bytes_before"] // 1024, stats["bytes"] // 1024, stats["seconds"] ))
+    return stats
+
+# Texture optimization: textures fitted to the size of their role (textures.py), cached by source hash
+def ktx2_enabled(scene):
+    # the KTX2 textures are decoded by the gltf-model system of A-Frame 1.3+
+    return scene.b_ktx2 and generator.ktx2_supported({ "s_aframe_version": scene.s_aframe_version })
+
+def texture_settings(scene):
+    if not scene.b_optimize_textures:
+        return None
+    return [ scene.i_texture_size, scene.i_normal_size, scene.i_sky_size, ktx2_enabled(scene) ]
+
+def texture_max_size(scene, role):
+    return { "color": scene.i_texture_size, "data": scene.i_texture_size, "normal": scene.i_normal_size, "sky": scene.i_sky_size }[role]
+
+def _resize_image(data, ext, size):
+    # Blender decodes, scales and encodes the image again in its own format
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join ( folder, "source" + ext )
+        target = os.path.join ( folder, "resized" + ext )
+        with open(source, "wb") as file:
+            file.write(data)
+        image = bpy.data.images.load(source, check_existing=False)
+        try:
+            image.scale(size[0], size[1])
+            image.filepath_raw = target
+            image.file_format = 'JPEG' if ext == ".jpg" else 'PNG'
+            image.save()
+        finally:
+            bpy.data.images.remove(image)
+        with open(target, "rb") as file:
+            return file.read()
+
+def _encode_ktx2(tool, data, ext, role):
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join ( folder, "source" + ext )
+        target = os.path.join ( folder, "texture.ktx2" )
+        with open(source, "wb") as file:
+            file.write(data)
+        subprocess.run(textures.toktx_command(tool, source, target, role), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        with open(target, "rb") as file:
+            return file.read()
+
+def _cached(filename, make):
+    if os.path.exists(filename):
+        with open(filename, "rb") as file:
+            return file.read(), True
+    data = make()
+    with open(filename, "wb") as file:
+        file.write(data)
+    return data, False
+
+def process_texture(scene, dest, data, role, ktx2, stats):
+    # returns the fitted image (data itself when it already fits) and its KTX2 copy or None
+    ext = textures.extension(data)
+    size = textures.image_size(data)
+    if not ext or not size:
+        return data, None
+    target = textures.target_size(size, texture_max_size(scene, role))
+    key = textures.cache_key(data, role, target, ext)
+    cache = os.path.join ( dest, PATH_TEXTURE_CACHE )
+    os.makedirs(cache, exist_ok=True)
+    fitted = data
+    stats["textures"] += 1
+    stats["bytes_before"] += len(data)
+    if target != tuple(size):
+        fitted, hit = _cached(os.path.join ( cache, key + ext ), lambda: _resize_image(data, ext, target))
+        stats["resized"] += 1
+        stats["cached"] += hit
+        log("[TEXTURES] %s %dx%d -> %dx%d%s" % ( role, size[0], size[1], target[0], target[1], " (cached)" if hit else "" ), True)
+    stats["bytes"] += len(fitted)
+    encoded = None
+    # without toktx the export keeps the PNG / JPEG textures (reported by export_project)
+    tool = shutil.which(scene.s_toktx_path) if ktx2 else None
+    if tool:
+        encoded, hit = _cached(os.path.join ( cache, key + ".ktx2" ), lambda: _encode_ktx2(tool, fitted, ext, role))
+        stats["ktx2"] += 1
+        stats["ktx2_bytes"] += len(encoded)
+    return fitted, encoded
+
+def new_texture_stats():
+    return { "textures": 0, "resized": 0, "cached": 0, "ktx2": 0, "bytes_before": 0, "bytes": 0, "ktx2_bytes": 0, "seconds": 0.0 }
+
+def optimize_textures(scene, dest, filename):
+    # texture stage, run on the file written by the glTF exporter before the textures are externalized
+    start = time.perf_counter()
+    stats = new_texture_stats()
+    gltf, binary, bin_file = _read_gltf(filename)
+    folder = os.path.dirname(filename)
+    new_views = {}
+    changed = False
+    for index, role in sorted(textures.image_roles(gltf).items()):
+        image = gltf["images"][index]
+        data = textures.read_image(gltf, binary, folder, image)
+        fitted, encoded = process_texture(scene, dest, data, role, ktx2_enabled(scene), stats)
+        like = dict(image)
+        if fitted is not data:
+            textures.write_image(gltf, folder, image, fitted, textures.extension(fitted), like, new_views)
+            changed = True
+        if encoded:
+            copy = {}
+            textures.write_image(gltf, folder, copy, encoded, ".ktx2", like, new_views)
+            gltf["images"].append(copy)
+            textures.add_ktx2(gltf, index, len(gltf["images"]) - 1)
+            changed = True
+    if new_views:
+        binary = compression.repack(gltf, binary, new_views)
+    if changed:
+        _write_gltf(filename, gltf, binary, bin_file)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+def optimize_image_file(scene, dest, filename, role):
+    # static images of the project (sky, environment), fitted in place
+    stats = new_texture_stats()
+    with open(filename, "rb") as file:
+        data = file.read()
+    fitted, encoded = process_texture(scene, dest, data, role, False, stats)
+    if fitted is not data:
+        with open(filename, "wb") as file:
+            file.write(fitted)
+    return stats
+
+def texture_report(outputs):
+    # totals of the textures processed by this export
+    report = new_texture_stats()
+    for stats in ( o["textures"] for o in outputs if "textures" in o ):
+        for key in report:
+            report[key] += stats[key]
+    return report
+
+def process_gltf_output(scene, dest, asset_file):
+    # returns the extra files written for the asset, the size of the equivalent embedded
+    # export and the compression and texture stats
+    filename = os.path.join ( dest, PATH_ASSETS, asset_file )
+    compressed = compress_asset(filename) if compression_enabled(scene) else None
+    optimized = optimize_textures(scene, dest, filename) if scene.b_optimize_textures else None
+    if scene.e_gltf_format == 'GLB':
+        output = _externalize_glb(dest, filename)
+    elif scene.e_gltf_format == 'GLTF_SEPARATE':
+        output = _externalize_gltf(dest, filename)
+    else:
+        output = { "resources": [], "embedded_bytes": os.path.getsize(filename) }
+    if compressed:
+        output["compression"] = compressed
+    if optimized:
+        output["textures"] = optimized
+    return output
+
+def compression_report(outputs):
+    # totals of the assets compressed by this export
+    stats = [ o["compression"] for o in outputs if "compression" in o ]
+    return {
+        "assets": len(stats),
+        "bytes_before": sum(s["bytes_before"] for s in stats),
+        "bytes": sum(s["bytes"] for s in stats),
+        "seconds": sum(s["seconds"] for s in stats),
+    }
+
+def size_report(dest, objects):
+    # bytes on disk (shared files counted once) against the embedded glTF baseline
+    files = set()
+    baseline = {}
+    for e in objects.values():
+        files.update(_entry_files(e))
+        baseline[e["file"]] = e.get("embedded_bytes", 0)
+    total = sum(os.path.getsize(os.path.join ( dest, f )) for f in files if os.path.exists(os.path.join ( dest, f )))
+    return total, sum(baseline.values())
+
+
+# Lightmap saving: pixels read in bulk on the main thread, encoded by lightmaps.py on a thread pool
+def _encode_lightmap(folder, name, pixels, is_float, settings, previous):
+    # runs on a worker thread: skips the image when its pixel hash did not change
+    digest = lightmap_encoding.pixel_hash(pixels, settings)
+    if previous and previous["hash"] == digest and os.path.exists(os.path.join ( folder, previous["file"] )):
+        return name, previous, False
+    if settings[2]:
+        # power-of-two sizes, like the glTF textures
+        pixels = lightmap_encoding.fit(pixels, textures.target_size(( pixels.shape[1], pixels.shape[0] ), settings[2]))
+    ext, data = lightmap_encoding.encode(pixels, is_float, settings[0], settings[1])
+    with open(os.path.join ( folder, name+ext ), "wb") as file:
+        file.write(data)
+    return name, { "file": name+ext, "hash": digest, "bytes": len(data) }, True
+
+def save_lightmaps(scene):
+    start = time.perf_counter()
+    folder = os.path.join ( scene.export_path, scene.s_project_name, PATH_LIGHTMAPS )
+    os.makedirs(folder, exist_ok=True)
+    manifest_file = os.path.join ( folder, PATH_LIGHTMAP_MANIFEST )
+    try:
+        with open(manifest_file, "r") as file:
+            previous = json.load(file)
+    except (OSError, ValueError):
+        previous = {}
+    settings = ( scene.e_lightmap_format, scene.i_png_level, scene.i_lightmap_size if scene.b_optimize_textures else 0 )
+    workers = max(1, os.cpu_count() or 1)
+    entries = {}
+    saved = 0
+    pending = set()
+
+    def collect(done):
+        nonlocal saved
+        for future in done:
+            name, entry, written = future.result()
+            old = previous.get(name)
+            if written and old and old["file"] != entry["file"] and os.path.exists(os.path.join ( folder, old["file"] )):
+                os.remove(os.path.join ( folder, old["file"] ))
+            entries[name] = entry
+            saved += written
+            log("[SAVE LIGHTMAPS] %s %s" % ( "Saved" if written else "Unchanged", entry["file"] ), True)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for img in bpy.data.images:
+            if "_baked" in img.name and img.has_data:
+                # bpy is only used here, the pool gets NumPy buffers
+                width, height = img.size
+                channels = img.channels
+                pixels = np.empty(width * height * channels, dtype=np.float32)
+                img.pixels.foreach_get(pixels)
+                pixels = pixels.reshape(height, width, channels)
+                if channels != 4:
+                    rgba = np.ones(( height, width, 4 ), dtype=np.float32)
+                    rgba[..., :3] = pixels[..., :3] if channels >= 3 else pixels[..., :1]
+                    pixels = rgba
+                pending.add(pool.submit(_encode_lightmap, folder, img.name, pixels, img.is_float, settings, previous.get(img.name)))
+                # bounded number of decoded images in memory
+                if len(pending) >= 2 * workers:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    collect(done)
+        collect(concurrent.futures.as_completed(pending))
+
+    with open(manifest_file, "w") as file:
+        json.dump(entries, file, indent=1, sort_keys=True)
+    log("[SAVE LIGHTMAPS] %d saved, %d unchanged, %d KB, %.2f s (%s, %d threads)" % ( saved, len(entries) - saved, sum(e["bytes"] for e in entries.values()) // 1024, time.perf_counter() - start, settings[0], workers ))
+    return entries
+
+
+# Lightmap atlases: the baked PNG lightmaps packed by atlas.py, reused while their inputs do not change
+def _file_digest(filename):
+    with open(filename, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+def _load_pixels(filename):
+    # ( height, width, 4 ) RGBA array, rows bottom-up like Blender
+    image = bpy.data.images.load(filename, check_existing=False)
+    try:
+        width, height = image.size
+        pixels = np.empty(width * height * 4, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(image)
+    return pixels.reshape(height, width, 4)
+
+def _save_pixels(filename, pixels):
+    height, width = pixels.shape[:2]
+    image = bpy.data.images.new("aframe_atlas", width, height, alpha=True)
+    try:
+        image.pixels.foreach_set(pixels.ravel())
+        image.filepath_raw = filename
+        image.file_format = 'PNG'
+        image.save()
+    finally:
+        bpy.data.images.remove(image)
+
+def pack_lightmaps(dest, lightmaps, max_size):
+    # lightmaps is the generator.lightmap_index() of the lightmaps directory. Returns the
+    # same index with the packed objects pointing at their atlas, and the
+    # { object name: ( offset x, offset y, scale x, scale y ) } of their region
+    folder = os.path.join ( dest, PATH_LIGHTMAPS )
+    sizes = {}
+    for name, fname in lightmaps.items():
+        size = atlas.png_size(os.path.join ( folder, fname ))
+        if size:
+            sizes[name] = size
+    h = hashlib.sha1(json.dumps([ max_size, ATLAS_PADDING ]).encode())
+    for name in sorted(sizes):
+        h.update((name+"="+lightmaps[name]+"="+_file_digest(os.path.join ( folder, lightmaps[name] ))).encode())
+    key = h.hexdigest()
+
+    manifest_file = os.path.join ( folder, PATH_ATLAS_MANIFEST )
+    try:
+        with open(manifest_file, "r") as file:
+            previous = json.load(file)
+    except (OSError, ValueError):
+        previous = {}
+    if previous.get("key") == key and all(os.path.exists(os.path.join ( folder, f )) for f in previous.get("atlases", [])):
+        log("[LIGHTMAP] Unchanged, reusing %d atlases" % len(previous["atlases"]))
+        objects = previous["objects"]
+    else:
+        atlases, too_large = atlas.pack(sizes, max_size, ATLAS_PADDING)
+        files = []
+        objects = {}
+        p = ATLAS_PADDING
+        for index, entry in enumerate(atlases):
+            width, height = entry["size"]
+            fname = "atlas_%s_%d.png" % ( key[:8], index )
+            pixels = np.zeros(( height, width, 4 ), dtype=np.float32)
+            for name, ( x, y, w, h ) in entry["rects"].items():
+                # the padding repeats the border pixels, y counts from the top
+                top = height - y - h
+                pixels[top-p:top+h+p, x-p:x+w+p] = np.pad(_load_pixels(os.path.join ( folder, lightmaps[name] )), ( ( p, p ), ( p, p ), ( 0, 0 ) ), mode="edge")
+                objects[name] = { "file": fname, "uv": atlas.uv_transform(( x, y, w, h ), entry["size"]) }
+            _save_pixels(os.path.join ( folder, fname ), pixels)
+            files.append(fname)
+            log("[LIGHTMAP] Atlas %s: %dx%d, %d lightmaps" % ( fname, width, height, len(entry["rects"]) ))
+        for fname in previous.get("atlases", []):
+            if fname not in files and os.path.exists(os.path.join ( folder, fname )):
+                os.remove(os.path.join ( folder, fname ))
+        if too_large:
+            log("[LIGHTMAP] %d lightmaps larger than the atlas size are kept as they are" % len(too_large))
+        with open(manifest_file, "w") as file:
+            json.dump({ "key": key, "atlases": files, "objects": objects }, file, indent=1, sort_keys=True)
+
+    packed = dict(lightmaps)
+    uvs = {}
+    for name, entry in objects.items():
+        packed[name] = entry["file"]
+        uvs[name] = tuple(entry["uv"])
+    return packed, uvs
+
+
+# Parallel export: shards of objects exported by "blender -b" workers working on a copy of the .blend
+# loads the add-on as a package (generator.py is imported relatively) inside a background Blender process
+LOAD_ADDON_EXPR = headless.LOAD_ADDON_EXPR
+WORKER_EXPR = headless.WORKER_EXPR
+
+def _object_weight(name):
+    obj = bpy.data.objects.get(name)
+    return len(obj.data.vertices) if obj and obj.type == 'MESH' else 1
+
+def make_shards(jobs, workers):
+    # greedy balancing by vertex count, heaviest objects first
+    # jobs are ( object name, asset file, LOD ratio )
+    shards = [ [] for i in range(max(1, min(workers, len(jobs)))) ]
+    loads = [ 0 ] * len(shards)
+    for job in sorted(jobs, key=lambda j: _object_weight(j[0]), reverse=True):
+        index = loads.index(min(loads))
+        shards[index].append(job)
+        loads[index] += _object_weight(job[0])
+    return shards
+
+def export_serial(dest, jobs, settings):
+    for name, asset_file, ratio in jobs:
+        export_gltf(os.path.join ( dest, PATH_ASSETS, asset_file ), settings, [ bpy.data.objects[name] ], ratio)
+
+def parallel_export(dest, jobs, settings, workers):
+    shards = make_shards(jobs, workers)
+    if len(shards) < 2:
+        start = time.perf_counter()
+        export_serial(dest, jobs, settings)
+        return [ { "shard": 0, "objects": len(jobs), "seconds": time.perf_counter() - start } ]
+
+    tmp = tempfile.mkdtemp(prefix="aframe_export_")
+    blend = os.path.join ( tmp, "scene.blend" )
+    bpy.ops.wm.save_as_mainfile(filepath=blend, copy=True)
+    processes = []
+    for index, shard in enumerate(shards):
+        job_file = os.path.join ( tmp, "shard_%d.json" % index )
+        with open(job_file, "w") as file:
+            json.dump({ "shard": index, "dest": dest, "settings": settings, "jobs": shard }, file)
+        expr = WORKER_EXPR % ( os.path.realpath(__file__), job_file )
+        log("[PARALLEL] Starting worker %d with %d objects" % ( index, len(shard) ))
+        processes.append(( index, shard, job_file, subprocess.Popen([ bpy.app.binary_path, "-b", blend, "--python-expr", expr ]) ))
+
+    timings = []
+    for index, shard, job_file, process in processes:
+        process.wait()
+        try:
+            with open(job_file + ".result", "r") as file:
+                result = json.load(file)
+        except (OSError, ValueError):
+            result = None
+        if process.returncode != 0 or result is None:
+            # export what the worker could not in this process
+            log("[PARALLEL] Worker %d failed (exit code %s), exporting its objects here" % ( index, process.returncode ))
+            start = time.perf_counter()
+            export_serial(dest, shard, settings)
+            result = { "shard": index, "objects": len(shard), "seconds": time.perf_counter() - start, "fallback": True }
+        log("[PARALLEL] Worker %d: %d objects in %.2f s" % ( index, result["objects"], result["seconds"] ))
+        timings.append(result)
+    shutil.rmtree(tmp, ignore_errors=True)
+    return timings
+
+def worker_main(job_file):
+    # entry point of the background workers, see WORKER_EXPR
+    with open(job_file, "r") as file:
+        job = json.load(file)
+    start = time.perf_counter()
+    objects = {}
+    for name, asset_file, ratio in job["jobs"]:
+        obj_start = time.perf_counter()
+        export_serial(job["dest"], [ ( name, asset_file, ratio ) ], job["settings"])
+        objects[name] = objects.get(name, 0.0) + time.perf_counter() - obj_start
+    result = { "shard": job["shard"], "objects": len(objects), "seconds": time.perf_counter() - start, "timings": objects }
+    with open(job_file + ".result", "w") as file:
+        json.dump(result, file)
+    return 0
 
 
 # Index html a-frame template
@@ -152,11 +954,8 @@ def default_template():
         <meta charset="utf-8">
         <meta http-equiv="X-UA-Compatible" content="IE=edge">
         <meta name="viewport" content="width=device-width, initial-scale=1">
-        <script src="https://aframe.io/releases/${aframe_version}/aframe.min.js"></script>
-        <script src="https://cdn.jsdelivr.net/gh/donmccurdy/aframe-extras@v6.1.0/dist/aframe-extras.min.js"></script>
-        <script type="text/javascript" src="js/webxr.js"></script>
-        <script type="text/javascript" src="js/joystick.js"></script>
-        <script type="text/javascript" src="js/camera-cube-env.js"></script>
+        ${preload}
+        ${scripts}
         
         <link rel="stylesheet" type="text/css" href="style.css">
     </head>
@@ -195,8 +994,7 @@ def default_template():
             </a-entity>
 
             <!-- Lights -->
-            <a-entity light="intensity: ${directional_intensity}; castShadow: ${cast_shadows}; shadowBias: -0.001; shadowCameraFar: 501.02; shadowCameraBottom: 12; shadowCameraFov: 101.79; shadowCameraNear: 0; shadowCameraTop: -5; shadowCameraRight: 10; shadowCameraLeft: -10; shadowRadius: 2" position="1.36586 7.17965 1"></a-entity>
-            <a-entity light="type: ambient; intensity: ${ambient_intensity}"></a-entity>
+            ${lights}
 
             <!-- Sky -->
             ${sky}
@@ -236,12 +1034,23 @@ class AframeExportPanel_PT_Panel(bpy.types.Panel):
             #col.prop(scene, "b_hands")
             box.prop(scene, "b_cubemap")
             box.prop(scene, "b_camera_cube")
+            if scene.b_camera_cube:
+                box.prop(scene, "b_reflection_probes")
+                if scene.b_reflection_probes:
+                    box.prop(scene, "i_probe_count")
+                    box.prop(scene, "i_probe_resolution")
+                    box.prop(scene, "f_probe_budget")
+                    box.prop(scene, "f_probe_interval")
             box.prop(scene, "b_show_env_sky")                  
             box.prop(scene, "b_cubemap_background")
             box.prop(scene, "s_cubemap_path")
             box.prop(scene, "s_cubemap_ext")      
-            #col.prop(scene, "b_blender_lights")
+            box.prop(scene, "b_blender_lights")
+            if scene.b_blender_lights:
+                box.prop(scene, "i_max_lights")
             box.prop(scene, "b_cast_shadows")
+            if scene.b_cast_shadows:
+                box.prop(scene, "i_shadow_map_size")
             box.separator()
         row = layout.row(align=True) 
         row.prop(scene, 'b_renderer', text= "", icon="TRIA_DOWN" if getattr(scene, 'b_renderer') else "TRIA_RIGHT", icon_only=False, emboss=False)
@@ -316,6 +1125,13 @@ class AframeExportPanel_PT_Panel(bpy.types.Panel):
             box.label(text="Enable github.com/Naxela/The_Lightmapper", icon='NONE')
             box.prop(scene, "b_use_lightmapper")
             box.prop(scene, "f_lightMapIntensity")
+            box.prop(scene, "e_lightmap_format")
+            if scene.e_lightmap_format != 'WEBP':
+                box.prop(scene, "i_png_level")
+            box.prop(scene, "i_lightmap_size")
+            box.prop(scene, "b_lightmap_atlas")
+            if scene.b_lightmap_atlas:
+                box.prop(scene, "i_atlas_size")
             box.operator('aframe.delete_lightmap', text='0 Delete All lightmaps')        
             box.operator('aframe.prepare', text='1 Prepare Selection for Lightmapper')
             box.operator('aframe.bake', text='2 Bake with Lightmapper')
@@ -331,19 +1147,82 @@ class AframeExportPanel_PT_Panel(bpy.types.Panel):
             box = row.box()            
             box.prop(scene, "s_project_name")
             box.prop(scene, "export_path")
+            box.prop(scene, "b_incremental")
+            box.prop(scene, "b_combined_scene")
+            box.prop(scene, "b_spatial_cells")
+            if scene.b_spatial_cells:
+                box.prop(scene, "f_cell_size")
+                box.prop(scene, "f_cell_load_radius")
+                box.prop(scene, "f_cell_hysteresis")
+            box.prop(scene, "b_instancing")
+            box.prop(scene, "b_lod")
+            if scene.b_lod:
+                box.prop(scene, "s_lod_ratios")
+                box.prop(scene, "s_lod_distances")
+            box.prop(scene, "e_gltf_format")
+            box.prop(scene, "b_compress")
+            if scene.b_compress and not compression_enabled(scene):
+                box.label(text="Mesh Compression needs A-Frame 1.1+", icon='ERROR')
+            box.prop(scene, "b_optimize_textures")
+            if scene.b_optimize_textures:
+                box.prop(scene, "i_texture_size")
+                box.prop(scene, "i_normal_size")
+                box.prop(scene, "i_sky_size")
+                box.prop(scene, "b_ktx2")
+                if scene.b_ktx2:
+                    if not ktx2_enabled(scene):
+                        box.label(text="KTX2 needs A-Frame 1.3+", icon='ERROR')
+                    box.prop(scene, "s_toktx_path")
+                    box.prop(scene, "s_basis_transcoder_path")
+            box.prop(scene, "i_precision")
+            box.prop(scene, "b_production")
+            box.prop(scene, "b_precompress")
+            box.prop(scene, "b_bundle_scripts")
+            if scene.b_bundle_scripts:
+                box.prop(scene, "b_vendor_aframe")
+            box.prop(scene, "b_progressive")
+            if scene.b_progressive:
+                box.prop(scene, "i_blocking_assets")
+                box.prop(scene, "i_stream_concurrency")
+            box.prop(scene, "b_scene_description")
+            box.prop(scene, "e_log_level")
+            box.prop(scene, "b_profile")
+            box.prop(scene, "b_budget_report")
+            box.prop(scene, "i_budget_triangles")
+            box.prop(scene, "i_budget_draw_calls")
+            box.prop(scene, "i_budget_texture_mb")
+            box.prop(scene, "i_budget_download_mb")
+            box.prop(scene, "b_parallel")
+            if scene.b_parallel:
+                box.prop(scene, "i_workers")
             box.operator('aframe.clear_asset_dir', text='Clear Assets Directory')
 
         row = layout.row(align=True)       
         row = layout.row(align=True) 
         row.operator('aframe.export', text='Export A-Frame Project')
+        row.operator('aframe.analyze', text='Analyze Budget')
         row = layout.row(align=True) 
         serve_label = "Stop Serving" if Server.instance else "Start Serving"
         row.operator('aframe.serve', text=serve_label)
         row = layout.row(align=True) 
+        row.prop(scene, "b_live_sync")
+        row = layout.row(align=True) 
         if Server.instance:
             row.operator("wm.url_open", text="Open Preview").url = f'http://localhost:{PORT}'
             row = layout.row(align=True) 
         row.label(text=scene.s_output, icon='INFO')
+        if scene.s_budget:
+            # totals of the last analysis against the budgets, "!" marks the exceeded ones
+            box = layout.box()
+            box.label(text="Scene budget", icon='MEMORY')
+            for line in scene.s_budget.split("\n"):
+                box.label(text=line.lstrip("!"), icon='ERROR' if line.startswith("!") else 'NONE')
+        if scene.s_slowest:
+            # slowest objects of the last export, see export_report.json
+            box = layout.box()
+            box.label(text="Slowest objects", icon='TIME')
+            for line in scene.s_slowest.split("\n"):
+                box.label(text=line)
 
 
 class AframeClean_OT_Operator(bpy.types.Operator):
@@ -442,22 +1321,7 @@ class AframeSavelm_OT_Operator(bpy.types.Operator):
     bl_description = "Save Lightmaps"
     
     def execute(self, content):
-        images = bpy.data.images
-        scene = content.scene
-        original_format = scene.render.image_settings.file_format
-        settings = scene.render.image_settings
-        settings.file_format = 'PNG'
-        DEST_RES = os.path.join ( scene.export_path, scene.s_project_name )
-        for img in images:
-            if "_baked" in img.name and img.has_data:
-                ext = ".png"
-                #ext = "."+img.file_format
-                #img.filepath = image_dir_path+img.name+ext         
-                #print( os.path.join ( DEST_RES, PATH_LIGHTMAPS, img.name+ext ) )      
-                img.file_format = 'PNG'
-                img.save_render(os.path.join ( DEST_RES, PATH_LIGHTMAPS, img.name+ext ) )
-                print("[SAVE LIGHTMAPS] Save image "+img.name)
-        settings.file_format = original_format
+        save_lightmaps(content.scene)
         return {'FINISHED'}
     
 class AframeLoadlm_OT_Operator(bpy.types.Operator):
@@ -477,7 +1341,9 @@ class AframeLoadlm_OT_Operator(bpy.types.Operator):
                 bpy.data.images.remove(img)
                 
         for filename in os.listdir(os.path.join ( DEST_RES, PATH_LIGHTMAPS)):
-            bpy.data.images.load(os.path.join ( DEST_RES, PATH_LIGHTMAPS) + filename)
+            # atlases are rebuilt from the _baked files at export
+            if os.path.splitext(filename)[0].endswith("_baked"):
+                bpy.data.images.load(os.path.join ( DEST_RES, PATH_LIGHTMAPS) + filename)
         return {'FINISHED'}    
         
 class AframeServe_OT_Operator(bpy.types.Operator):
@@ -491,288 +1357,815 @@ class AframeServe_OT_Operator(bpy.types.Operator):
             Server.instance = None
             return {'FINISHED'}
         scene = content.scene
-        Server.instance = Server()
-        Server.instance.set_folder(os.path.join ( scene.export_path, scene.s_project_name ))
+        Server.instance = Server(os.path.join ( scene.export_path, scene.s_project_name ), scene.b_production)
         Server.instance.start()
         
         return {'FINISHED'}
 
+# Live sync: the objects changed in Blender are re-exported alone and pushed to the open
+# pages (live-sync component of webxr.js) while the preview server runs
+LIVE_DELAY = 0.2
+live_pending = {}
+live_started = None
+live_exporting = False
+
+def _live_object_names(scene, update):
+    idblock = update.id
+    if isinstance(idblock, bpy.types.Object):
+        return [ idblock.original.name ]
+    if isinstance(idblock, ( bpy.types.Material, bpy.types.Mesh )):
+        original = idblock.original
+        return [ obj.name for obj in scene.objects if obj.data == original or any(slot.material == original for slot in obj.material_slots) ]
+    return []
+
+# persistent: kept when another .blend file is opened while the server runs
+@bpy.app.handlers.persistent
+def live_depsgraph_update(scene, depsgraph):
+    global live_started
+    if not Server.instance or not scene.b_live_sync or live_exporting:
+        return
+    for update in depsgraph.updates:
+        model = update.is_updated_geometry or isinstance(update.id, bpy.types.Material)
+        if not ( model or update.is_updated_transform ):
+            continue
+        for name in _live_object_names(scene, update):
+            if name in scene.objects and live_pending.get(name) != "model":
+                live_pending[name] = "model" if model else "transform"
+    if live_pending and live_started is None:
+        # the changes of one edit (and of a drag) are sent together
+        live_started = time.perf_counter()
+        bpy.app.timers.register(live_flush, first_interval=LIVE_DELAY)
+
+def live_flush():
+    global live_started, live_exporting
+    scene = bpy.context.scene
+    pending = dict(live_pending)
+    live_pending.clear()
+    started = live_started
+    live_started = None
+    if not Server.instance:
+        return None
+    DEST_RES = os.path.join ( scene.export_path, scene.s_project_name )
+    objects = [ scene.objects[name] for name in pending if name in scene.objects and scene.objects[name].type in ( 'MESH', 'EMPTY' ) ]
+    changes = []
+    reload_page = False
+    live_exporting = True
+    try:
+        for obj, ( position, rotation, scale ) in zip(objects, scene_transforms(objects)):
+            change = { "id": obj.name, "position": generator.format_vector(position, scene.i_precision), "rotation": generator.format_vector(rotation, scene.i_precision), "scale": generator.format_vector(scale, scene.i_precision) }
+            if pending[obj.name] == "model" and generator.exports_gltf(obj.type, obj.keys()):
+                # shared or derived files (combined scene, instances, LOD levels, hashed names): incremental export and page reload
+                if scene.b_combined_scene or scene.b_spatial_cells or scene.b_production or scene.b_lod or ( scene.b_instancing and obj.type == 'MESH' and obj.data.users > 1 ):
+                    reload_page = True
+                    continue
+                asset_file = obj.name + gltf_extension(scene)
+                export_gltf(os.path.join ( DEST_RES, PATH_ASSETS, asset_file ), gltf_export_settings(scene), [ obj ])
+                process_gltf_output(scene, DEST_RES, asset_file)
+                change["src"] = "./assets/" + urllib.parse.quote(asset_file) + "?v=%d" % int(time.time() * 1000)
+            changes.append(change)
+        if reload_page:
+            export_project(scene)
+    finally:
+        live_exporting = False
+    pages = Server.instance.httpd.publish({ "type": "reload" } if reload_page else { "type": "update", "entities": changes })
+    log("[LIVE] %d objects sent to %d pages in %d ms%s" % ( len(objects), pages, ( time.perf_counter() - started ) * 1000, " (reload)" if reload_page else "" ))
+    return None
+
+# Scene extraction: the immutable description rendered by generator.py
+def scene_settings(scene):
+    return { p [ 1 ]: getattr(scene, p [ 1 ]) for p in _props }
+
+def _property_value(value):
+    return value if isinstance(value, (str, int, float)) else str(value)
+
+def scene_transforms(objects):
+    # A-Frame position / rotation / scale of the objects: one foreach_get of every
+    # world matrix, converted in a single NumPy batch by transforms.py
+    all_objects = bpy.data.objects
+    index = { obj.as_pointer(): i for i, obj in enumerate(all_objects) }
+    buffer = np.empty(len(all_objects) * 16, dtype=np.float32)
+    all_objects.foreach_get("matrix_world", buffer)
+    matrices = transforms.matrices_from_buffer(buffer)[[ index[obj.as_pointer()] for obj in objects ]]
+    centers = [ geometry_center(obj) for obj in objects ]
+    media = [ not generator.exports_gltf(obj.type, obj.keys()) for obj in objects ]
+    positions, rotations, scales = transforms.world_transforms(matrices, centers, media)
+    return zip(positions.tolist(), rotations.tolist(), scales.tolist())
+
+def instance_groups(objects, lightmaps):
+    # linked duplicates: meshes sharing their mesh data and materials, without modifiers,
+    # AFRAME_* properties or lightmap, are exported once and drawn by gltf-instances.
+    # Returns { obj.as_pointer(): group name } for the groups of two or more objects.
+    groups = {}
+    for obj in objects:
+        if obj.type != 'MESH' or len(obj.modifiers) > 0 or obj.name in lightmaps or any(K.startswith('AFRAME_') for K in obj.keys()):
+            continue
+        key = ( obj.data.as_pointer(), tuple( slot.material.as_pointer() if slot.material else 0 for slot in obj.material_slots ) )
+        groups.setdefault(key, []).append(obj)
+    instances = {}
+    names = set()
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        name = "instanced_" + members[0].data.name
+        if name in names:
+            name += "_%d" % len(names)
+        names.add(name)
+        for obj in members:
+            instances[obj.as_pointer()] = name
+    return instances
+
+def draw_calls(obj):
+    # one draw call per material (glTF primitive) of a mesh
+    if obj.type != 'MESH' or len(obj.data.polygons) == 0:
+        return 0
+    return max(1, len(obj.material_slots))
+
+def world_ambient(scene):
+    # ambient SceneLight of the world background (color x strength), None without world
+    world = scene.world
+    if world is None:
+        return None
+    color, strength = tuple(world.color), 1.0
+    background = world.node_tree.nodes.get("Background") if world.use_nodes and world.node_tree else None
+    if background:
+        color, strength = tuple(background.inputs["Color"].default_value), background.inputs["Strength"].default_value
+    return generator.SceneLight(world.name, "ambient", ( 0.0, 0.0, 0.0 ), ( 0.0, -1.0, 0.0 ), generator.linear_to_hex(color), strength, 0.0, 0.0, 0.0, False, False)
+
+def describe_light(obj, transform):
+    # SceneLight of a Blender light, the intensities converted like the glTF exporter
+    # does (sun: W/m2, point and spot: W / 4 pi sr)
+    light = obj.data
+    kinds = { 'SUN': "directional", 'POINT': "point", 'SPOT': "spot", 'AREA': "spot" }
+    # Blender lights shine along their local -Z axis
+    axis = obj.matrix_world.to_3x3() @ Vector(( 0.0, 0.0, -1.0 ))
+    axis.normalize()
+    return generator.SceneLight(
+        name=obj.name,
+        type=kinds.get(light.type, "point"),
+        position=tuple(transform[0]),
+        direction=( axis.x, axis.z, -axis.y ),
+        color=generator.linear_to_hex(light.color),
+        intensity=light.energy if light.type == 'SUN' else light.energy / ( 4 * math.pi ),
+        distance=light.cutoff_distance if getattr(light, "use_custom_distance", False) else 0.0,
+        angle=math.degrees(light.spot_size) / 2 if light.type == 'SPOT' else 90.0,
+        penumbra=light.spot_blend if light.type == 'SPOT' else 1.0,
+        shadow=light.use_shadow,
+        static=generator.DYNAMIC_LIGHT not in obj.keys())
+
+# Scene budget: the weight of the export on the headsets (budget.py), from the meshes read in bulk
+def scene_budgets(scene):
+    return {
+        "triangles": scene.i_budget_triangles,
+        "draw_calls": scene.i_budget_draw_calls,
+        "texture_bytes": scene.i_budget_texture_mb << 20,
+        "gltf_bytes": scene.i_budget_download_mb << 20,
+    }
+
+def mesh_counts(mesh):
+    # ( triangles, glTF vertices, UV layers ) with two foreach_get reads
+    count = len(mesh.polygons)
+    loop_totals = np.empty(count, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    smooth = np.empty(count, dtype=bool)
+    mesh.polygons.foreach_get("use_smooth", smooth)
+    fraction = float(smooth.mean()) if count else 1.0
+    return budget.triangle_count(loop_totals), budget.gltf_vertices(len(mesh.vertices), len(mesh.loops), fraction), len(mesh.uv_layers)
+
+def material_images(obj):
+    # { image name: ( image, role ) } of the image textures of the object materials
+    images = {}
+    for slot in obj.material_slots:
+        material = slot.material
+        if not material or not material.use_nodes or not material.node_tree:
+            continue
+        for node in material.node_tree.nodes:
+            if node.type != 'TEX_IMAGE' or not node.image:
+                continue
+            if any(link.to_node.type == 'NORMAL_MAP' for link in node.outputs[0].links):
+                role = "normal"
+            else:
+                role = "data" if node.image.colorspace_settings.name == 'Non-Color' else "color"
+            images[node.image.name] = ( node.image, role )
+    return images
+
+def image_file_bytes(image):
+    if image.packed_file:
+        return image.packed_file.size
+    path = bpy.path.abspath(image.filepath)
+    if path and os.path.isfile(path):
+        return os.path.getsize(path)
+    # generated or missing image: about a byte per pixel once compressed
+    return image.size[0] * image.size[1]
+
+def analyze_scene(scene):
+    # budget.analyze() of the objects exported to glTF; the meshes with modifiers are
+    # evaluated, the others read as they are, the shared meshes once
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    lightmap_folder = os.path.join ( scene.export_path, scene.s_project_name, PATH_LIGHTMAPS )
+    lightmaps = generator.lightmap_index(os.listdir(lightmap_folder)) if os.path.isdir(lightmap_folder) else {}
+    entities = [ obj for obj in bpy.data.objects if obj.type == 'MESH' and generator.exports_gltf(obj.type, obj.keys()) ]
+    instances = instance_groups(entities, lightmaps) if scene.b_instancing else {}
+    meshes = {}
+    drawn_groups = set()
+    images = {}
+    objects = []
+    for obj in entities:
+        key = obj.as_pointer() if len(obj.modifiers) else obj.data.as_pointer()
+        shared = key in meshes
+        if not shared:
+            if len(obj.modifiers):
+                evaluated = obj.evaluated_get(depsgraph)
+                meshes[key] = mesh_counts(evaluated.to_mesh())
+                evaluated.to_mesh_clear()
+            else:
+                meshes[key] = mesh_counts(obj.data)
+        triangles, vertices, uv_layers = meshes[key]
+        # an instanced group is drawn by one call per material
+        instance = instances.get(obj.as_pointer())
+        calls = draw_calls(obj) if instance not in drawn_groups else 0
+        if instance:
+            drawn_groups.add(instance)
+        names = []
+        for name, ( image, role ) in material_images(obj).items():
+            if name not in images:
+                size = tuple(image.size)
+                fitted = textures.target_size(size, texture_max_size(scene, role)) if scene.b_optimize_textures else size
+                ratio = fitted[0] * fitted[1] / max(1, size[0] * size[1])
+                images[name] = { "width": fitted[0], "height": fitted[1], "file_bytes": int(image_file_bytes(image) * ratio) }
+            names.append(name)
+        lightmap = lightmaps.get(obj.name)
+        if lightmap:
+            size = atlas.png_size(os.path.join ( lightmap_folder, lightmap ))
+            if size:
+                images.setdefault(lightmap, { "width": size[0], "height": size[1], "file_bytes": os.path.getsize(os.path.join ( lightmap_folder, lightmap )) })
+                names.append(lightmap)
+        objects.append({
+            "name": obj.name,
+            "triangles": triangles,
+            "draw_calls": calls,
+            "geometry_bytes": 0 if shared else budget.geometry_bytes(vertices, triangles, uv_layers, compression_enabled(scene)),
+            "images": names,
+        })
+    embedded = scene.e_gltf_format == 'GLTF_EMBEDDED'
+    grouped = scene.b_combined_scene or scene.b_spatial_cells
+    return budget.analyze(objects, images, scene_budgets(scene), embedded, scene.b_optimize_textures and ktx2_enabled(scene), embedded and not grouped)
+
+def merge_outputs(outputs):
+    # process_gltf_output() results of an object and its LOD levels
+    return {
+        "resources": [ r for o in outputs for r in o.get("resources", []) ],
+        "embedded_bytes": sum(o.get("embedded_bytes", 0) for o in outputs),
+    }
+
+def describe_object(obj, transform, lightmaps, asset, combined, instanced = False, lods = (), lightmap_uvs = {}):
+    # transform is the ( position, rotation, scale ) of scene_transforms()
+    # lightmaps is the generator.lightmap_index() of the lightmaps directory,
+    # lightmap_uvs the atlas regions of pack_lightmaps()
+    properties = tuple( ( K, _property_value(obj[K]) ) for K in obj.keys() if K not in '_RNA_UI' )
+    lightmap = lightmaps.get(obj.name)
+    if lightmap:
+        log("[LIGHTMAP] Found lightmap: "+lightmap, verbose=True)
+    # bounding sphere around the origin, for the progressive loading order
+    radius = 0.0
+    if obj.type == 'MESH':
+        basis = obj.matrix_world.to_3x3()
+        radius = max( ( basis @ Vector(corner) ).length for corner in obj.bound_box )
+    return generator.SceneObject(
+        name=obj.name,
+        type=obj.type,
+        position=tuple(transform[0]),
+        rotation=tuple(transform[1]),
+        scale=tuple(transform[2]),
+        properties=properties,
+        lightmap=lightmap,
+        asset=asset,
+        combined=combined and asset is not None,
+        instanced=instanced and asset is not None,
+        lods=tuple(lods),
+        lightmap_uv=lightmap_uvs.get(obj.name) if lightmap else None,
+        radius=radius)
+
+# Runtime scripts: one minified bundle of the components used by index.html, or the script files
+LEGACY_SCRIPTS = ( "webxr.js", "joystick.js", "camera-cube-env.js" )
+
+def vendor_basis(scene, dest):
+    # copies the Basis Universal transcoder to js/basis/, returns the basisTranscoderPath
+    # of the page: the copy, or the URL of the setting when it cannot be downloaded
+    url = scene.s_basis_transcoder_path
+    if not url.endswith("/"):
+        url += "/"
+    cache = os.path.join ( dest, PATH_VENDOR_CACHE, "basis-" + hashlib.sha1(url.encode()).hexdigest()[:12] )
+    folder = os.path.join ( dest, generator.BASIS_PATH )
+    try:
+        sources = [ bundle.vendor_file(cache, name, url + name) for name in generator.BASIS_FILES ]
+    except OSError as e:
+        log("[TEXTURES] Basis transcoder not copied, it is loaded from "+url+" ("+str(e)+")")
+        return url
+    os.makedirs(folder, exist_ok=True)
+    for source in sources:
+        shutil.copyfile ( source, os.path.join ( folder, os.path.basename(source) ) )
+    return generator.BASIS_PATH
+
+def write_scripts(scene, dest, resources, description):
+    folder = os.path.join ( dest, PATH_JAVASCRIPT )
+    index_file = os.path.join ( dest, PATH_INDEX )
+    report = { "bundle": None, "components": 0, "bytes": 0 }
+    if "${scripts}" not in description.template:
+        # template saved by a previous version, it loads its scripts itself
+        copied = LEGACY_SCRIPTS
+        bundle.remove_stale(folder)
+    elif scene.b_bundle_scripts:
+        with open(index_file, "r", encoding="utf-8") as file:
+            page = file.read()
+        sources = {}
+        for name in bundle.SCRIPTS:
+            with open(os.path.join ( resources, name ), "r", encoding="utf-8") as file:
+                sources[name] = file.read()
+        vendored = ()
+        tags = ""
+        if scene.b_vendor_aframe:
+            cache = os.path.join ( dest, PATH_VENDOR_CACHE )
+            version = description.settings["s_aframe_version"]
+            try:
+                vendored = ( bundle.vendor_file(cache, "aframe-"+version+".min.js", generator.AFRAME_URL.format(version=version)),
+                             bundle.vendor_file(cache, generator.EXTRAS_FILE, generator.EXTRAS_URL) )
+            except OSError as e:
+                log("[BUNDLE] A-Frame not vendored, it is loaded from the CDN ("+str(e)+")")
+                tags = generator.cdn_scripts(description.settings) + "\n        "
+        text, used = bundle.build(page, sources, vendored)
+        name = bundle.write(folder, text)
+        with open(index_file, "w", encoding="utf-8") as file:
+            file.write(page.replace(generator.BUNDLE_MARKER, tags + generator.script_tag(PATH_JAVASCRIPT + name)))
+        with open(os.path.join ( resources, "style.css" ), "r", encoding="utf-8") as file:
+            style = bundle.minify_css(file.read())
+        with open(os.path.join ( dest, "style.css" ), "w", encoding="utf-8") as file:
+            file.write(style)
+        report = { "bundle": name, "components": len(used), "bytes": len(text.encode("utf-8")) }
+        log("[BUNDLE] "+PATH_JAVASCRIPT+name+": %d KB, %d components (%s)%s" % ( report["bytes"] // 1024, len(used), ", ".join(sorted(used)), ", A-Frame vendored" if vendored else "" ))
+        copied = ()
+    else:
+        copied = generator.page_scripts(description.settings)
+        bundle.remove_stale(folder)
+    # the runtime scripts not loaded by the page are removed
+    for name in bundle.SCRIPTS:
+        if name in copied:
+            shutil.copyfile ( os.path.join ( resources, name ), os.path.join ( folder, name ) )
+        elif os.path.exists(os.path.join ( folder, name )):
+            os.remove(os.path.join ( folder, name ))
+    return report
+
+# Export pipeline shared by the export button and the command line entry point
+def export_project(scene):
+    global log_level
+    log_level = [ l [ 0 ] for l in LOG_LEVELS ].index(scene.e_log_level)
+    log("[AFRAME EXPORTER] Exporting project...")
+    # wall time of the stages and objects, export_report.json
+    profile = profiler.Profiler(scene.b_profile)
+    profile.stage("resources")
+    script_file = os.path.realpath(__file__)
+    #print("script_file dir = "+script_file)
+    directory = os.path.dirname(script_file)
+
+    # Destination base path
+    DEST_RES = os.path.join ( scene.export_path, scene.s_project_name )
+
+
+    if __name__ == "__main__":
+        #print("inside blend file")
+        #print(os.path.dirname(directory))
+        directory = os.path.dirname(directory)
+
+    log("[AFRAME EXPORTER] Target Dir = "+directory)
+
+    ALL_PATHS = [ ".", PATH_ASSETS, PATH_RESOURCES, PATH_MEDIA, PATH_ENVIRONMENT, PATH_JAVASCRIPT, PATH_LIGHTMAPS, PATH_TEXTURES ]
+    for p in ALL_PATHS:
+        dp = os.path.join ( DEST_RES, p )
+        log ( "--- DEST [%s] [%s] {%s}" % ( DEST_RES, dp, p ), verbose=True )
+        os.makedirs ( dp, exist_ok=True )
+
+    #check if addon or script for correct path
+    _resources = [
+        [ ".", "favicon.ico", True ],
+        [ ".", "style.css" , True],
+        [ PATH_RESOURCES, "sky.jpg", False ],
+        [ PATH_RESOURCES, "play.png", False ],
+        [ PATH_RESOURCES, "pause.png", False],
+        [ PATH_RESOURCES, "play-skip-back.png", False],
+        [ PATH_RESOURCES, "mute.png",False ],
+        [ PATH_RESOURCES, "volume-low.png",False ],
+        [ PATH_RESOURCES, "volume-high.png",False ],
+        [ PATH_MEDIA, "image1.png",False ],
+        [ PATH_MEDIA, "image2.png",False ],                        
+        [ PATH_ENVIRONMENT, "negx.jpg", True ],
+        [ PATH_ENVIRONMENT, "negy.jpg", True ],
+        [ PATH_ENVIRONMENT, "negz.jpg", True ],
+        [ PATH_ENVIRONMENT, "posx.jpg", True ],
+        [ PATH_ENVIRONMENT, "posy.jpg", True ],
+        [ PATH_ENVIRONMENT, "posz.jpg", True ],
+    ]
+
+    SRC_RES = os.path.join ( directory, PATH_RESOURCES )
+    for dest_path, fname, overwrite in _resources:
+        if overwrite:
+            shutil.copyfile ( os.path.join ( SRC_RES, fname ), os.path.join ( DEST_RES, dest_path, fname ) )
+        else:
+            if not os.path.exists(os.path.join ( DEST_RES, dest_path, fname )):
+                shutil.copyfile ( os.path.join ( SRC_RES, fname ), os.path.join ( DEST_RES, dest_path, fname ) )                    
+
+    if scene.b_compress and not compression_enabled(scene):
+        log("[COMPRESSION] KHR_mesh_quantization needs A-Frame 1.1+ (A-Frame version "+scene.s_aframe_version+"), the meshes are exported without compression")
+
+    profile.stage("sky textures")
+    image_outputs = []
+    basis_path = scene.s_basis_transcoder_path
+    if scene.b_optimize_textures:
+        if scene.b_ktx2 and not ktx2_enabled(scene):
+            log("[TEXTURES] KTX2 textures need A-Frame 1.3+ (A-Frame version "+scene.s_aframe_version+"), the textures are exported without KTX2 copies")
+        elif scene.b_ktx2 and not shutil.which(scene.s_toktx_path):
+            log("[TEXTURES] toktx not found ("+scene.s_toktx_path+"), the textures are exported without KTX2 copies")
+        if ktx2_enabled(scene):
+            basis_path = vendor_basis(scene, DEST_RES)
+        for dest_path, fname, overwrite in _resources:
+            if dest_path == PATH_ENVIRONMENT or fname == "sky.jpg":
+                image_outputs.append({ "textures": optimize_image_file(scene, DEST_RES, os.path.join ( DEST_RES, dest_path, fname ), "sky") })
+    if basis_path != generator.BASIS_PATH and os.path.isdir(os.path.join ( DEST_RES, generator.BASIS_PATH )):
+        # transcoder of a previous export
+        shutil.rmtree(os.path.join ( DEST_RES, generator.BASIS_PATH ))
+
+    # Loop 3D entities
+    profile.stage("lightmaps")
+    exclusion_obj_types = ['CAMERA','LAMP','ARMATURE']
+    exported_obj = 0
+    records = []
+    lightmaps = generator.lightmap_index(os.listdir(os.path.join ( DEST_RES, PATH_LIGHTMAPS)))
+    log("[LIGHTMAP] Found %d lightmap files" % len(lightmaps))
+    lightmap_uvs = {}
+    if scene.b_lightmap_atlas and lightmaps:
+        lightmaps, lightmap_uvs = pack_lightmaps(DEST_RES, lightmaps, scene.i_atlas_size)
+
+    # incremental export: reuse the glTF files of objects whose content hash did not change
+    profile.stage("objects")
+    settings_key = gltf_settings_key(scene)
+    manifest = load_manifest(DEST_RES)
+    previous_objects = manifest["objects"] if scene.b_incremental and manifest.get("settings") == settings_key else {}
+    manifest_objects = {}
+    # combined scene / spatial cells: objects and changed flag of every shared file
+    grouped = scene.b_combined_scene or scene.b_spatial_cells
+    combined_objects = {}
+    combined_changed = set()
+    pending_exports = []
+    reexported_obj = 0
+    skipped_obj = 0
+    entities = [ obj for obj in bpy.data.objects if obj.type == 'MESH' or obj.type == 'EMPTY' ]
+    entity_transforms = dict(zip(( obj.as_pointer() for obj in entities ), scene_transforms(entities)))
+    instances = instance_groups(entities, lightmaps) if scene.b_instancing else {}
+    instance_outputs = {}
+    processed = []
+    ratios = lod_ratios(scene)
+    draw_calls_before = 0
+    draw_calls_after = 0
+
+    for obj in bpy.data.objects:
+        obj_start = time.perf_counter()
+        if obj.type not in exclusion_obj_types:
+            log("[AFRAME EXPORTER] loop object "+ obj.name, verbose=True)
+            if obj.type == 'MESH' or obj.type == 'EMPTY':
+                instance = instances.get(obj.as_pointer())
+                if instance:
+                    asset_file = instance + gltf_extension(scene)
+                elif scene.b_spatial_cells:
+                    asset_file = generator.cell_name(entity_transforms[obj.as_pointer()][0], scene.f_cell_size) + gltf_extension(scene)
+                else:
+                    asset_file = ( COMBINED_SCENE_NAME if scene.b_combined_scene else obj.name ) + gltf_extension(scene)
+                gltf = generator.exports_gltf(obj.type, obj.keys())
+                lods = []
+                if gltf and ratios and obj.type == 'MESH' and not instance and not grouped and len(obj.data.polygons) >= LOD_MIN_POLYGONS:
+                    lods = [ ( lod_file(asset_file, i + 1), ratio ) for i, ratio in enumerate(ratios) ]
+                previous = previous_objects.get(obj.name)
+                obj_hash = object_hash(obj)
+                files = [ asset_file ] + [ f for f, ratio in lods ]
+                reuse = previous is not None and previous["hash"] == obj_hash and previous["file"] == asset_file and previous.get("lods", []) == files[1:] and all(os.path.exists(os.path.join ( DEST_RES, PATH_ASSETS, f )) for f in files)
+
+                # the entity sits on the geometry center, the glTF is exported around it
+                records.append(describe_object(obj, entity_transforms[obj.as_pointer()], lightmaps, asset_file if gltf else None, grouped and not instance, bool(instance), files[1:], lightmap_uvs))
+
+                # export gltf
+                if gltf:
+                    draw_calls_before += draw_calls(obj)
+                    if instance not in instance_outputs:
+                        draw_calls_after += draw_calls(obj)
+                    if grouped and not instance:
+                        # exported after the loop
+                        combined_objects.setdefault(asset_file, []).append(obj)
+                        if not reuse:
+                            combined_changed.add(asset_file)
+                    elif instance in instance_outputs:
+                        # the shared file of the instance group is already handled
+                        output, reused = instance_outputs[instance]
+                        if reused:
+                            skipped_obj += 1
+                        else:
+                            reexported_obj += 1
+                    else:
+                        if reuse:
+                            log("[MANIFEST] Unchanged, reusing "+asset_file, verbose=True)
+                            output = previous
+                            skipped_obj += 1
+                        else:
+                            filename = os.path.join ( DEST_RES, PATH_ASSETS, asset_file )
+                            if scene.b_parallel:
+                                # exported by the worker processes after the loop
+                                pending_exports.append(( obj.name, asset_file, 1.0 ))
+                                pending_exports += [ ( obj.name, f, ratio ) for f, ratio in lods ]
+                                output = {}
+                            else:
+                                export_gltf(filename, gltf_export_settings(scene), [ obj ])
+                                outputs = [ process_gltf_output(scene, DEST_RES, asset_file) ]
+                                for f, ratio in lods:
+                                    export_gltf(os.path.join ( DEST_RES, PATH_ASSETS, f ), gltf_export_settings(scene), [ obj ], ratio)
+                                    outputs.append(process_gltf_output(scene, DEST_RES, f))
+                                processed += outputs
+                                output = merge_outputs(outputs)
+                            reexported_obj += 1
+                        if instance:
+                            instance_outputs[instance] = ( output, reuse )
+                    manifest_objects[obj.name] = { "hash": obj_hash, "file": asset_file }
+                    if lods:
+                        manifest_objects[obj.name]["lods"] = files[1:]
+                    if instance or not grouped:
+                        manifest_objects[obj.name].update(resources=output.get("resources", []), embedded_bytes=output.get("embedded_bytes", 0))
+            exported_obj+=1
+            profile.object(obj.name, time.perf_counter() - obj_start)
+
+    # reflection cubemaps of Blender: the places of the shared reflection probes
+    probe_objects = [ obj for obj in bpy.data.objects if obj.type == 'LIGHT_PROBE' and obj.data.type == 'CUBEMAP' ]
+    for obj, transform in zip(probe_objects, scene_transforms(probe_objects)):
+        records.append(describe_object(obj, transform, {}, None, False))
+
+    # lights: folded into the bakes or rendered by light_entities()
+    light_objects = [ obj for obj in bpy.data.objects if obj.type == 'LIGHT' ]
+    lights = [ describe_light(obj, transform) for obj, transform in zip(light_objects, scene_transforms(light_objects)) ]
+    ambient = world_ambient(scene)
+    if ambient:
+        lights.insert(0, ambient)
+
+    # combined scene / spatial cells: a single glTF export for the objects of every shared
+    # file, re-exported if any of them changed
+    profile.stage("shared files")
+    for combined_name, group in combined_objects.items():
+        combined_file = os.path.join ( DEST_RES, PATH_ASSETS, combined_name )
+        previous_names = { name for name, e in previous_objects.items() if e["file"] == combined_name }
+        if combined_name in combined_changed or previous_names != { o.name for o in group } or not os.path.exists(combined_file):
+            file_start = time.perf_counter()
+            export_gltf(combined_file, gltf_export_settings(scene), group)
+            output = process_gltf_output(scene, DEST_RES, combined_name)
+            processed.append(output)
+            reexported_obj += len(group)
+            profile.file(combined_name, time.perf_counter() - file_start, len(group))
+        else:
+            log("[MANIFEST] Unchanged, reusing "+combined_name)
+            output = previous_objects[group[0].name]
+            skipped_obj += len(group)
+        for obj in group:
+            manifest_objects[obj.name].update(resources=output.get("resources", []), embedded_bytes=output.get("embedded_bytes", 0))
+
+    profile.stage("parallel export")
+    shard_timings = []
+    if pending_exports:
+        shard_timings = parallel_export(DEST_RES, pending_exports, gltf_export_settings(scene), scene.i_workers)
+        for timing in shard_timings:
+            for name, seconds in timing.get("timings", {}).items():
+                profile.object(name, seconds)
+        # instanced objects share the file exported for their group, LOD levels
+        # are added to their object (processed after its main file)
+        by_file = {}
+        for entry in manifest_objects.values():
+            for f in [ entry["file"] ] + entry.get("lods", []):
+                by_file.setdefault(f, []).append(entry)
+        for name, asset_file, ratio in pending_exports:
+            output = process_gltf_output(scene, DEST_RES, asset_file)
+            processed.append(output)
+            for entry in by_file[asset_file]:
+                if entry["file"] == asset_file:
+                    entry.update(resources=output.get("resources", []), embedded_bytes=output.get("embedded_bytes", 0))
+                else:
+                    entry.update(merge_outputs([ entry, output ]))
+
+    profile.stage("manifest")
+    pruned_obj = prune_assets(DEST_RES, manifest["objects"], manifest_objects)
+    manifest["settings"] = settings_key
+    manifest["objects"] = manifest_objects
+    save_manifest(DEST_RES, manifest)
+
+    total_bytes, embedded_bytes = size_report(DEST_RES, manifest_objects)
+    log("[AFRAME EXPORTER] Assets size: %d KB (embedded glTF: %d KB)" % ( total_bytes // 1024, embedded_bytes // 1024 ))
+
+    # Templating ------------------------------
+    profile.stage("templating")
+    default_template()
+    description = generator.SceneDescription(
+        settings=dict(scene_settings(scene), s_basis_transcoder_path=basis_path),
+        objects=tuple(records),
+        template=bpy.data.texts['index.html'].as_string(),
+        lights=tuple(lights))
+    if scene.b_scene_description:
+        generator.save_description(description, os.path.join ( DEST_RES, PATH_DESCRIPTION ))
+
+    # Saving the main INDEX FILE, entities are streamed to the file
+    with open( os.path.join ( DEST_RES, PATH_INDEX ), "w") as file:
+        assets = generator.write_index(description, file)
+    log("[AFRAME EXPORTER] %d meshes, %d assets written to %s" % ( exported_obj, len(assets), PATH_INDEX ))
+    profile.stage("stream and cell manifests")
+    streamed = 0
+    if scene.b_progressive:
+        manifest = generator.stream_manifest(description)
+        streamed = len(manifest["entities"])
+        with open(os.path.join ( DEST_RES, generator.STREAM_MANIFEST ), "w", encoding="utf-8") as file:
+            json.dump(manifest, file, separators=(",", ":"), ensure_ascii=False)
+        log("[PROGRESSIVE] %d models streamed after the scene start, listed in %s" % ( streamed, generator.STREAM_MANIFEST ))
+    elif os.path.exists(os.path.join ( DEST_RES, generator.STREAM_MANIFEST )):
+        os.remove(os.path.join ( DEST_RES, generator.STREAM_MANIFEST ))
+    cells = 0
+    if scene.b_spatial_cells:
+        index = generator.cell_index(description)
+        cells = len(index["cells"])
+        with open(os.path.join ( DEST_RES, generator.CELL_INDEX ), "w", encoding="utf-8") as file:
+            json.dump(index, file, separators=(",", ":"), ensure_ascii=False)
+        log("[CELLS] %d cells of %s m, listed in %s" % ( cells, generator.format_number(scene.f_cell_size, 2), generator.CELL_INDEX ))
+    elif os.path.exists(os.path.join ( DEST_RES, generator.CELL_INDEX )):
+        os.remove(os.path.join ( DEST_RES, generator.CELL_INDEX ))
+
+    profile.stage("scripts")
+    scripts = write_scripts(scene, DEST_RES, SRC_RES, description)
+
+    # production build: content hashed file names, index.html rewritten to use them
+    profile.stage("production")
+    hashed = {}
+    if scene.b_production:
+        hashed = production.publish(DEST_RES, PATH_INDEX, ( generator.STREAM_MANIFEST, generator.CELL_INDEX ))
+        log("[PRODUCTION] %d files with content hashed names, listed in %s" % ( len(hashed), production.ASSET_MANIFEST ))
+    else:
+        production.clean(DEST_RES)
+    budget_analysis = None
+    if scene.b_budget_report:
+        profile.stage("budget")
+        budget_analysis = analyze_scene(scene)
+        scene.s_budget = "\n".join(budget.format_lines(budget_analysis))
+        if budget_analysis["over"]:
+            log("[BUDGET] Over budget: " + ", ".join( budget.LABELS[m] for m in budget_analysis["over"] ))
+
+    profile.stage("precompress")
+    compressed_files = 0
+    if scene.b_precompress:
+        compressed_files, checked = preview.precompress(DEST_RES)
+        log("[PRECOMPRESS] %d .gz / .br files written for %d files%s" % ( compressed_files, checked, "" if preview.brotli else " (brotli module not installed: .gz only)" ))
+
+    summary = {
+        "status": "ok",
+        "path": DEST_RES,
+        "objects": exported_obj,
+        "reexported": reexported_obj,
+        "unchanged": skipped_obj,
+        "pruned": pruned_obj,
+        "bytes": total_bytes,
+        "embedded_bytes": embedded_bytes,
+        "workers": shard_timings,
+        "instanced": len(instances),
+        "draw_calls_before": draw_calls_before,
+        "draw_calls": draw_calls_after,
+        "compression": compression_report(processed),
+        "textures": texture_report(processed + image_outputs),
+        "hashed": len(hashed),
+        "precompressed": compressed_files,
+        "streamed": streamed,
+        "cells": cells,
+        "bundle_bytes": scripts["bytes"],
+    }
+    profile.finish()
+    summary["stages"] = { s["name"]: s["seconds"] for s in profile.stages }
+    summary["slowest"] = profile.slowest()
+    if budget_analysis:
+        summary["over_budget"] = budget_analysis["over"]
+    profile.write(DEST_RES, ( PATH_ASSETS, PATH_TEXTURES, PATH_LIGHTMAPS ), summary, { "budget": budget_analysis } if budget_analysis else None)
+    log("[PROFILE] %.2f s, slowest stage %s, report in %s%s" % ( profile.seconds, max(profile.stages, key=lambda s: s["seconds"])["name"], profiler.REPORT_FILE, ", cProfile capture in "+profiler.PROFILE_FILE if scene.b_profile else "" ))
+    return summary
+
+def format_summary(summary):
+    output = str(summary["objects"])+" meshes exported ("+str(summary["reexported"])+" re-exported, "+str(summary["unchanged"])+" unchanged, "+str(summary["pruned"])+" pruned), "+str(summary["bytes"] // 1024)+" KB vs "+str(summary["embedded_bytes"] // 1024)+" KB embedded"
+    if summary["instanced"]:
+        output += ", "+str(summary["instanced"])+" instanced, draw calls "+str(summary["draw_calls_before"])+" -> "+str(summary["draw_calls"])
+    if summary["compression"]["assets"]:
+        output += ", compression "+str(summary["compression"]["bytes_before"] // 1024)+" KB -> "+str(summary["compression"]["bytes"] // 1024)+" KB ("+"%.1f" % summary["compression"]["seconds"]+" s)"
+    if summary["textures"]["resized"] or summary["textures"]["ktx2"]:
+        output += ", textures "+str(summary["textures"]["bytes_before"] // 1024)+" KB -> "+str(summary["textures"]["bytes"] // 1024)+" KB ("+str(summary["textures"]["resized"])+" resized, "+str(summary["textures"]["ktx2"])+" KTX2)"
+    if summary["cells"]:
+        output += ", "+str(summary["cells"])+" cells"
+    if summary["streamed"]:
+        output += ", "+str(summary["streamed"])+" streamed"
+    if summary["bundle_bytes"]:
+        output += ", scripts bundle "+str(summary["bundle_bytes"] // 1024)+" KB"
+    if summary["hashed"]:
+        output += ", "+str(summary["hashed"])+" hashed files"
+    if summary.get("over_budget"):
+        output += ", over budget: "+", ".join( budget.LABELS[m].lower() for m in summary["over_budget"] )
+    if summary["workers"]:
+        output += ", "+str(len(summary["workers"]))+" workers (slowest "+"%.1f" % max(t["seconds"] for t in summary["workers"])+" s)"
+    return output
+
+
 class AframeExport_OT_Operator(bpy.types.Operator):
     bl_idname = "aframe.export"
     bl_label = "Export to Aframe Project"
     bl_description = "Export AFrame"
 
     def execute(self, content):
-        assets = []
-        entities = []
-        lights = []
-        print("[AFRAME EXPORTER] Exporting project...")
         scene = content.scene
         scene.s_output = "exporting..."
-        script_file = os.path.realpath(__file__)
-        #print("script_file dir = "+script_file)
-        directory = os.path.dirname(script_file)
-
-        # Destination base path
-        DEST_RES = os.path.join ( scene.export_path, scene.s_project_name )
-
-
-        if __name__ == "__main__":
-            #print("inside blend file")
-            #print(os.path.dirname(directory))
-            directory = os.path.dirname(directory)
-
-        print("[AFRAME EXPORTER] Target Dir = "+directory)
-
-        ALL_PATHS = [ ".", PATH_ASSETS, PATH_RESOURCES, PATH_MEDIA, PATH_ENVIRONMENT, PATH_JAVASCRIPT, PATH_LIGHTMAPS ]
-        for p in ALL_PATHS:
-            dp = os.path.join ( DEST_RES, p )
-            print ( "--- DEST [%s] [%s] {%s}" % ( DEST_RES, dp, p ) )
-            os.makedirs ( dp, exist_ok=True )
-
-        #check if addon or script for correct path
-        _resources = [
-            [ ".", "favicon.ico", True ],
-            [ ".", "style.css" , True],
-            [ PATH_RESOURCES, "sky.jpg", False ],
-            [ PATH_RESOURCES, "play.png", False ],
-            [ PATH_RESOURCES, "pause.png", False],
-            [ PATH_RESOURCES, "play-skip-back.png", False],
-            [ PATH_RESOURCES, "mute.png",False ],
-            [ PATH_RESOURCES, "volume-low.png",False ],
-            [ PATH_RESOURCES, "volume-high.png",False ],
-            [ PATH_MEDIA, "image1.png",False ],
-            [ PATH_MEDIA, "image2.png",False ],                        
-            [ PATH_JAVASCRIPT, "webxr.js", True ],
-            [ PATH_JAVASCRIPT, "joystick.js", True ],
-            [ PATH_JAVASCRIPT, "camera-cube-env.js", True ],
-            [ PATH_ENVIRONMENT, "negx.jpg", True ],
-            [ PATH_ENVIRONMENT, "negy.jpg", True ],
-            [ PATH_ENVIRONMENT, "negz.jpg", True ],
-            [ PATH_ENVIRONMENT, "posx.jpg", True ],
-            [ PATH_ENVIRONMENT, "posy.jpg", True ],
-            [ PATH_ENVIRONMENT, "posz.jpg", True ],
-        ]
-
-        SRC_RES = os.path.join ( directory, PATH_RESOURCES )
-        for dest_path, fname, overwrite in _resources:
-            if overwrite:
-                shutil.copyfile ( os.path.join ( SRC_RES, fname ), os.path.join ( DEST_RES, dest_path, fname ) )
-            else:
-                if not os.path.exists(os.path.join ( DEST_RES, dest_path, fname )):
-                    shutil.copyfile ( os.path.join ( SRC_RES, fname ), os.path.join ( DEST_RES, dest_path, fname ) )                    
-
-        # Loop 3D entities
-        exclusion_obj_types = ['CAMERA','LAMP','ARMATURE']
-        exported_obj = 0
-        videocount=0
-        imagecount=0
-        scalefactor = 2
-        lightmap_files = os.listdir(os.path.join ( DEST_RES, PATH_LIGHTMAPS))
-        for file in lightmap_files:
-            print("[LIGHTMAP] Found Lightmap file: "+file)
-
-        for obj in bpy.data.objects:
-            if obj.type not in exclusion_obj_types:
-                print("[AFRAME EXPORTER] loop object "+ obj.name)
-                bpy.ops.object.select_all(action='DESELECT')
-                obj.select_set(state=True)
-                bpy.context.view_layer.objects.active = obj
-                #bpy.ops.object.origin_set(type='ORIGIN_CENTER_OF_MASS', center='BOUNDS')
-                bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY')
-                location = obj.location.copy()
-                rotation = obj.rotation_euler.copy()
-                
-                bpy.ops.object.location_clear()
-                actualposition = str(location.x)+" "+str(location.z)+" "+str(-location.y)
-                actualscale = str(scalefactor*bpy.data.objects[obj.name].scale.x)+" "+str(scalefactor*bpy.data.objects[obj.name].scale.y)+" "+str(scalefactor*bpy.data.objects[obj.name].scale.z)
-                #pi = 22.0/7.0
-                #actualrotation = str(((bpy.data.objects[obj.name].rotation_euler.x) / (2 * pi) * 360) - 90) +" " + str(((bpy.data.objects[obj.name].rotation_euler.z) / (2 * pi) * 360)-0) + " " + str(((bpy.data.objects[obj.name].rotation_euler.y) / (2 * pi) * 360)+90)
-                #actualrotation = str(bpy.data.objects[obj.name].rotation_euler.x) +" " + str(bpy.data.objects[obj.name].rotation_euler.z)+ " " + str(bpy.data.objects[obj.name].rotation_euler.y)
-                #actualrotation = str(math.degrees(-89.99+bpy.data.objects[obj.name].rotation_euler.x)) +" " + str(90+math.degrees(bpy.data.objects[obj.name].rotation_euler.y))+ " " + str(-90+math.degrees(bpy.data.objects[obj.name].rotation_euler.z))
-                #actualrotation = str(math.degrees(rotation.x))+" "+str(math.degrees(rotation.z))+" "+str(math.degrees(-rotation.y))    
-                actualrotation = "0 "+str(math.degrees(rotation.z))+" 0"    
-                    
-                # custom aframe code read from CUSTOM PROPERTIES
-                reflections = ""
-                animation = ""
-                link = ""
-                baked = ""
-                custom = ""
-                toggle = ""
-                video = False
-                image = False
-                tag = "entity"
-                gltf_model = 'gltf-model="#'+obj.name+'"' 
-
-                # export gltf
-                print(obj.type)
-                if obj.type == 'MESH' or obj.type == 'EMPTY':
-                    if obj.type == 'EMPTY':
-                        gltf_model = ''
-                    #print(obj.name,"custom properties:")
-                    for K in obj.keys():
-                        if K not in '_RNA_UI':
-                            #print( "\n", K , "-" , obj[K], "\n" )
-                            if K == "AFRAME_CUBEMAP" and scene.b_cubemap:
-                                if scene.b_camera_cube:
-                                    reflections = ' geometry="" camera-cube-env="distance: 500; resolution: 512; repeat: true; interval: 400" '
-                                else:
-                                    reflections = ' geometry="" cube-env-map="path: '+scene.s_cubemap_path+'; extension: '+scene.s_cubemap_ext+'; reflectivity: 0.99;" '
-                            elif K == "AFRAME_ANIMATION":
-                                animation = ' animation= "'+obj[K]+'" '
-                            elif K == "AFRAME_HTTP_LINK":
-                                #link = ' link="href: '+obj[K]+'" class="clickable" '
-                                link = ' link-handler="target: '+obj[K]+'" class="clickable" '
-                            elif K == "AFRAME_VIDEO":
-                                #print("--------------- pos " + actualposition)
-                                #print("--------------- rot " + actualrotation)
-                                #print("--------------- scale " + actualscale)                                
-                                #filename = os.path.join ( DEST_RES, PATH_ASSETS, obj.name ) # + '.glft' )
-                                #bpy.ops.export_scene.gltf(filepath=filename, export_format='GLTF_EMBEDDED', use_selection=True)
-                                #assets.append('\n\t\t\t\t<a-asset-item id="'+obj.name+'" src="./assets/'+obj.name + '.gltf'+'"></a-asset-item>')                                
-                                assets.append('\n\t\t\t\t<video id="video_'+str(videocount)+'" loop="true" autoplay="true" src="./media/'+obj[K]+'"></video>')
-                                entities.append('\n\t\t\t<a-video id="#v_'+str(videocount)+'" src="#video_'+str(videocount)+'" width="1" height="1" scale="'+actualscale+'" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: false" '+animation+link+'></a-video>')
-                                #entities.append('\n\t\t\t<a-video id="#v_'+str(videocount)+'" src="#video_'+str(videocount)+'" width="'+str(bpy.data.objects[obj.name].scale.x)+'" height="'+str(bpy.data.objects[obj.name].scale.y)+'" scale="1 1 1" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: false" '+animation+link+'></a-video>')
-                                #entities.append('\n\t\t\t<a-entity id="#'+obj.name+'" gltf-model="#'+obj.name+'" material="src: #video_'+str(videocount)+'" scale="'+actualscale+'" rotation="'+actualrotation+'" position="'+actualposition+'"></a-entity>')
-                                video = True
-                                videocount = videocount +1
-                            elif K == "AFRAME_IMAGES":
-                                #print(".....images")
-                                image = True
-                                imagecount = imagecount +1
-                                #load K
-                                #json_images = '{"1": "image1.jpg", "2": "image2.jpg"}'
-                                json_images = obj[K]
-                                json_dictionary = json.loads(json_images)
-                                for key in json_dictionary:
-                                    #print(key, ":", json_dictionary[key])
-                                    assets.append('\n\t\t\t\t<img id="image_'+key+'" src="./media/'+json_dictionary[key]+'"></img>')
-                                entities.append('\n\t\t\t<a-image images-handler id="#i_'+str(imagecount)+'" src="#image_'+key+'" class="clickable" width="1" height="1" scale="'+actualscale+'" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: false"></a-image>')
-                            elif K == "AFRAME_SHOW_HIDE_OBJECT":
-                                toggle = ' toggle-handler="target: #'+obj[K]+';" class="clickable" '
-                            elif K == "AFRAME_TAG":
-                                tag = obj[K]
-                            elif K == "AFRAME_NOGLTF":
-                                gltf_model = ""
-                            elif K.startswith('AFRAME_'):
-                                attr   = K.split("AFRAME_")[1].lower()
-                                custom = custom+' '+attr+'="'+str(obj[K])+'"'
-
-                    if video == False and image == False:                        
-                        # check if baked texture is present on filesystem
-                        #images = bpy.data.images
-                        #for img in images:
-                        #    if obj.name+"_baked" in img.name and img.has_data:
-                        #       print("ok")
-                        #       baked = 'light-map-geometry="path: lightmaps/'+img.name+'"'
-                        print("[LIGHTMAP] Searching Lightmap for object ["+obj.name+"_baked"+"]")                        
-                        for file in lightmap_files:
-                            if obj.name+"_baked" in file:
-                                print("[LIGHTMAP] Found lightmap: "+file)
-                                baked = 'light-map-geometry="path: lightmaps/'+file+'; intensity: '+str(scene.f_lightMapIntensity)+'"'
-                            
-                        filename = os.path.join ( DEST_RES, PATH_ASSETS, obj.name ) # + '.glft' )
-                        bpy.ops.export_scene.gltf(filepath=filename, export_format='GLTF_EMBEDDED', use_selection=True)
-                        assets.append('\n\t\t\t\t<a-asset-item id="'+obj.name+'" src="./assets/'+obj.name + '.gltf'+'"></a-asset-item>')
-                        if scene.b_cast_shadows:
-                            entities.append('\n\t\t\t<a-'+tag+' id="#'+obj.name+'" '+gltf_model+' scale="1 1 1" position="'+actualposition+'" visible="true" shadow="cast: true" '+reflections+animation+link+custom+toggle+'></a-'+tag+'>')
-                        else:
-                            entities.append('\n\t\t\t<a-'+tag+' id="#'+obj.name+'" '+gltf_model+' '+baked+' scale="1 1 1" position="'+actualposition+'" visible="true" shadow="cast: false" '+reflections+animation+link+custom+toggle+'></a-'+tag+'>')
-                # deselect object
-                obj.location = location
-                obj.select_set(state=False)
-                exported_obj+=1
-
-        bpy.ops.object.select_all(action='DESELECT')
-
-        # Templating ------------------------------
-        #print(assets)
-        all_assets = ""
-        for x in assets:
-            all_assets += x
-
-        all_entities = ""
-        for y in entities:
-            all_entities += y
-
-        # scene
-        if scene.b_stats:
-            showstats = "stats"
-        else:
-            showstats = ""
-
-        # joystick
-        if scene.b_joystick:
-            showjoystick = "joystick"
-        else:
-            showjoystick = ""
+        summary = export_project(scene)
+        scene.s_output = format_summary(summary)
+        scene.s_slowest = "\n".join( "%s  %.2f s" % ( name, seconds ) for name, seconds in summary["slowest"] )
+        #self.report({'INFO'}, str(exported_obj)+" meshes exported")
+        return {'FINISHED'}
 
-        if scene.b_raycast:
-            raycaster='raycaster = "far: '+str(scene.f_raycast_length)+'; interval: '+str(scene.f_raycast_interval)+'; objects: .clickable,.links"'
-        else:
-            raycaster=""
 
-        #vr_controllers
-        if scene.b_vr_controllers:
-            showvr_controllers = '<a-entity id="leftHand" oculus-touch-controls="hand: left" vive-controls="hand: left"></a-entity>\n\t\t\t\t\t<a-entity id="rightHand" laser-controls oculus-touch-controls="hand: right" vive-controls="hand: right" '+raycaster+'></a-entity>'
-        else:
-            showvr_controllers = ""
+class AframeAnalyze_OT_Operator(bpy.types.Operator):
+    bl_idname = "aframe.analyze"
+    bl_label = "Analyze Scene Budget"
+    bl_description = "Triangles, draw calls, texture memory and glTF size of the export against the budgets"
 
-        #shadows
-        if scene.b_cast_shadows:
-            showcast_shadows = "true"
-            template_render_shadows = 'shadow="type: pcfsoft; autoUpdate: true;"'            
-        else:
-            showcast_shadows = "false"
-            template_render_shadows = 'shadow="type: basic; autoUpdate: false;"'            
+    def execute(self, content):
+        scene = content.scene
+        analysis = analyze_scene(scene)
+        scene.s_budget = "\n".join(budget.format_lines(analysis))
+        if analysis["over"]:
+            self.report({'WARNING'}, "Over budget: " + ", ".join( budget.LABELS[m] for m in analysis["over"] ))
+        return {'FINISHED'}
 
-        # Sky
-        if scene.b_show_env_sky:
-            show_env_sky = '<a-sky src="#sky" material="" geometry="" rotation="0 90 0"></a-sky>'                              
-        else:
-            show_env_sky = '<a-sky color="#ECECEC"></a-sky>'
 
-        # if use bake, the light should have intensity near zero
-        if scene.b_use_lightmapper:
-            light_directional_intensity = "0"
-            light_ambient_intensity = "0.1"
-        else:
-            light_directional_intensity = "1.0"
-            light_ambient_intensity = "1.0"
-
-        #Renderer
-        showrenderer = 'renderer="antialias: '+str(scene.b_aa).lower()+'; colorManagement: '+str(scene.b_colorManagement).lower()+'; physicallyCorrectLights: '+str(scene.b_physicallyCorrectLights).lower()+';"'
-
-        default_template()
-        t = Template( bpy.data.texts['index.html'].as_string() )
-        s = t.substitute(
-            asset=all_assets,
-            entity=all_entities,
-            stats=showstats,
-            aframe_version=scene.s_aframe_version,
-            joystick=showjoystick,
-            vr_controllers=showvr_controllers,
-            cast_shadows=showcast_shadows,
-            player_height=scene.f_player_height,
-            player_speed=scene.f_player_speed,
-            show_raycast=raycaster,
-            sky=show_env_sky,
-            directional_intensity=light_directional_intensity,
-            ambient_intensity=light_ambient_intensity,
-            render_shadows=template_render_shadows,
-            renderer=showrenderer)
-
-
-        #print(s)
-
-        # Saving the main INDEX FILE
-        with open( os.path.join ( DEST_RES, PATH_INDEX ), "w") as file:
-            file.write(s)
-
-        scene.s_output = str(exported_obj)+" meshes exported"
-        #self.report({'INFO'}, str(exported_obj)+" meshes exported")
-        return {'FINISHED'}
+# Command line entry point:
+#   blender -b scene.blend --python-expr "<CLI_EXPR>" -- [--config settings.json] [--set b_stats=true] [--output DIR] [--summary summary.json]
+# cli.py wraps it to export many .blend files in parallel.
+CLI_EXPR = headless.CLI_EXPR
+SUMMARY_PREFIX = headless.SUMMARY_PREFIX
+
+def _coerce_setting(kind, value):
+    if kind == 'bool':
+        return value.lower() in ( "1", "true", "yes", "on" ) if isinstance(value, str) else bool(value)
+    if kind == 'float':
+        return float(value)
+    if kind == 'int':
+        return int(value)
+    return str(value)
+
+def apply_settings(scene, settings):
+    kinds = { p [ 1 ]: p [ 0 ] for p in _props }
+    for name, value in settings.items():
+        if name not in kinds:
+            raise ValueError("unknown setting "+name)
+        setattr(scene, name, _coerce_setting(kinds[name], value))
+
+def cli_main(argv):
+    parser = argparse.ArgumentParser(prog="aframe-export", description="Export the current .blend file to an A-Frame project")
+    parser.add_argument("--config", help="JSON file with the exporter settings, e.g. {\"b_stats\": true}")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="exporter setting, overrides --config")
+    parser.add_argument("--output", help="export directory (export_path setting)")
+    parser.add_argument("--summary", help="write the JSON summary to this file")
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        # 0 for --help, 2 for the usage errors
+        return 2 if e.code is None else e.code
+
+    start = time.perf_counter()
+    try:
+        if "s_project_name" not in bpy.types.Scene.bl_rna.properties:
+            register()
+        settings = {}
+        if args.config:
+            with open(args.config, "r") as file:
+                settings.update(json.load(file))
+        for item in args.set:
+            name, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError("--set expects NAME=VALUE, got "+item)
+            settings[name] = value
+        if args.output:
+            settings["export_path"] = args.output
+        scene = bpy.context.scene
+        apply_settings(scene, settings)
+        summary = export_project(scene)
+        code = 0
+    except Exception as e:
+        summary = { "status": "error", "error": "%s: %s" % ( type(e).__name__, e ) }
+        code = 1
+    summary["blend"] = bpy.data.filepath
+    summary["seconds"] = time.perf_counter() - start
+
+    print(SUMMARY_PREFIX + json.dumps(summary))
+    if args.summary:
+        with open(args.summary, "w") as file:
+            json.dump(summary, file, indent=1)
+    return code
 
 
 # ------------------------------------------- REGISTER / UNREGISTER
@@ -787,7 +2180,14 @@ _props = [
     ("bool", "b_cubemap_background", "Enable Background", "Enable Cube Map Background" ),
     ("str", "s_cubemap_ext", "Ext", "Image file extension", "jpg" ),
     ("bool", "b_blender_lights", "Export Blender Lights", "Export Blenedr Lights or use Aframe default ones" ),
+    ("int", "i_max_lights", "Max Lights", "Blender lights rendered at run time besides the ambient light, the others are added to the ambient light (the static lights of baked scenes are left out)", 1, 0, 32),
     ("bool", "b_cast_shadows", "Cast Shadows", "Cast and Receive Shadows" ),
+    ("int", "i_shadow_map_size", "Shadow Map Size", "Width / height of the shadow maps, the shadow cameras are fitted to the scene bounds", 1024, 128, 8192),
+    ("bool", "b_lightmap_atlas", "Lightmap Atlas", "Pack the baked PNG lightmaps into power-of-two atlases at export", True),
+    ("int", "i_atlas_size", "Atlas Size", "Largest width / height of a lightmap atlas", 4096, 64, 16384),
+    ("enum", "e_lightmap_format", "Lightmap Format", "File format of the saved lightmaps", LIGHTMAP_FORMATS, 'PNG'),
+    ("int", "i_png_level", "PNG Compression", "zlib level of the saved PNG lightmaps (0 fastest - 9 smallest)", 6, 0, 9),
+    ("int", "i_lightmap_size", "Lightmap Size", "Largest width / height of the saved lightmaps, in power-of-two sizes", 2048, 16, 16384),
     ("bool", "b_lightmaps", "Use Lightmaps as Occlusion (GlTF Settings)", "GLTF Models don\'t have lightmaps: turn on this option will save lightmaps to Ambient Occlusion in the GLTF models" ),
     ("float", "f_player_speed", "Player Speed", "Player Speed", 0.1 ),
     ("float", "f_raycast_length", "Raycast Length","Raycast lenght to interact with objects", 10.0 ),
@@ -795,8 +2195,15 @@ _props = [
     ("str", "export_path", "Export To","Path to the folder containing the files to import", "C:/Temp/", 'FILE_PATH'),
     ("str", "s_project_name", "Name", "Project's name","aframe-prj"),
     ("str", "s_output", "output","output export","output"),
+    ("str", "s_slowest", "Slowest", "Slowest objects of the last export", ""),
+    ("str", "s_budget", "Budget", "Result of the last scene budget analysis", ""),
     ("bool", "b_use_lightmapper", "Use Lightmapper Add-on","Use Lightmapper for baking" ),
     ("bool", "b_camera_cube", "Camera Cube Env","Enable Camera Cube Env component"),
+    ("bool", "b_reflection_probes", "Shared Reflection Probes", "The reflective objects share a few cube cameras (the Blender reflection cubemaps, else clusters of the objects) rendered a face at a time within a frame budget", True),
+    ("int", "i_probe_count", "Probes", "Largest number of reflection probes placed without Blender reflection cubemaps", 4, 1, 16),
+    ("int", "i_probe_resolution", "Probe Resolution", "Width / height of the cube faces of a reflection probe", 256, 16, 2048),
+    ("float", "f_probe_budget", "Probe Budget", "Milliseconds per frame spent rendering the probes (at least one face per frame)", 2.0),
+    ("float", "f_probe_interval", "Probe Interval", "Seconds between two renderings of a probe, 0 renders it once", 2.0),
     ("float", "f_player_height", "Player Height","Player Height", 1.7),
     ("bool", "b_raycast", "Enable Raycast","Enable Raycast"),
     ("bool", "b_show_env_sky", "Show Environment Sky","Show Environment Sky"),
@@ -815,6 +2222,44 @@ _props = [
     ("bool", "b_aa", "Antialiasing","Antialiasing"),    
     ("bool", "b_colorManagement", "Color Management","ColorManagement"),        
     ("bool", "b_physicallyCorrectLights", "Physically Correct Lights","PhysicallyCorrectLights"),         
+    ("bool", "b_incremental", "Incremental Export","Re-export only the objects changed since the last export", True),
+    ("enum", "e_gltf_format", "glTF Format", "Output format of the exported assets", GLTF_FORMATS, 'GLTF_EMBEDDED'),
+    ("enum", "e_log_level", "Log Level", "Console output of the export", LOG_LEVELS, 'NORMAL'),
+    ("bool", "b_budget_report", "Budget in Report", "Analyze the scene budget at every export and add it to export_report.json"),
+    ("int", "i_budget_triangles", "Triangle Budget", "Largest triangle count of the scene, 0 for none", 500000, 0),
+    ("int", "i_budget_draw_calls", "Draw Call Budget", "Largest number of draw calls (one per mesh and material, one per instanced group), 0 for none", 150, 0),
+    ("int", "i_budget_texture_mb", "Texture Budget (MB)", "Largest GPU memory of the textures and their mipmaps, 0 for none", 256, 0),
+    ("int", "i_budget_download_mb", "Download Budget (MB)", "Largest estimated size of the glTF files and their textures, 0 for none", 50, 0),
+    ("bool", "b_profile", "cProfile Capture", "Profile the export with cProfile: the slowest functions in export_report.json, the capture in export_profile.prof"),
+    ("bool", "b_scene_description", "Save Scene Description", "Save the extracted scene to scene_description.json, it can be rendered again with generator.py"),
+    ("bool", "b_parallel", "Parallel Export", "Export the glTF files with background Blender processes (per object export only)"),
+    ("int", "i_workers", "Workers", "Number of background Blender processes", min(256, max(1, (os.cpu_count() or 2) - 1)), 1, 256),
+    ("bool", "b_combined_scene", "Combined Scene","Export all objects to a single glTF file, each entity shows its own node"),
+    ("bool", "b_spatial_cells", "Spatial Cells", "Export the objects to a glTF file per cell of a ground grid, the cells near the player are loaded and the distant ones disposed (cells.json)"),
+    ("float", "f_cell_size", "Cell Size", "Side of the grid cells in meters", 20.0),
+    ("float", "f_cell_load_radius", "Load Radius", "Cells closer to the player than it (meters) are loaded", 40.0),
+    ("float", "f_cell_hysteresis", "Unload Hysteresis", "Loaded cells are disposed beyond the load radius plus it (meters), so walking along a border does not reload them", 10.0),
+    ("bool", "b_compress", "Mesh Compression", "Quantize the vertex attributes (KHR_mesh_quantization, read by A-Frame 1.1+) and reorder the triangles for the vertex cache"),
+    ("bool", "b_lod", "LOD Levels", "Export decimated levels of detail of every mesh, switched by the distance from the camera"),
+    ("str", "s_lod_ratios", "LOD Ratios", "Triangle ratio of each lower level, e.g. 0.5, 0.2", "0.5, 0.2"),
+    ("str", "s_lod_distances", "LOD Distances", "Camera distance (meters) where each lower level is shown, e.g. 10, 25", "10, 25"),
+    ("bool", "b_instancing", "GPU Instancing", "Export the linked duplicates once and draw them with one draw call per mesh and material", True),
+    ("bool", "b_optimize_textures", "Texture Optimization", "Fit the glTF textures and the sky images to the largest size of their role, in power-of-two sizes for the mipmaps", True),
+    ("int", "i_texture_size", "Texture Size", "Largest width / height of the color, roughness and occlusion textures", 2048, 16, 16384),
+    ("int", "i_normal_size", "Normal Map Size", "Largest width / height of the normal maps", 1024, 16, 16384),
+    ("int", "i_sky_size", "Sky Size", "Largest width / height of the sky and environment images", 2048, 16, 16384),
+    ("bool", "b_ktx2", "KTX2 Textures", "Add KTX2 (Basis Universal) copies of the glTF textures, encoded with toktx and used by A-Frame 1.3+ (PNG / JPEG fallback)"),
+    ("str", "s_toktx_path", "toktx", "Path of the toktx tool of KTX-Software", "toktx"),
+    ("str", "s_basis_transcoder_path", "Basis Transcoder", "URL of the Basis Universal transcoder, copied to js/basis/ at export (loaded from the URL when it cannot be downloaded)", "https://cdn.jsdelivr.net/npm/three@0.137.0/examples/js/libs/basis/"),
+    ("bool", "b_production", "Production Build", "Content hashed file names for the assets, lightmaps, scripts and styles, cached for good by the browsers (asset-manifest.json)"),
+    ("bool", "b_precompress", "Precompress", "Write .gz (and .br with the brotli module) copies of the text and glTF files, served by the preview server", True),
+    ("bool", "b_progressive", "Progressive Loading", "Only the models largest on screen from the player spawn block the scene start, the others are streamed afterwards closest first (stream.json)"),
+    ("int", "i_blocking_assets", "Blocking Models", "Models loaded before the scene starts with progressive loading", 20, 0),
+    ("int", "i_stream_concurrency", "Stream Concurrency", "Models downloaded at the same time by the progressive loader", 4, 1, 32),
+    ("bool", "b_bundle_scripts", "Bundle Scripts", "Load the components used by the page from one minified, content hashed js/bundle.<hash>.js (style.css minified too)", True),
+    ("bool", "b_vendor_aframe", "Vendor A-Frame", "Put the pinned A-Frame and aframe-extras builds in the bundle instead of loading them from the CDN, for offline use (downloaded once to .vendor_cache/)"),
+    ("bool", "b_live_sync", "Live Sync", "While serving, re-export the objects edited in Blender and update the open pages without reloading them (export again after turning it on)"),
+    ("int", "i_precision", "Precision", "Decimal places of the entity position, rotation and scale in index.html", 4, 0, 9),
 ]
 
 # CUSTOM PROPERTY OPERATORS
@@ -912,6 +2357,15 @@ def _reg_str ( scene, prop, name, descr, default = "", subtype = "" ):
 def _reg_float ( scene, prop, name, descr, default = 0.0 ):
     setattr ( scene, prop, bpy.props.FloatProperty ( name = name, description = descr, default = default ) )
 
+def _reg_int ( scene, prop, name, descr, default = 0, min = 1, max = None ):
+    if max is None:
+        setattr ( scene, prop, bpy.props.IntProperty ( name = name, description = descr, default = default, min = min ) )
+    else:
+        setattr ( scene, prop, bpy.props.IntProperty ( name = name, description = descr, default = default, min = min, max = max ) )
+
+def _reg_enum ( scene, prop, name, descr, items, default ):
+    setattr ( scene, prop, bpy.props.EnumProperty ( name = name, description = descr, items = items, default = default ) )
+
 def register():
     scn = bpy.types.Scene
 
@@ -919,6 +2373,7 @@ def register():
     bpy.utils.register_class(AframeBake_OT_Operator)
     bpy.utils.register_class(AframeClean_OT_Operator)
     bpy.utils.register_class(AframeExport_OT_Operator)
+    bpy.utils.register_class(AframeAnalyze_OT_Operator)
     bpy.utils.register_class(AframeServe_OT_Operator)
     bpy.utils.register_class(AframeSavelm_OT_Operator)
     bpy.utils.register_class(AframeClear_OT_Operator)
@@ -932,16 +2387,26 @@ def register():
     bpy.utils.register_class(ToogleObjects)       
     bpy.utils.register_class(ShowHideObject)                   
     
+    bpy.app.handlers.depsgraph_update_post.append(live_depsgraph_update)
+
     for p in _props:
         if p [ 0 ] == 'str': _reg_str ( scn, * p [ 1 : ] )
         if p [ 0 ] == 'bool': _reg_bool ( scn, * p [ 1 : ] )
         if p [ 0 ] == 'float': _reg_float ( scn, * p [ 1 : ] )
+        if p [ 0 ] == 'int': _reg_int ( scn, * p [ 1 : ] )
+        if p [ 0 ] == 'enum': _reg_enum ( scn, * p [ 1 : ] )
 
 def unregister():
+    if live_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(live_depsgraph_update)
+    if Server.instance:
+        Server.instance.stop()
+        Server.instance = None
     bpy.utils.unregister_class(AframeExportPanel_PT_Panel)
     bpy.utils.unregister_class(AframeBake_OT_Operator)
     bpy.utils.unregister_class(AframeClean_OT_Operator)    
     bpy.utils.unregister_class(AframeExport_OT_Operator)
+    bpy.utils.unregister_class(AframeAnalyze_OT_Operator)
     bpy.utils.unregister_class(AframeServe_OT_Operator)
     bpy.utils.unregister_class(AframeSavelm_OT_Operator)
     bpy.utils.unregister_class(AframeClear_OT_Operator)
@@ -0,0 +1,67 @@
+'''
+AFRAME Exporter for Blender - lightmap atlas packing
+
+Places the baked lightmaps of the scene into a few power-of-two atlases
+(shelf packing, tallest images first) and computes the UV offset / scale
+the light-map-geometry component uses to sample each object's region.
+It does not import bpy: pack_lightmaps() in __init__.py copies the pixels.
+'''
+
+import math
+import struct
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def png_size(filename):
+    # ( width, height ) from the IHDR chunk, None if the file is not a PNG
+    with open(filename, "rb") as file:
+        header = file.read(24)
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def power_of_two(value):
+    return 1 << max(0, math.ceil(math.log2(max(1, value))))
+
+
+def pack(sizes, max_size, padding):
+    # sizes: { key: ( width, height ) }. Returns the atlases, each
+    # { "size": ( width, height ), "rects": { key: ( x, y, width, height ) } } with
+    # x, y the top left corner of the image (padding excluded), and the keys
+    # too large for an atlas.
+    too_large = [ k for k, ( w, h ) in sizes.items() if max(w, h) + 2 * padding > max_size ]
+    remaining = sorted(( k for k in sizes if k not in too_large ), key=lambda k: ( sizes[k][1], sizes[k][0], k ), reverse=True)
+    atlases = []
+    while remaining:
+        area = sum( ( sizes[k][0] + 2 * padding ) * ( sizes[k][1] + 2 * padding ) for k in remaining )
+        widest = max( sizes[k][0] for k in remaining ) + 2 * padding
+        width = min(max_size, max(power_of_two(math.sqrt(area)), power_of_two(widest)))
+        rects = {}
+        left = []
+        shelf_y = 0
+        shelf_height = 0
+        x = 0
+        for k in remaining:
+            w = sizes[k][0] + 2 * padding
+            h = sizes[k][1] + 2 * padding
+            if x + w > width:
+                shelf_y += shelf_height
+                shelf_height = 0
+                x = 0
+            if shelf_y + h > max_size:
+                left.append(k)
+                continue
+            rects[k] = ( x + padding, shelf_y + padding, sizes[k][0], sizes[k][1] )
+            x += w
+            shelf_height = max(shelf_height, h)
+        atlases.append({ "size": ( width, power_of_two(shelf_y + shelf_height) ), "rects": rects })
+        remaining = left
+    return atlases, too_large
+
+
+def uv_transform(rect, size):
+    # offset x, offset y, scale x, scale y of a rect in glTF UV space (origin top left)
+    x, y, w, h = rect
+    return ( x / size[0], y / size[1], w / size[0], h / size[1] )
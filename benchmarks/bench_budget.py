@@ -0,0 +1,75 @@
+'''
+Benchmark of the scene budget analysis (budget.py) on synthetic scenes: the
+triangle count of the polygon corner counts read with foreach_get, and the
+analysis of many objects sharing a few hundred textures. Checks the triangle
+count against a per polygon loop and the mip chain memory against its closed
+form (4/3 of the base level for square power-of-two textures). Exits with
+status 1 on a mismatch.
+
+    python benchmarks/bench_budget.py [--sizes 10000 100000]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import budget
+
+
+def synthetic_scene(count, seed=1):
+    rnd = random.Random(seed)
+    images = { "image_%d" % i: { "width": 1 << rnd.randint(6, 12), "height": 1 << rnd.randint(6, 12), "file_bytes": rnd.randint(10000, 4000000) } for i in range(300) }
+    names = sorted(images)
+    objects = []
+    for i in range(count):
+        objects.append({
+            "name": "Object.%06d" % i,
+            "triangles": rnd.randint(12, 20000),
+            "draw_calls": rnd.randint(1, 3),
+            "geometry_bytes": rnd.randint(1000, 500000),
+            "images": rnd.sample(names, rnd.randint(0, 3)),
+        })
+    return objects, images
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[ 10000, 100000 ])
+    args = parser.parse_args(argv)
+
+    ok = True
+    rnd = np.random.default_rng(1)
+    loop_totals = rnd.integers(3, 9, size=1000000)
+    start = time.perf_counter()
+    triangles = budget.triangle_count(loop_totals)
+    seconds = time.perf_counter() - start
+    same = triangles == sum(int(n) - 2 for n in loop_totals)
+    ok = ok and same
+    print("triangle count of %d polygons: %.4f s, %s" % ( len(loop_totals), seconds, "ok" if same else "MISMATCH" ))
+    for side in ( 1, 256, 2048 ):
+        memory = budget.texture_memory(side, side)
+        expected = ( 16 * side * side - 4 ) // 3
+        ok = ok and memory == expected
+        print("texture memory %dx%d: %d bytes, %s" % ( side, side, memory, "ok" if memory == expected else "MISMATCH (%d)" % expected ))
+
+    budgets = { "triangles": 500000, "draw_calls": 150, "texture_bytes": 256 << 20, "gltf_bytes": 50 << 20 }
+    print("\n%9s %10s %12s %10s %10s %10s  %s" % ( "objects", "analyze s", "triangles", "draw calls", "tex MB", "glTF MB", "over" ))
+    for count in args.sizes:
+        objects, images = synthetic_scene(count)
+        start = time.perf_counter()
+        analysis = budget.analyze(objects, images, budgets)
+        seconds = time.perf_counter() - start
+        totals = analysis["totals"]
+        print("%9d %10.3f %12d %10d %10.1f %10.1f  %s" % ( count, seconds, totals["triangles"], totals["draw_calls"], totals["texture_bytes"] / ( 1 << 20 ), totals["gltf_bytes"] / ( 1 << 20 ), ", ".join(analysis["over"]) ))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
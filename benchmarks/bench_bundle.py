@@ -0,0 +1,98 @@
+'''
+Benchmark of the script bundle (bundle.py): bytes and requests of the runtime
+scripts loaded by a page before and after bundling, raw and gzip compressed,
+for a few feature sets. The minified scripts are checked: outside the strings
+and regular expressions they must equal the sources without comments and
+whitespace, and "node --check" must parse them when node is installed. Exits
+with status 1 on a mismatch.
+
+    python benchmarks/bench_bundle.py
+'''
+
+import os
+import re
+import sys
+import gzip
+import shutil
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bundle
+
+RESOURCES = os.path.join ( ROOT, "resources" )
+# pages: scene attributes and entity components of the feature sets
+PAGES = {
+    "minimal": '<a-scene renderer="antialias: true"><a-entity id="#Cube" gltf-model="#Cube"></a-entity></a-scene>',
+    "lightmaps": '<a-scene><a-entity id="#Cube" gltf-model="#Cube" light-map-geometry="path: lightmaps/Cube_baked.png"></a-entity></a-scene>',
+    "joystick + links": '<a-scene joystick><a-entity id="#Cube" link-handler="target: x" class="clickable"></a-entity></a-scene>',
+    "cells + stream": '<a-scene spatial-cells="src: cells.json" progressive-loader="src: stream.json"><a-entity id="#Cube"></a-entity></a-scene>',
+    "reflection probes": '<a-scene reflection-probes="budget: 2"><a-entity id="#Cube" probe-env="probe: #reflection_probe_0"></a-entity><a-entity id="reflection_probe_0" reflection-probe="resolution: 256"></a-entity></a-scene>',
+}
+# the scripts the template loaded before the bundling
+LEGACY = ( "webxr.js", "joystick.js", "camera-cube-env.js" )
+
+
+def strip(source):
+    # the code without comments and whitespace, literals kept: what minify_js() may not change
+    literals = []
+    code = []
+    i = 0
+    while i < len(source):
+        if source.startswith("//", i):
+            j = source.find("\n", i)
+            i = len(source) if j < 0 else j
+        elif source.startswith("/*", i):
+            i = source.find("*/", i + 2) + 2
+        elif source[i] in "'\"`" or ( source[i] == "/" and bundle._regex_allowed("".join(code[-64:])) ):
+            j = bundle._literal_end(source, i)
+            literals.append(source[i:j])
+            code.append("\0")
+            i = j
+        else:
+            code.append(source[i])
+            i += 1
+    return re.sub(r"\s+", "", "".join(code)), literals
+
+
+def node_check(text):
+    if not shutil.which("node"):
+        return None
+    with tempfile.NamedTemporaryFile("w", suffix=".js", delete=False) as file:
+        file.write(text)
+    try:
+        return subprocess.run([ "node", "--check", file.name ], capture_output=True).returncode == 0
+    finally:
+        os.remove(file.name)
+
+
+def main(argv=None):
+    sources = {}
+    for name in bundle.SCRIPTS:
+        with open(os.path.join ( RESOURCES, name ), "r", encoding="utf-8") as file:
+            sources[name] = file.read()
+
+    ok = True
+    print("%20s %8s %8s %8s %s" % ( "script", "bytes", "minified", "same", "node" ))
+    for name, source in sources.items():
+        minified = bundle.minify_js(source)
+        same = strip(source) == strip(minified)
+        parsed = node_check(minified)
+        ok = ok and same and parsed is not False
+        print("%20s %8d %8d %8s %s" % ( name, len(source), len(minified), same, "-" if parsed is None else parsed ))
+
+    legacy = "".join( sources[n] for n in LEGACY )
+    print("\n%18s %9s %9s %9s %9s %9s" % ( "page", "requests", "before KB", "gzip KB", "bundle KB", "gzip KB" ))
+    for page_name, page in PAGES.items():
+        text, used = bundle.build(page, sources)
+        parsed = node_check(text)
+        ok = ok and parsed is not False
+        print("%18s %4d -> 1 %9.1f %9.1f %9.1f %9.1f  %s" % ( page_name, len(LEGACY), len(legacy) / 1024, len(gzip.compress(legacy.encode())) / 1024,
+              len(text) / 1024, len(gzip.compress(text.encode())) / 1024, ", ".join(sorted(used)) ))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
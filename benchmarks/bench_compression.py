@@ -0,0 +1,101 @@
+'''
+Benchmark of the mesh compression stage (compression.py) on synthetic glTF
+meshes: a subdivided grid with positions, normals, texture coordinates and
+32 bit indices in random triangle order, as large architectural meshes come
+out of the glTF exporter. Prints the buffer size, the vertex cache miss ratio
+(ACMR) before and after, the encode time, and checks that the dequantized
+triangles match the original ones. Exits with status 1 on a mismatch.
+
+    python benchmarks/bench_compression.py [--sizes 100 300]
+'''
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import compression
+
+
+def synthetic_gltf(side, seed=1):
+    # side x side quads, 2 * side^2 triangles
+    rnd = np.random.default_rng(seed)
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, side + 1), np.linspace(0.0, 1.0, side + 1))
+    positions = np.stack(( (u - 0.5) * 40.0, (v - 0.5) * 40.0, np.sin(u * 9.0) * np.cos(v * 7.0) ), axis=-1).reshape(-1, 3).astype(np.float32)
+    normals = np.tile(np.array(( 0.0, 0.0, 1.0 ), dtype=np.float32), ( len(positions), 1 ))
+    uvs = np.stack(( u, v ), axis=-1).reshape(-1, 2).astype(np.float32)
+    corner = (np.arange(side)[:, None] * (side + 1) + np.arange(side)[None, :]).ravel()
+    triangles = np.concatenate(( np.stack(( corner, corner + 1, corner + side + 1 ), axis=1), np.stack(( corner + 1, corner + side + 2, corner + side + 1 ), axis=1) ))
+    triangles = triangles[rnd.permutation(len(triangles))].astype(np.uint32)
+
+    chunks = [ positions.tobytes(), normals.tobytes(), uvs.tobytes(), triangles.tobytes() ]
+    views = []
+    offset = 0
+    for chunk in chunks:
+        views.append({ "buffer": 0, "byteOffset": offset, "byteLength": len(chunk) })
+        offset += len(chunk)
+    gltf = {
+        "asset": { "version": "2.0" },
+        "nodes": [ { "name": "Grid", "mesh": 0 } ],
+        "meshes": [ { "primitives": [ { "attributes": { "POSITION": 0, "NORMAL": 1, "TEXCOORD_0": 2 }, "indices": 3 } ] } ],
+        "accessors": [
+            { "bufferView": 0, "componentType": compression.FLOAT, "count": len(positions), "type": "VEC3", "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist() },
+            { "bufferView": 1, "componentType": compression.FLOAT, "count": len(normals), "type": "VEC3" },
+            { "bufferView": 2, "componentType": compression.FLOAT, "count": len(uvs), "type": "VEC2" },
+            { "bufferView": 3, "componentType": compression.UNSIGNED_INT, "count": triangles.size, "type": "SCALAR" },
+        ],
+        "bufferViews": views,
+        "buffers": [ { "byteLength": offset } ],
+    }
+    return gltf, b"".join(chunks)
+
+
+def triangle_positions(gltf, binary):
+    # sorted world space triangles, independent of the triangle and vertex order
+    positions = compression.read_accessor(gltf, binary, 0)[:, :3].astype(np.float64)
+    if gltf["accessors"][0]["componentType"] != compression.FLOAT:
+        positions *= gltf["nodes"][0]["scale"][0]
+    indices = compression.read_accessor(gltf, binary, 3).ravel().astype(np.int64)
+    corners = positions[indices].reshape(-1, 3, 3)
+    corners = np.sort(corners.reshape(-1, 9), axis=0)
+    return corners
+
+
+def run(side):
+    gltf, binary = synthetic_gltf(side)
+    before = len(binary)
+    indices = compression.read_accessor(gltf, binary, 3).ravel()
+    acmr_before = compression.cache_miss_ratio(indices)
+    reference = triangle_positions(gltf, binary)
+
+    start = time.perf_counter()
+    binary = compression.compress(gltf, binary)
+    seconds = time.perf_counter() - start
+
+    acmr_after = compression.cache_miss_ratio(compression.read_accessor(gltf, binary, 3).ravel())
+    error = float(np.abs(triangle_positions(gltf, binary) - reference).max())
+    tolerance = gltf["nodes"][0]["scale"][0]
+    return ( len(indices) // 3, before, len(binary), acmr_before, acmr_after, seconds, error, error <= tolerance )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[ 100, 300 ], help="grid sides (2 * side^2 triangles)")
+    args = parser.parse_args(argv)
+
+    ok = True
+    print("%10s %12s %12s %8s %8s %10s %10s" % ( "triangles", "bytes", "compressed", "ACMR", "after", "encode s", "max error" ))
+    for side in args.sizes:
+        triangles, before, after, acmr_before, acmr_after, seconds, error, passed = run(side)
+        print("%10d %12d %12d %8.3f %8.3f %10.3f %10.2e%s" % ( triangles, before, after, acmr_before, acmr_after, seconds, error, "" if passed else "  FAILED" ))
+        ok = ok and passed
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
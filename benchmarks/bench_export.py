@@ -0,0 +1,121 @@
+'''
+Benchmark of the export stages that do not need Blender: scene extraction
+(batched world transforms and describe_object on stub objects), entity generation, index.html rendering,
+the JSON round trip of the scene description and the progressive loading manifest.
+
+    python benchmarks/bench_export.py [--sizes 10000 50000 100000] [--lightmaps 0.5]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import importlib.util
+
+import numpy as np
+
+import bpy_stub
+from bench_transforms import euler_xyz_matrices
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def load_addon():
+    bpy_stub.install()
+    spec = importlib.util.spec_from_file_location("aframe_exporter", os.path.join ( ROOT, "__init__.py" ), submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def default_settings(addon):
+    settings = {}
+    for p in addon._props:
+        if p [ 0 ] == 'enum':
+            settings[p [ 1 ]] = p [ 5 ]
+        elif len(p) > 4:
+            settings[p [ 1 ]] = p [ 4 ]
+        else:
+            settings[p [ 1 ]] = { 'bool': False, 'float': 0.0, 'int': 0 }.get(p [ 0 ], "")
+    return settings
+
+
+def synthetic_scene(count, lightmap_ratio, seed=1):
+    rnd = random.Random(seed)
+    objects = []
+    for i in range(count):
+        properties = {}
+        kind = rnd.random()
+        if kind < 0.05:
+            properties["AFRAME_ANIMATION"] = "property: rotation; to: 0 360 0; loop: true; dur: 10000"
+        elif kind < 0.08:
+            properties["AFRAME_HTTP_LINK"] = "https://example.com/%d" % i
+        elif kind < 0.10:
+            properties["AFRAME_CUBEMAP"] = "1"
+        objects.append(bpy_stub.StubObject(
+            "Object.%06d" % i,
+            'EMPTY' if kind > 0.98 else 'MESH',
+            location=( rnd.uniform(-500, 500), rnd.uniform(-500, 500), rnd.uniform(0, 20) ),
+            rotation=( 0.0, 0.0, rnd.uniform(-3.14, 3.14) ),
+            scale=( 1.0, 1.0, 1.0 ),
+            properties=properties))
+    lightmaps = [ o.name + "_baked.png" for o in objects if rnd.random() < lightmap_ratio ]
+    return objects, lightmaps
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(addon, count, lightmap_ratio):
+    generator = addon.generator
+    objects, lightmaps = synthetic_scene(count, lightmap_ratio)
+    settings = default_settings(addon)
+    settings["b_cubemap"] = True
+
+    def extract():
+        index = generator.lightmap_index(lightmaps)
+        matrices = np.zeros(( len(objects), 4, 4 ))
+        matrices[:, :3, :3] = euler_xyz_matrices(np.array([ o.rotation_euler for o in objects ])) * np.array([ o.scale for o in objects ])[:, None, :]
+        matrices[:, :3, 3] = [ o.location for o in objects ]
+        matrices[:, 3, 3] = 1.0
+        positions, rotations, scales = addon.transforms.world_transforms(matrices, np.zeros(( len(objects), 3 )), np.zeros(len(objects), dtype=bool))
+        return tuple( addon.describe_object(o, transform, index, o.name + ".gltf", False) for o, transform in zip(objects, zip(positions.tolist(), rotations.tolist(), scales.tolist())) )
+
+    records, t_extract = timed(extract)
+    description = generator.SceneDescription(settings=settings, objects=records, template="<a-assets>${asset}</a-assets>${entity}")
+    (assets, entities), t_entities = timed(generator.generate_entities, description)
+    html, t_render = timed(generator.render_index, description, assets, entities)
+    data, t_dump = timed(generator.description_to_dict, description)
+    _, t_load = timed(generator.description_from_dict, data)
+    settings["b_progressive"] = True
+    manifest, t_stream = timed(generator.stream_manifest, description)
+    return ( count, len(lightmaps), t_extract, t_entities, t_render, t_dump + t_load, t_stream, len(manifest["entities"]), len(html) )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[ 10000, 50000, 100000 ])
+    parser.add_argument("--lightmaps", type=float, default=0.5, help="fraction of objects with a baked lightmap")
+    args = parser.parse_args(argv)
+
+    addon = load_addon()
+    # keep the per object log lines out of the timings
+    devnull = open(os.devnull, "w")
+    print("%8s %9s %10s %10s %10s %10s %10s %9s %12s" % ( "objects", "lightmaps", "extract s", "entities s", "render s", "json s", "stream s", "streamed", "html bytes" ))
+    for count in args.sizes:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            row = run(addon, count, args.lightmaps)
+        finally:
+            sys.stdout = stdout
+        print("%8d %9d %10.3f %10.3f %10.3f %10.3f %10.3f %9d %12d" % row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+'''
+Benchmark of the lightmap encoding (lightmaps.py) on synthetic baked
+lightmaps: smooth HDR gradients with soft shadows and noise, as they come out
+of the Lightmapper. Prints the file size of every PNG level and of RGBM, and
+the save time of the batch encoded one after the other and on a thread pool.
+The PNG files are decoded again (zlib + the PNG filters) and compared with the
+input, RGBM is decoded and its relative error checked. Exits with status 1 on
+a mismatch.
+
+    python benchmarks/bench_lightmap_encoding.py [--count 16] [--size 1024] [--threads 4]
+'''
+
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lightmaps
+
+
+def synthetic_lightmap(size, seed):
+    # linear float RGBA, rows bottom-up like img.pixels
+    rnd = np.random.default_rng(seed)
+    v, u = np.mgrid[0:size, 0:size] / size
+    light = 0.2 + 3.0 * np.exp(-((u - rnd.random()) ** 2 + (v - rnd.random()) ** 2) * 6.0)
+    shadow = 1.0 - 0.7 * (np.abs(u - v - rnd.uniform(-0.3, 0.3)) < 0.1)
+    rgb = light[..., None] * shadow[..., None] * np.array(( 1.0, 0.9, 0.75 ))
+    rgb *= 1.0 + rnd.normal(0.0, 0.01, rgb.shape)
+    pixels = np.ones(( size, size, 4 ), dtype=np.float32)
+    pixels[..., :3] = rgb
+    return pixels
+
+
+def decode_png(data):
+    # reference decoder of the 8 bit RGBA PNG files png_bytes() writes
+    width, height = struct.unpack(">II", data[16:24])
+    pos = 8
+    idat = b""
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos+4])
+        if data[pos+4:pos+8] == b"IDAT":
+            idat += data[pos+8:pos+8+length]
+        pos += 12 + length
+    lines = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, width * 4 + 1)
+    out = np.zeros(( height, width * 4 ), dtype=np.int64)
+    previous = np.zeros(width * 4, dtype=np.int64)
+    for y in range(height):
+        kind = lines[y, 0]
+        line = lines[y, 1:].astype(np.int64)
+        if kind == 0:
+            row = line
+        elif kind == 2:
+            row = (line + previous) & 255
+        else:
+            # sub, average and paeth depend on the pixel on the left
+            row = np.zeros_like(line)
+            for x in range(width * 4):
+                a = row[x-4] if x >= 4 else 0
+                b = previous[x]
+                c = previous[x-4] if x >= 4 else 0
+                if kind == 1:
+                    predictor = a
+                elif kind == 3:
+                    predictor = (a + b) // 2
+                else:
+                    p = a + b - c
+                    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                    predictor = a if pa <= pb and pa <= pc else (b if pb <= pc else c)
+                row[x] = (line[x] + predictor) & 255
+        out[y] = row
+        previous = row
+    return out.reshape(height, width, 4).astype(np.uint8)
+
+
+def check(size):
+    pixels = synthetic_lightmap(size, 7)
+    rgba = lightmaps.to_rgba8(pixels, True)
+    png_ok = bool((decode_png(lightmaps.png_bytes(rgba, 6)) == rgba).all())
+    ext, data = lightmaps.encode(pixels, True, "RGBM", 6)
+    rgbm = decode_png(data).astype(np.float64) / 255.0
+    decoded = rgbm[..., :3] * rgbm[..., 3:] * lightmaps.RGBM_RANGE
+    reference = np.clip(pixels[::-1, :, :3], 0.0, lightmaps.RGBM_RANGE)
+    rgbm_error = float((np.abs(decoded - reference) / np.maximum(reference, 0.05)).max())
+    return png_ok, rgbm_error
+
+
+def save_all(batch, fmt, level, threads):
+    start = time.perf_counter()
+    if threads > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            sizes = [ len(data) for ext, data in pool.map(lambda p: lightmaps.encode(p, True, fmt, level), batch) ]
+    else:
+        sizes = [ len(lightmaps.encode(p, True, fmt, level)[1]) for p in batch ]
+    return sum(sizes), time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=16, help="lightmaps in the batch")
+    parser.add_argument("--size", type=int, default=1024, help="lightmap width and height")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    png_ok, rgbm_error = check(96)
+    print("PNG decode matches: %s, RGBM max relative error: %.4f" % ( png_ok, rgbm_error ))
+    ok = png_ok and rgbm_error < 0.03
+
+    batch = [ synthetic_lightmap(args.size, seed) for seed in range(args.count) ]
+    raw = args.count * args.size * args.size * 4
+    print("%d lightmaps %dx%d, %d KB as raw 8 bit RGBA" % ( args.count, args.size, args.size, raw // 1024 ))
+    print("%8s %6s %10s %10s %10s %8s" % ( "format", "level", "KB", "serial s", "threads s", "speedup" ))
+    for fmt, level in ( ( "PNG", 1 ), ( "PNG", 6 ), ( "PNG", 9 ), ( "RGBM", 6 ) ):
+        size, serial = save_all(batch, fmt, level, 1)
+        size, threaded = save_all(batch, fmt, level, args.threads)
+        print("%8s %6d %10d %10.2f %10.2f %7.1fx" % ( fmt, level, size // 1024, serial, threaded, serial / threaded ))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
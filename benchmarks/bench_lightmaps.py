@@ -0,0 +1,102 @@
+'''
+Micro-benchmark of the export loop hot spots: lightmap matching (substring scan
+of every lightmap file per object against the lightmap_index dictionary),
+index.html assembly (string += in a loop against join / streamed writes) and
+the atlas packing of the lightmaps (atlases, fill ratio, overlaps).
+
+    python benchmarks/bench_lightmaps.py [--objects 5000] [--lightmaps 0.5]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generator
+import atlas
+
+
+def legacy_scan(names, files):
+    matches = {}
+    for name in names:
+        for file in files:
+            if name+"_baked" in file:
+                matches[name] = file
+    return matches
+
+def indexed(names, files):
+    index = generator.lightmap_index(files)
+    return { name: index[name] for name in names if name in index }
+
+def concat(lines):
+    all_entities = ""
+    for y in lines:
+        all_entities += y
+    return all_entities
+
+def join(lines):
+    return "".join(lines)
+
+def stream(lines):
+    with open(os.devnull, "w") as file:
+        file.writelines(lines)
+
+
+def check_atlases(atlases, sizes, max_size, padding):
+    # every rect inside its atlas with its padding, no two rects overlapping
+    used = 0
+    for entry in atlases:
+        width, height = entry["size"]
+        assert width <= max_size and height <= max_size
+        rects = sorted(entry["rects"].values())
+        for x, y, w, h in rects:
+            assert x >= padding and y >= padding and x + w + padding <= width and y + h + padding <= height
+        for i, a in enumerate(rects):
+            for b in rects[i+1:]:
+                if b[0] >= a[0] + a[2] + 2 * padding:
+                    break
+                assert b[1] >= a[1] + a[3] + 2 * padding or a[1] >= b[1] + b[3] + 2 * padding or b[0] >= a[0] + a[2] + 2 * padding
+        used += sum( w * h for x, y, w, h in rects )
+    return used / max(1, sum( e["size"][0] * e["size"][1] for e in atlases ))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=5000)
+    parser.add_argument("--lightmaps", type=float, default=0.5, help="fraction of objects with a baked lightmap")
+    args = parser.parse_args(argv)
+
+    names = [ "Object.%06d" % i for i in range(args.objects) ]
+    files = [ n + "_baked.png" for n in names[:int(len(names) * args.lightmaps)] ]
+    lines = [ '\n\t\t\t<a-entity id="#%s" gltf-model="#%s" scale="1 1 1" position="1.0 2.0 3.0" visible="true" shadow="cast: false" ></a-entity>' % ( n, n ) for n in names ]
+
+    legacy, t_legacy = timed(legacy_scan, names, files)
+    fast, t_fast = timed(indexed, names, files)
+    assert legacy == fast
+    print("lightmaps  %d objects x %d files: scan %.3f s, index %.4f s (x%.0f)" % ( len(names), len(files), t_legacy, t_fast, t_legacy / max(t_fast, 1e-9) ))
+
+    _, t_concat = timed(concat, lines)
+    _, t_join = timed(join, lines)
+    _, t_stream = timed(stream, lines)
+    print("index.html %d entities: += %.4f s, join %.4f s, streamed %.4f s" % ( len(lines), t_concat, t_join, t_stream ))
+
+    rnd = random.Random(1)
+    sizes = { f: ( rnd.choice(( 64, 128, 256, 512 )), rnd.choice(( 64, 128, 256, 512 )) ) for f in files }
+    ( atlases, too_large ), t_pack = timed(atlas.pack, sizes, 4096, 2)
+    fill = check_atlases(atlases, sizes, 4096, 2)
+    print("atlases    %d lightmaps: %d atlases of 4096 max, %.0f%% filled, %d too large, %.4f s" % ( len(sizes), len(atlases), 100 * fill, len(too_large), t_pack ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+'''
+Benchmark of the preview server (preview.py) against the previous one
+(socketserver.TCPServer handling one request at a time), on a synthetic
+project of many small glTF files fetched by parallel clients while one
+client stalls in the middle of a request. Checks the precompressed answers,
+the byte ranges, the 304 answers, the live sync event stream (time from
+publish() to the page) and the shutdown time. Exits with status 1 on a
+failed check.
+
+    python benchmarks/bench_preview.py [--files 500] [--clients 8]
+'''
+
+import os
+import sys
+import gzip
+import json
+import time
+import socket
+import tempfile
+import argparse
+import threading
+import http.client
+import http.server
+import socketserver
+import concurrent.futures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import preview
+
+
+def synthetic_project(folder, count):
+    os.makedirs(os.path.join ( folder, "assets" ))
+    for i in range(count):
+        with open(os.path.join ( folder, "assets", "object_%d.gltf" % i ), "w") as file:
+            file.write('{"asset":{"version":"2.0"},"nodes":[' + ",".join('{"name":"node_%d","translation":[%d,0,0]}' % ( j, j ) for j in range(200)) + ']}')
+    with open(os.path.join ( folder, "video.mp4" ), "wb") as file:
+        file.write(os.urandom(1 << 20))
+    with open(os.path.join ( folder, "index.html" ), "w") as file:
+        file.write("<html>" + "<a-entity></a-entity>" * 500 + "</html>")
+
+
+class LegacyServer(threading.Thread):
+    # the server of the previous versions: one connection at a time, HTTP/1.0
+    def __init__(self, folder, port):
+        threading.Thread.__init__(self, daemon=True)
+        socketserver.TCPServer.allow_reuse_address = True
+        handler = type("Handler", ( http.server.SimpleHTTPRequestHandler, ), { "log_message": lambda self, *args: None })
+        self.httpd = socketserver.TCPServer(("127.0.0.1", port), lambda *args: handler(*args, directory=folder))
+        self.httpd.handle_error = lambda request, address: None
+        self.should_stop = False
+
+    def run(self):
+        while not self.should_stop:
+            self.httpd.handle_request()
+        self.httpd.server_close()
+
+    def stop(self):
+        self.should_stop = True
+        connection = http.client.HTTPConnection("127.0.0.1", self.httpd.server_address[1])
+        connection.request("GET", "/")
+        connection.getresponse().read()
+
+
+class NewServer(threading.Thread):
+    def __init__(self, folder, port):
+        threading.Thread.__init__(self, daemon=True)
+        self.httpd = preview.PreviewServer(("127.0.0.1", port), folder)
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def fetch_all(port, paths, headers):
+    # one keep-alive connection per client (a new connection per request with HTTP/1.0)
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    received = 0
+    for path in paths:
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        received += len(response.read())
+        if response.will_close:
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    connection.close()
+    return received
+
+
+def load(server_class, folder, count, clients, headers):
+    server = server_class(folder, 0)
+    port = server.httpd.server_address[1]
+    server.start()
+    # a client sending half a request: the single threaded server waits for it
+    stalled = socket.create_connection(( "127.0.0.1", port ))
+    stalled.sendall(b"GET /index.html HTTP/1.1\r\nHost: x\r\n")
+    paths = [ "/assets/object_%d.gltf" % i for i in range(count) ]
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        # the stalled client gives up after a second
+        threading.Timer(1.0, stalled.close).start()
+        futures = [ pool.submit(fetch_all, port, paths[k::clients], headers) for k in range(clients) ]
+        received = sum(f.result() for f in futures)
+    seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    server.stop()
+    return seconds, received, time.perf_counter() - start
+
+
+def checks(folder):
+    server = NewServer(folder, 0)
+    port = server.httpd.server_address[1]
+    server.start()
+    results = {}
+    try:
+        original = open(os.path.join ( folder, "assets", "object_0.gltf" ), "rb").read()
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        connection.request("GET", "/assets/object_0.gltf", headers={ "Accept-Encoding": "gzip, deflate" })
+        response = connection.getresponse()
+        results["gzip"] = response.getheader("Content-Encoding") == "gzip" and gzip.decompress(response.read()) == original
+        video = open(os.path.join ( folder, "video.mp4" ), "rb").read()
+        connection.request("GET", "/video.mp4", headers={ "Range": "bytes=1000-1999" })
+        response = connection.getresponse()
+        results["range"] = response.status == 206 and response.read() == video[1000:2000] and response.getheader("Content-Range") == "bytes 1000-1999/%d" % len(video)
+        connection.request("GET", "/video.mp4", headers={ "Range": "bytes=-10" })
+        response = connection.getresponse()
+        results["suffix range"] = response.status == 206 and response.read() == video[-10:]
+        connection.request("GET", "/video.mp4", headers={ "Range": "bytes=%d-" % len(video) })
+        response = connection.getresponse()
+        response.read()
+        results["416"] = response.status == 416
+        connection.request("GET", "/", headers={ "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT" })
+        response = connection.getresponse()
+        response.read()
+        results["304"] = response.status == 304
+        results["keep-alive"] = not response.will_close
+        connection.close()
+
+        events = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        events.request("GET", preview.LIVE_PATH)
+        response = events.getresponse()
+        start = time.perf_counter()
+        pages = server.httpd.publish({ "type": "update", "entities": [ { "id": "Cube", "position": "1 2 3" } ] })
+        line = response.fp.readline()
+        latency = time.perf_counter() - start
+        results["events"] = pages == 1 and response.getheader("Content-Type") == "text/event-stream" and json.loads(line[len(b"data: "):])["entities"][0]["id"] == "Cube"
+        print("live sync event received %.2f ms after publish()" % ( latency * 1000 ))
+    finally:
+        server.stop()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        synthetic_project(folder, args.files)
+        written, checked = preview.precompress(folder)
+        print("precompressed: %d files written for %d files" % ( written, checked ))
+        print("%10s %10s %12s %12s" % ( "server", "load s", "received KB", "shutdown s" ))
+        for name, server_class, headers in ( ( "legacy", LegacyServer, {} ), ( "preview", NewServer, { "Accept-Encoding": "br, gzip" } ) ):
+            seconds, received, shutdown = load(server_class, folder, args.files, args.clients, headers)
+            print("%10s %10.2f %12d %12.3f" % ( name, seconds, received // 1024, shutdown ))
+        results = checks(folder)
+    print(", ".join("%s: %s" % ( k, "ok" if v else "FAILED" ) for k, v in results.items()))
+    return 0 if all(results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+'''
+Check and benchmark of the batched world transform conversion (transforms.py)
+on synthetic scenes: random Blender world matrices (Euler XYZ rotations, non
+uniform and mirrored scales, exact 90 degree turns) are packed like
+foreach_get("matrix_world") does, converted in one batch, and every object is
+rebuilt from its A-Frame position / rotation / scale and compared with the
+reference matrix. Exits with status 1 if any object is off by more than
+--tolerance.
+
+    python benchmarks/bench_transforms.py [--sizes 50000] [--tolerance 1e-4]
+'''
+
+import os
+import sys
+import math
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+import transforms
+import generator
+
+
+def euler_xyz_matrices(angles):
+    # Blender rotation_mode 'XYZ': R = Rz Ry Rx
+    cx, cy, cz = np.cos(angles).T
+    sx, sy, sz = np.sin(angles).T
+    r = np.empty(( len(angles), 3, 3 ))
+    r[:, 0, 0] = cy*cz
+    r[:, 0, 1] = sx*sy*cz - cx*sz
+    r[:, 0, 2] = cx*sy*cz + sx*sz
+    r[:, 1, 0] = cy*sz
+    r[:, 1, 1] = sx*sy*sz + cx*cz
+    r[:, 1, 2] = cx*sy*sz - sx*cz
+    r[:, 2, 0] = -sy
+    r[:, 2, 1] = sx*cy
+    r[:, 2, 2] = cx*cy
+    return r
+
+
+def synthetic_scene(count, seed=1):
+    rnd = np.random.default_rng(seed)
+    angles = rnd.uniform(-math.pi, math.pi, ( count, 3 ))
+    # every 10th object is turned by exact multiples of 90 degrees (gimbal lock cases)
+    angles[::10] = rnd.integers(-2, 3, ( len(angles[::10]), 3 )) * (math.pi / 2)
+    scales = rnd.uniform(0.1, 5.0, ( count, 3 ))
+    scales[::20, 0] *= -1.0
+    matrices = np.zeros(( count, 4, 4 ))
+    matrices[:, :3, :3] = euler_xyz_matrices(angles) * scales[:, None, :]
+    matrices[:, :3, 3] = rnd.uniform(-500.0, 500.0, ( count, 3 ))
+    matrices[:, 3, 3] = 1.0
+    centers = rnd.uniform(-2.0, 2.0, ( count, 3 ))
+    media = rnd.random(count) < 0.05
+    # the layout foreach_get("matrix_world") fills: float32, column-major
+    buffer = np.ascontiguousarray(matrices.transpose(0, 2, 1), dtype=np.float32).ravel()
+    return buffer, centers, media
+
+
+def aframe_matrix(position, rotation, scale):
+    # THREE.Object3D: T * Ry * Rx * Rz * S, rotation in degrees with order YXZ
+    x, y, z = ( math.radians(a) for a in rotation )
+    cx, sx, cy, sy, cz, sz = math.cos(x), math.sin(x), math.cos(y), math.sin(y), math.cos(z), math.sin(z)
+    r = (
+        ( cy*cz + sy*sx*sz, sy*sx*cz - cy*sz, sy*cx ),
+        ( cx*sz, cx*cz, -sx ),
+        ( cy*sx*sz - sy*cz, sy*sz + cy*sx*cz, cy*cx ),
+    )
+    return [ [ r[i][j] * scale[j] for j in range(3) ] + [ position[i] ] for i in range(3) ]
+
+
+def reference_matrix(matrix, center, media):
+    # expected A-Frame world matrix of the entity, one object at a time:
+    # linear part Y_UP L Y_UP^T (glTF) or Y_UP L (media), translation Y_UP (L c + t)
+    c = transforms.Y_UP.tolist()
+    m = matrix.tolist()
+    linear = [ [ sum(c[i][k] * m[k][j] for k in range(3)) for j in range(3) ] for i in range(3) ]
+    if not media:
+        linear = [ [ sum(linear[i][k] * c[j][k] for k in range(3)) for j in range(3) ] for i in range(3) ]
+    world = [ sum(m[i][k] * center[k] for k in range(3)) + m[i][3] for i in range(3) ]
+    position = [ sum(c[i][k] * world[k] for k in range(3)) for i in range(3) ]
+    return [ linear[i] + [ position[i] ] for i in range(3) ]
+
+
+def run(count, tolerance):
+    buffer, centers, media = synthetic_scene(count)
+
+    start = time.perf_counter()
+    matrices = transforms.matrices_from_buffer(buffer)
+    positions, rotations, scales = transforms.world_transforms(matrices, centers, media)
+    t_batch = time.perf_counter() - start
+
+    start = time.perf_counter()
+    references = [ reference_matrix(matrices[i], centers[i], media[i]) for i in range(count) ]
+    t_reference = time.perf_counter() - start
+
+    worst = 0.0
+    for i, expected in enumerate(references):
+        rebuilt = aframe_matrix(positions[i], rotations[i], scales[i])
+        size = max(1.0, max(abs(v) for row in expected for v in row))
+        error = max(abs(rebuilt[r][k] - expected[r][k]) for r in range(3) for k in range(4)) / size
+        worst = max(worst, error)
+
+    rows = [ ( positions[i].tolist(), rotations[i].tolist(), scales[i].tolist() ) for i in range(count) ]
+    legacy = sum( len(" ".join(str(v) for v in vector)) for row in rows for vector in row )
+    compact = [ sum( len(generator.format_vector(vector, precision)) for row in rows for vector in row ) for precision in ( 2, 4, 6 ) ]
+    return ( count, t_batch, t_reference, worst, legacy, compact, worst <= tolerance )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[ 50000 ])
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="largest relative error of a rebuilt matrix")
+    args = parser.parse_args(argv)
+
+    ok = True
+    print("%8s %9s %13s %10s %10s %24s" % ( "objects", "batch s", "per object s", "max error", "str() B", "precision 2 / 4 / 6 B" ))
+    for count in args.sizes:
+        count, t_batch, t_reference, worst, legacy, compact, passed = run(count, args.tolerance)
+        print("%8d %9.3f %13.3f %10.2e %10d %24s%s" % ( count, t_batch, t_reference, worst, legacy, " / ".join(str(c) for c in compact), "" if passed else "  FAILED" ))
+        ok = ok and passed
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+'''
+Minimal stand-in for the bpy module, enough to import the add-on outside
+Blender and to feed synthetic objects to the scene extraction.
+'''
+
+import sys
+import math
+import types
+
+
+class _StubVector(tuple):
+    @property
+    def length(self):
+        return math.sqrt(sum( v * v for v in self ))
+
+
+class _StubMatrix:
+    # the scale part of a world matrix, enough for bounding radii
+    def __init__(self, scale):
+        self.scale = scale
+
+    def to_3x3(self):
+        return self
+
+    def __matmul__(self, vector):
+        return _StubVector( s * v for s, v in zip(self.scale, vector) )
+
+
+class StubObject:
+    def __init__(self, name, type='MESH', location=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0), scale=(1.0, 1.0, 1.0), properties=None):
+        self.name = name
+        self.type = type
+        self.location = location
+        self.rotation_euler = rotation
+        self.scale = scale
+        self._properties = dict(properties or {})
+        self.matrix_world = _StubMatrix(scale)
+        # unit cube
+        self.bound_box = [ ( x, y, z ) for x in ( -1.0, 1.0 ) for y in ( -1.0, 1.0 ) for z in ( -1.0, 1.0 ) ]
+
+    def keys(self):
+        return list(self._properties.keys())
+
+    def __getitem__(self, key):
+        return self._properties[key]
+
+
+class _Anything:
+    def __getattr__(self, name):
+        return _Anything()
+
+    def __call__(self, *args, **kwargs):
+        return _Anything()
+
+
+def install():
+    # registers the stub as "bpy" (and "mathutils") and returns it
+    bpy = types.ModuleType("bpy")
+    bpy.types = types.SimpleNamespace(Panel=object, Operator=object, Scene=_Anything())
+    bpy.props = _Anything()
+    bpy.ops = _Anything()
+    bpy.utils = _Anything()
+    bpy.app = types.SimpleNamespace(binary_path="blender", handlers=_Anything())
+    bpy.context = _Anything()
+    bpy.data = types.SimpleNamespace(objects=[], texts={}, images=[], filepath="")
+    sys.modules["bpy"] = bpy
+    mathutils = types.ModuleType("mathutils")
+    mathutils.Matrix = _Anything()
+    mathutils.Vector = tuple
+    sys.modules["mathutils"] = mathutils
+    return bpy
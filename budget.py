@@ -0,0 +1,115 @@
+'''
+AFRAME Exporter for Blender - scene budget
+
+Weight of the exported scene on the target headsets, per object and in
+total: triangles, draw calls, GPU texture memory with the mip levels and
+estimated glTF download size, compared with the budgets of the exporter
+settings, the heaviest objects listed per metric. analyze_scene() in
+__init__.py reads the meshes in bulk with foreach_get and passes the
+counts; this module does the arithmetic. It does not import bpy.
+'''
+
+import numpy as np
+
+METRICS = ( "triangles", "draw_calls", "texture_bytes", "gltf_bytes" )
+LABELS = { "triangles": "Triangles", "draw_calls": "Draw calls", "texture_bytes": "Texture memory", "gltf_bytes": "glTF size" }
+# heaviest objects listed per metric
+WORST = 5
+# bytes per pixel on the GPU: RGBA8, and the transcoded KTX2 formats (BC7 / ASTC 4x4)
+RGBA_BYTES = 4
+KTX2_BYTES = 1
+# glTF vertices of the smooth shaded faces: the Blender vertices plus the UV seams
+SEAM_FACTOR = 1.2
+# vertex attribute bytes: position + normal, per UV layer, and the quantized ones
+# (KHR_mesh_quantization: short positions, byte normals, short UVs)
+VERTEX_BYTES = 24
+UV_BYTES = 8
+QUANTIZED_VERTEX_BYTES = 12
+QUANTIZED_UV_BYTES = 4
+# the embedded glTF stores the buffers and images in base64
+BASE64_RATIO = 4 / 3
+
+
+def triangle_count(loop_totals):
+    # triangles of the polygons with these corner counts (foreach_get "loop_total")
+    loop_totals = np.asarray(loop_totals, dtype=np.int64)
+    return int(np.maximum(loop_totals - 2, 0).sum())
+
+
+def gltf_vertices(vertices, loops, smooth):
+    # vertices written by the glTF exporter: the corners of the flat faces are split,
+    # the smooth fraction of the faces share their vertices (but on the UV seams)
+    return int(min(loops, vertices * smooth * SEAM_FACTOR + loops * ( 1 - smooth )))
+
+
+def geometry_bytes(vertices, triangles, uv_layers, quantized):
+    per_vertex = ( QUANTIZED_VERTEX_BYTES + QUANTIZED_UV_BYTES * uv_layers ) if quantized else ( VERTEX_BYTES + UV_BYTES * uv_layers )
+    index_bytes = 2 if vertices < 65536 else 4
+    return vertices * per_vertex + triangles * 3 * index_bytes
+
+
+def texture_memory(width, height, bytes_per_pixel = RGBA_BYTES, mipmaps = True):
+    # GPU bytes of a texture and of its mip chain down to 1 x 1
+    total = 0
+    while True:
+        total += width * height * bytes_per_pixel
+        if not mipmaps or ( width == 1 and height == 1 ):
+            return total
+        width, height = max(1, width // 2), max(1, height // 2)
+
+
+def analyze(objects, images, budgets, base64 = False, ktx2 = False, embedded_images = False):
+    # objects: [ { "name", "triangles", "draw_calls", "geometry_bytes", "images": [ image names ] } ],
+    # the geometry_bytes of an instance (shared mesh) is 0; images: { name: { "width", "height",
+    # "file_bytes" } } in their exported size; budgets: { metric: limit, 0 for none }.
+    # base64: embedded glTF format, embedded_images: every glTF file carries its images
+    # (embedded format without combined scene), else they are downloaded once
+    bytes_per_pixel = KTX2_BYTES if ktx2 else RGBA_BYTES
+    memory = { name: texture_memory(i["width"], i["height"], bytes_per_pixel) for name, i in images.items() }
+    ratio = BASE64_RATIO if base64 else 1.0
+    rows = []
+    for o in objects:
+        rows.append({
+            "name": o["name"],
+            "triangles": o["triangles"],
+            "draw_calls": o["draw_calls"],
+            # the shared textures are counted for every object using them
+            "texture_bytes": sum(memory[i] for i in o["images"]),
+            "gltf_bytes": int(( o["geometry_bytes"] + sum(images[i]["file_bytes"] for i in o["images"]) ) * ratio),
+        })
+    totals = {
+        "triangles": sum(r["triangles"] for r in rows),
+        "draw_calls": sum(r["draw_calls"] for r in rows),
+        "texture_bytes": sum(memory.values()),
+        "gltf_bytes": sum(r["gltf_bytes"] for r in rows) if embedded_images else int(( sum(o["geometry_bytes"] for o in objects) + sum(i["file_bytes"] for i in images.values()) ) * ratio),
+    }
+    return {
+        "objects": len(rows),
+        "images": len(images),
+        "totals": totals,
+        "budgets": dict(budgets),
+        "over": [ m for m in METRICS if budgets.get(m) and totals[m] > budgets[m] ],
+        "worst": { m: [ { "name": r["name"], "value": r[m] } for r in sorted(rows, key=lambda r: ( -r[m], r["name"] ))[:WORST] if r[m] > 0 ] for m in METRICS },
+        "per_object": rows,
+    }
+
+
+def format_value(metric, value):
+    if metric in ( "texture_bytes", "gltf_bytes" ):
+        return "%.1f MB" % ( value / ( 1 << 20 ) )
+    return "{:,}".format(value)
+
+
+def format_lines(analysis):
+    # panel lines: the totals against the budgets ("!" first when over), then the
+    # heaviest object of every metric, all the listed ones for the metrics over budget
+    lines = []
+    for m in METRICS:
+        limit = analysis["budgets"].get(m)
+        text = LABELS[m] + " " + format_value(m, analysis["totals"][m]) + ( " / " + format_value(m, limit) if limit else "" )
+        lines.append(( "!" if m in analysis["over"] else "" ) + text)
+    for m in METRICS:
+        worst = analysis["worst"][m] if m in analysis["over"] else analysis["worst"][m][:1]
+        for w in worst:
+            lines.append(LABELS[m] + ", heaviest: " + w["name"] + " " + format_value(m, w["value"]))
+    return lines
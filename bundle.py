@@ -0,0 +1,244 @@
+'''
+AFRAME Exporter for Blender - script bundle
+
+Builds the single script of the exported page (js/bundle.<hash>.js): the
+vendored A-Frame builds first when they are enabled, then only the components
+the page uses. webxr.js is split into its AFRAME.registerComponent() blocks,
+the other scripts are kept whole when one of their components is used; the
+code outside the blocks (helpers, shared caches) is always kept. A component
+named in a kept block (setAttribute('gltf-part', ...)) is kept too. The
+sources are minified: comments and indentation removed, line breaks kept where
+the automatic semicolon insertion may need them; the files already minified
+are copied as they are. It does not import bpy.
+'''
+
+import os
+import re
+import hashlib
+import urllib.request
+
+# runtime scripts of resources/, in loading order
+SCRIPTS = ( "webxr.js", "joystick.js", "camera-cube-env.js", "cube-env-map.js" )
+BUNDLE_NAME = "bundle"
+BUNDLE_FILE = re.compile(r"^bundle\.[0-9a-f]{12,}\.js$")
+HASH_LENGTH = 12
+DOWNLOAD_TIMEOUT = 60
+
+COMPONENT = re.compile(r"^AFRAME\.registerComponent\('([\w-]+)'", re.M)
+REGISTERED = re.compile(r"AFRAME\.registerComponent\(\s*['\"]([\w-]+)['\"]")
+# a "/" after them starts a regular expression, not a division
+REGEX_BEFORE = set("(,=:[!&|?{};+-*%<>~^")
+REGEX_KEYWORDS = { "return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw", "instanceof", "yield", "await" }
+# spaces next to them can go, "+ +", "- -", "/ /" and "1 .x" need theirs
+TIGHT = set("{}()[];,:=<>?!&|*%^~")
+LOOSE = set("+-/.")
+# a line ending with them continues on the next one whatever it starts with, a line
+# starting with the others cannot start a statement
+JOINABLE = set("{;,")
+CONTINUATIONS = set("}),;].")
+
+
+def _regex_allowed(code):
+    # code is the minified code before the "/"
+    code = code.rstrip(" \n")
+    if not code or code[-1] in REGEX_BEFORE:
+        return True
+    word = re.search(r"[\w$]*$", code).group()
+    return word in REGEX_KEYWORDS
+
+
+def _literal_end(source, i):
+    # end of the string, template literal or regular expression starting at i
+    quote = source[i]
+    n = len(source)
+    j = i + 1
+    in_class = False
+    while j < n:
+        c = source[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == "\n" and quote != "`":
+            break
+        if quote == "/" and c == "[":
+            in_class = True
+        elif quote == "/" and c == "]":
+            in_class = False
+        elif c == quote and not in_class:
+            break
+        j += 1
+    j += 1
+    if quote == "/":
+        while j < n and source[j].isalpha():
+            j += 1
+    return j
+
+
+def minify_js(source):
+    # comments and indentation removed, the strings, template literals and regular
+    # expressions untouched: they are replaced by markers during the whitespace pass
+    literals = []
+    code = []
+    i = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if source.startswith("//", i):
+            j = source.find("\n", i)
+            i = n if j < 0 else j
+        elif source.startswith("/*", i):
+            j = source.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            # license comments stay, a comment spanning lines still separates them
+            if source.startswith("/*!", i):
+                literals.append(source[i:j])
+                code.append("\0%d\0\n" % ( len(literals) - 1 ))
+            else:
+                code.append("\n" if "\n" in source[i:j] else " ")
+            i = j
+        elif c in "'\"`" or ( c == "/" and _regex_allowed("".join(code[-64:])) ):
+            j = _literal_end(source, i)
+            literals.append(source[i:j])
+            # the marker ends like the literal for the next regular expression test
+            code.append("\0%d\0" % ( len(literals) - 1 ))
+            code.append("a")
+            i = j
+        else:
+            code.append(c)
+            i += 1
+    # the "a" after the markers only served _regex_allowed()
+    text = re.sub("(\0\\d+\0)a", r"\1", "".join(code))
+    lines = [ l.strip(" \t\r\f\v") for l in text.split("\n") ]
+    joined = []
+    for line in lines:
+        if not line:
+            continue
+        line = re.sub(r"[ \t\r\f\v]+", " ", line)
+        if joined and ( joined[-1][-1:] in JOINABLE or line[0] in CONTINUATIONS ):
+            joined[-1] += line
+        else:
+            joined.append(line)
+    text = "\n".join(joined)
+    text = re.sub(r" (?=[^ ])", lambda m: _space(text, m.start()), text)
+    return re.sub("\0(\\d+)\0", lambda m: literals[int(m.group(1))], text)
+
+
+def _space(code, i):
+    before = code[i-1] if i > 0 else ""
+    after = code[i+1] if i + 1 < len(code) else ""
+    if before in LOOSE or after in LOOSE:
+        return " "
+    return "" if before in TIGHT or after in TIGHT else " "
+
+
+def minify_css(source):
+    # comments and whitespace around the punctuation removed
+    source = re.sub(r"/\*.*?\*/", "", source, flags=re.S)
+    source = re.sub(r"\s+", " ", source)
+    source = re.sub(r" ?([{};,>]) ?", r"\1", source)
+    source = re.sub(r"(?<=[{;]) ?([\w-]+) ?: ?", r"\1:", source)
+    return source.replace(";}", "}").strip()
+
+
+def is_minified(source):
+    # long lines: a build of a library, copied as it is
+    lines = source.count("\n") + 1
+    return len(source) / lines > 500
+
+
+def blocks(source):
+    # [ ( component names, text ) ]: the registerComponent blocks of a split script
+    # (from the line starting with it to the next line "});"), names None for the
+    # code outside them
+    result = []
+    lines = source.split("\n")
+    outside = []
+    i = 0
+    while i < len(lines):
+        match = COMPONENT.match(lines[i])
+        if not match:
+            outside.append(lines[i])
+            i += 1
+            continue
+        j = i
+        while j < len(lines) and lines[j] != "});":
+            j += 1
+        result.append(( { match.group(1) }, "\n".join(lines[i:j+1]) ))
+        i = j + 1
+    result.insert(0, ( None, "\n".join(outside) ))
+    return result
+
+
+def units(sources):
+    # [ ( component names or None, text ) ] of { file name: source }, in SCRIPTS order
+    result = []
+    for name in SCRIPTS:
+        if name not in sources:
+            continue
+        source = sources[name]
+        if name == "webxr.js":
+            result += blocks(source)
+        else:
+            result.append(( set(REGISTERED.findall(source)), source ))
+    return result
+
+
+def used_components(page, names):
+    # the component names used as attributes in page
+    return { n for n in names if re.search(r"[\s\"'<]" + re.escape(n) + r"(?=[\s=>/\"'])", page) }
+
+
+def select(page, sources):
+    # the units of sources needed by page: shared code, used components and the
+    # components they name
+    parts = units(sources)
+    names = set().union(*[ n for n, text in parts if n ])
+    used = used_components(page, names)
+    while True:
+        kept = "".join( text for n, text in parts if n and n & used )
+        named = { n for n in names - used if "'" + n + "'" in kept or '"' + n + '"' in kept }
+        if not named:
+            return [ ( n, text ) for n, text in parts if n is None or n & used ], used
+        used |= named
+
+
+def vendor_file(cache, name, url):
+    # path of a pinned build: cached copy, else downloaded. Raises OSError offline
+    path = os.path.join ( cache, name )
+    if not os.path.exists(path):
+        os.makedirs(cache, exist_ok=True)
+        with urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+            data = response.read()
+        with open(path + ".tmp", "wb") as file:
+            file.write(data)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def build(page, sources, vendored = ()):
+    # ( bundle text, used component names ): the vendored files, then the needed code
+    chunks = []
+    for filename in vendored:
+        with open(filename, "r", encoding="utf-8") as file:
+            chunks.append(file.read().strip() + "\n;")
+    selected, used = select(page, sources)
+    for names, text in selected:
+        chunks.append(text if is_minified(text) else minify_js(text))
+    return "\n".join(chunks) + "\n", used
+
+
+def remove_stale(folder, keep = None):
+    # bundles of the previous exports
+    for name in os.listdir(folder):
+        if BUNDLE_FILE.match(name) and name != keep:
+            os.remove(os.path.join ( folder, name ))
+
+
+def write(folder, text):
+    # js/bundle.<hash>.js, the previous bundles removed; returns its name
+    name = BUNDLE_NAME + "." + hashlib.sha1(text.encode("utf-8")).hexdigest()[:HASH_LENGTH] + ".js"
+    remove_stale(folder, name)
+    if not os.path.exists(os.path.join ( folder, name )):
+        with open(os.path.join ( folder, name ), "w", encoding="utf-8") as file:
+            file.write(text)
+    return name
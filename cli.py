@@ -0,0 +1,100 @@
+'''
+AFRAME Exporter for Blender - command line wrapper
+
+Runs the exporter on one or more .blend files with background Blender
+processes, e.g. for CI or render farms:
+
+    python cli.py --jobs 8 --set b_stats=false --output /srv/export scenes/*.blend
+
+Every file is exported by "blender -b <file> --python-expr ..." with the same
+pipeline as the "Export A-Frame Project" button. The summaries are printed as a
+JSON list and the exit status is 0 only if every export succeeded. With more
+than one file every project is named after its .blend file (s_project_name),
+unless the files would be exported to the same folder.
+'''
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from headless import CLI_EXPR, SUMMARY_PREFIX
+
+ADDON_FILE = os.path.join ( os.path.dirname(os.path.realpath(__file__)), "__init__.py" )
+
+
+def export_blend(blender, blend, export_args):
+    cmd = [ blender, "-b", blend, "--python-expr", CLI_EXPR % ADDON_FILE, "--" ] + export_args
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    summary = None
+    for line in process.stdout.splitlines():
+        if line.startswith(SUMMARY_PREFIX):
+            summary = json.loads(line[len(SUMMARY_PREFIX):])
+    if summary is None:
+        summary = { "status": "error", "error": "no summary, blender exit code %d" % process.returncode, "log": process.stdout[-2000:] }
+    summary["blend"] = blend
+    summary["exit_code"] = process.returncode
+    return summary
+
+
+def project_names(blends, settings):
+    # { .blend: s_project_name setting or None }: with several files every project is
+    # named after its .blend, two files may not share a project folder
+    if len(blends) < 2:
+        return { blend: None for blend in blends }
+    if "s_project_name" in settings:
+        raise ValueError("s_project_name is set for %d files: they would overwrite the same project" % len(blends))
+    names = { blend: os.path.splitext(os.path.basename(blend))[0] for blend in blends }
+    seen = {}
+    for blend, name in names.items():
+        if name in seen:
+            raise ValueError("%s and %s would both be exported to the project %s" % ( seen[name], blend, name ))
+        seen[name] = blend
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export .blend files to A-Frame projects with background Blender processes")
+    parser.add_argument("blend", nargs="+", help=".blend files to export")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"), help="Blender executable (default: $BLENDER or blender)")
+    parser.add_argument("--jobs", type=int, default=1, help="number of files exported at the same time")
+    parser.add_argument("--config", help="JSON file with the exporter settings")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="exporter setting, overrides --config")
+    parser.add_argument("--output", help="export directory (export_path setting)")
+    parser.add_argument("--summary", help="write the JSON summaries to this file")
+    args = parser.parse_args(argv)
+
+    settings = {}
+    if args.config:
+        with open(args.config, "r") as file:
+            settings.update(json.load(file))
+    settings.update( item.partition("=")[0::2] for item in args.set )
+    try:
+        names = project_names(args.blend, settings)
+    except ValueError as e:
+        print("error: %s" % e, file=sys.stderr)
+        return 2
+
+    export_args = []
+    if args.config:
+        export_args += [ "--config", os.path.abspath(args.config) ]
+    for item in args.set:
+        export_args += [ "--set", item ]
+    if args.output:
+        export_args += [ "--output", os.path.abspath(args.output) ]
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        summaries = list(pool.map(lambda blend: export_blend(args.blender, blend, export_args + ( [ "--set", "s_project_name=" + names[blend] ] if names[blend] else [] )), args.blend))
+
+    report = json.dumps(summaries, indent=1)
+    print(report)
+    if args.summary:
+        with open(args.summary, "w") as file:
+            file.write(report)
+    return 0 if all(s.get("status") == "ok" for s in summaries) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+'''
+AFRAME Exporter for Blender - glTF mesh compression
+
+Optional stage run on the exported glTF files (see process_gltf_output() in
+__init__.py). Pure Python and NumPy, it does not import bpy:
+
+- triangles are reordered for the GPU post-transform vertex cache (Tipsify,
+  Sander, Nehab and Barczak 2007) and vertices in the order of first use
+- positions are quantized to 16 bit integers, the dequantization scale is
+  moved to the mesh node; normals and tangents to 8 bit, texture
+  coordinates in [0, 1] to 16 bit, as allowed by KHR_mesh_quantization
+- 32 bit indices are narrowed to 16 bit when the vertices fit
+
+The quantized attributes are read natively by the three.js GLTFLoader of
+A-Frame 1.1+ (three r123); the stage is skipped for older A-Frame versions.
+benchmarks/bench_compression.py measures the savings on synthetic meshes.
+'''
+
+import numpy as np
+
+QUANTIZATION_EXTENSION = "KHR_mesh_quantization"
+CACHE_SIZE = 16
+
+BYTE = 5120
+UNSIGNED_BYTE = 5121
+SHORT = 5122
+UNSIGNED_SHORT = 5123
+UNSIGNED_INT = 5125
+FLOAT = 5126
+COMPONENT_TYPES = { BYTE: np.int8, UNSIGNED_BYTE: np.uint8, SHORT: np.int16, UNSIGNED_SHORT: np.uint16, UNSIGNED_INT: np.uint32, FLOAT: np.float32 }
+TYPE_SIZES = { "SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4 }
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+TRIANGLES = 4
+
+
+def read_accessor(gltf, binary, index):
+    # (count, components) array of a dense accessor, None for sparse or unsupported ones
+    accessor = gltf["accessors"][index]
+    if "sparse" in accessor or "bufferView" not in accessor or accessor["type"] not in TYPE_SIZES:
+        return None
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    dtype = np.dtype(COMPONENT_TYPES[accessor["componentType"]])
+    components = TYPE_SIZES[accessor["type"]]
+    stride = view.get("byteStride", dtype.itemsize * components)
+    offset = view.get("byteOffset", 0) + accessor.get("byteOffset", 0)
+    return np.ndarray(( accessor["count"], components ), dtype=dtype, buffer=binary, offset=offset, strides=( stride, dtype.itemsize )).copy()
+
+
+def tipsify(indices, vertex_count, cache_size = CACHE_SIZE):
+    # triangle order for a FIFO vertex cache of cache_size entries
+    triangles = len(indices) // 3
+    flat = indices.tolist()
+    counts = np.bincount(indices, minlength=vertex_count)
+    offsets = np.concatenate(( [ 0 ], np.cumsum(counts) )).tolist()
+    adjacency = np.repeat(np.arange(triangles), 3)[np.argsort(indices, kind="stable")].tolist()
+    live = counts.tolist()
+    cache_time = [ 0 ] * vertex_count
+    emitted = bytearray(triangles)
+    dead_end = []
+    order = []
+    stamp = cache_size + 1
+    cursor = 0
+    fanning = 0 if vertex_count else -1
+    while fanning >= 0:
+        candidates = []
+        for t in adjacency[offsets[fanning]:offsets[fanning+1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = 1
+            order.append(t)
+            for v in flat[3*t:3*t+3]:
+                dead_end.append(v)
+                candidates.append(v)
+                live[v] -= 1
+                if stamp - cache_time[v] > cache_size:
+                    cache_time[v] = stamp
+                    stamp += 1
+        # next fanning vertex: still used and likely to stay in the cache
+        fanning = -1
+        best = -1
+        for v in candidates:
+            if live[v] > 0:
+                priority = 0
+                if stamp - cache_time[v] + 2 * live[v] <= cache_size:
+                    priority = stamp - cache_time[v]
+                if priority > best:
+                    best = priority
+                    fanning = v
+        if fanning < 0:
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    fanning = v
+                    break
+        if fanning < 0:
+            while cursor < vertex_count and live[cursor] == 0:
+                cursor += 1
+            if cursor < vertex_count:
+                fanning = cursor
+    return np.array(order, dtype=np.int64)
+
+
+def cache_miss_ratio(indices, cache_size = CACHE_SIZE):
+    # average cache miss ratio (vertices transformed per triangle) of a FIFO cache
+    cache = []
+    misses = 0
+    for v in indices.tolist():
+        if v not in cache:
+            misses += 1
+            cache.append(v)
+            if len(cache) > cache_size:
+                cache.pop(0)
+    return misses / max(1, len(indices) // 3)
+
+
+def _quantize_attribute(semantic, values, position_scale):
+    # returns ( data, componentType, normalized, byteStride ) or None to keep the values
+    if values.dtype != np.float32:
+        return None
+    count = len(values)
+    if semantic == "POSITION" and position_scale:
+        data = np.zeros(( count, 4 ), dtype=np.int16)
+        data[:, :3] = np.round(values * (32767.0 / position_scale))
+        return data, SHORT, False, 8
+    if semantic == "NORMAL":
+        data = np.zeros(( count, 4 ), dtype=np.int8)
+        data[:, :3] = np.round(np.clip(values, -1.0, 1.0) * 127.0)
+        return data, BYTE, True, 4
+    if semantic == "TANGENT":
+        return np.round(np.clip(values, -1.0, 1.0) * 127.0).astype(np.int8), BYTE, True, 4
+    if semantic.startswith("TEXCOORD_") and count and values.min() >= 0.0 and values.max() <= 1.0:
+        return np.round(values * 65535.0).astype(np.uint16), UNSIGNED_SHORT, True, 4
+    return None
+
+
+def _padded(data):
+    # vertex attribute rows aligned to 4 bytes, returns ( data, byteStride or None )
+    row = data.itemsize * data.shape[1]
+    if row % 4 == 0:
+        return data, None
+    padding = (-row % 4) // data.itemsize
+    return np.concatenate(( data, np.zeros(( len(data), padding ), dtype=data.dtype) ), axis=1), row + padding * data.itemsize
+
+
+def _eligible(gltf, binary, primitive, usage):
+    # triangles without morph targets, every accessor dense and used by this primitive only
+    accessors = list(primitive["attributes"].values()) + ( [ primitive["indices"] ] if "indices" in primitive else [] )
+    if primitive.get("mode", TRIANGLES) != TRIANGLES or primitive.get("targets") or any(usage[a] != 1 for a in accessors):
+        return False
+    return all(read_accessor(gltf, binary, a) is not None for a in accessors)
+
+
+def _position_scales(gltf, binary, eligible):
+    # mesh -> largest absolute coordinate, for the meshes whose node can carry the
+    # dequantization scale: a single node without scale, matrix, skin or children,
+    # every primitive eligible
+    nodes = {}
+    for node in gltf.get("nodes", []):
+        if "mesh" in node:
+            nodes.setdefault(node["mesh"], []).append(node)
+    scales = {}
+    for index, mesh in enumerate(gltf.get("meshes", [])):
+        users = nodes.get(index, [])
+        if len(users) != 1 or any(key in users[0] for key in ( "scale", "matrix", "skin", "children" )):
+            continue
+        largest = 0.0
+        for primitive in mesh["primitives"]:
+            accessor = primitive["attributes"].get("POSITION")
+            values = read_accessor(gltf, binary, accessor) if accessor is not None and id(primitive) in eligible else None
+            if values is None or values.dtype != np.float32:
+                largest = 0.0
+                break
+            if len(values):
+                largest = max(largest, float(np.abs(values).max()))
+        if largest > 0.0:
+            scales[index] = ( largest, users[0] )
+    return scales
+
+
+def compress(gltf, binary):
+    # compresses the meshes of a single buffer glTF in place, returns the new buffer
+    if len(gltf.get("buffers", [])) != 1 or gltf.get("extensionsUsed") and any(e in gltf["extensionsUsed"] for e in ( "KHR_draco_mesh_compression", "EXT_meshopt_compression" )):
+        return binary
+    usage = {}
+    for mesh in gltf.get("meshes", []):
+        for primitive in mesh["primitives"]:
+            accessors = list(primitive["attributes"].values()) + [ a for target in primitive.get("targets", []) for a in target.values() ]
+            if "indices" in primitive:
+                accessors.append(primitive["indices"])
+            for a in accessors:
+                usage[a] = usage.get(a, 0) + 1
+    eligible = { id(p) for mesh in gltf.get("meshes", []) for p in mesh["primitives"] if _eligible(gltf, binary, p, usage) }
+    position_scales = _position_scales(gltf, binary, eligible)
+    views = gltf["bufferViews"]
+    new_data = {}
+    quantized = False
+
+    def add_view(data, target, stride = None):
+        view = { "buffer": 0, "byteLength": data.nbytes, "target": target }
+        if stride:
+            view["byteStride"] = stride
+        views.append(view)
+        new_data[len(views) - 1] = np.ascontiguousarray(data).tobytes()
+        return len(views) - 1
+
+    for mesh_index, mesh in enumerate(gltf.get("meshes", [])):
+        position_scale = position_scales.get(mesh_index, ( 0.0, None ))[0]
+        for primitive in mesh["primitives"]:
+            if id(primitive) not in eligible:
+                continue
+            attributes = primitive["attributes"]
+            values = { semantic: read_accessor(gltf, binary, a) for semantic, a in attributes.items() }
+            vertex_count = gltf["accessors"][attributes["POSITION"]]["count"] if "POSITION" in attributes else 0
+
+            indices = None
+            if "indices" in primitive:
+                indices = read_accessor(gltf, binary, primitive["indices"])
+            if indices is not None and vertex_count:
+                indices = indices.ravel().astype(np.int64)
+                indices = indices.reshape(-1, 3)[tipsify(indices, vertex_count)].ravel()
+                # vertices in the order of their first use, unused ones last
+                used, first = np.unique(indices, return_index=True)
+                order = np.concatenate(( used[np.argsort(first)], np.setdiff1d(np.arange(vertex_count), used) ))
+                remap = np.empty(vertex_count, dtype=np.int64)
+                remap[order] = np.arange(vertex_count)
+                indices = remap[indices]
+                values = { semantic: v[order] for semantic, v in values.items() }
+                accessor = gltf["accessors"][primitive["indices"]]
+                accessor["componentType"] = UNSIGNED_SHORT if vertex_count <= 65535 else UNSIGNED_INT
+                accessor["bufferView"] = add_view(indices.astype(COMPONENT_TYPES[accessor["componentType"]]), ELEMENT_ARRAY_BUFFER)
+                accessor.pop("byteOffset", None)
+
+            for semantic, a in attributes.items():
+                accessor = gltf["accessors"][a]
+                result = _quantize_attribute(semantic, values[semantic], position_scale)
+                if result is None:
+                    data, stride = _padded(values[semantic])
+                else:
+                    data, component_type, normalized, stride = result
+                    accessor["componentType"] = component_type
+                    if normalized:
+                        accessor["normalized"] = True
+                    if semantic == "POSITION":
+                        accessor["min"] = data[:, :3].min(axis=0).tolist()
+                        accessor["max"] = data[:, :3].max(axis=0).tolist()
+                    else:
+                        accessor.pop("min", None)
+                        accessor.pop("max", None)
+                    quantized = True
+                accessor["bufferView"] = add_view(data, ARRAY_BUFFER, stride)
+                accessor.pop("byteOffset", None)
+
+    for largest, node in position_scales.values():
+        node["scale"] = [ largest / 32767.0 ] * 3
+    if quantized:
+        for key in ( "extensionsUsed", "extensionsRequired" ):
+            gltf[key] = sorted(set(gltf.get(key, [])) | { QUANTIZATION_EXTENSION })
+    return repack(gltf, binary, new_data)
+
+
+def _referenced_views(node, found):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "bufferView" and isinstance(value, int):
+                found.add(value)
+            else:
+                _referenced_views(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            _referenced_views(value, found)
+    return found
+
+def _remap_views(node, mapping):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "bufferView" and isinstance(value, int):
+                node[key] = mapping[value]
+            else:
+                _remap_views(value, mapping)
+    elif isinstance(node, list):
+        for value in node:
+            _remap_views(value, mapping)
+
+
+def repack(gltf, binary, new_data):
+    # one buffer with the views still referenced, old ones read from binary
+    views = gltf["bufferViews"]
+    referenced = _referenced_views({ k: v for k, v in gltf.items() if k != "bufferViews" }, set())
+    packed = bytearray()
+    kept = []
+    mapping = {}
+    for index, view in enumerate(views):
+        if index not in referenced:
+            continue
+        if index in new_data:
+            chunk = new_data[index]
+        else:
+            start = view.get("byteOffset", 0)
+            chunk = binary[start:start+view["byteLength"]]
+        packed += b"\0" * (-len(packed) % 4)
+        view["byteOffset"] = len(packed)
+        packed += chunk
+        mapping[index] = len(kept)
+        kept.append(view)
+    gltf["bufferViews"] = kept
+    _remap_views({ k: v for k, v in gltf.items() if k != "bufferViews" }, mapping)
+    gltf["buffers"][0]["byteLength"] = len(packed)
+    return bytes(packed)
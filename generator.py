@@ -0,0 +1,643 @@
+'''
+AFRAME Exporter for Blender - index.html generator
+
+Pure Python second stage of the export: it turns a SceneDescription, extracted
+from Blender by export_project() in __init__.py, into the index.html page and
+the list of referenced assets. It does not import bpy, so it can be profiled,
+benchmarked (see benchmarks/) and replayed from a saved description:
+
+    python generator.py scene_description.json index.html
+'''
+
+import os
+import re
+import sys
+import json
+import math
+from collections import namedtuple
+from string import Template
+
+COMBINED_SCENE_ID = "combined_scene"
+# objects with these custom properties are shown as a-video / a-image, not as a glTF model
+MEDIA_PROPERTIES = ( "AFRAME_VIDEO", "AFRAME_IMAGES" )
+# position of the #player entity of the template, the camera is f_player_height above it
+PLAYER_POSITION = ( 0.0, -0.2, 0.0 )
+# models loaded by the progressive-loader component after the scene start
+STREAM_MANIFEST = "stream.json"
+# cells of the spatial-cells component, a glTF file per cell in assets/
+CELL_INDEX = "cells.json"
+CELL_PREFIX = "cell_"
+# pinned builds of the page libraries, {version} is s_aframe_version
+AFRAME_URL = "https://aframe.io/releases/{version}/aframe.min.js"
+EXTRAS_URL = "https://cdn.jsdelivr.net/gh/donmccurdy/aframe-extras@v6.1.0/dist/aframe-extras.min.js"
+EXTRAS_FILE = "aframe-extras-6.1.0.min.js"
+# Basis Universal transcoder of the KTX2 textures, copied to BASIS_PATH at export;
+# the gltf-model system of A-Frame 1.3+ reads basisTranscoderPath
+BASIS_FILES = ( "basis_transcoder.js", "basis_transcoder.wasm" )
+BASIS_PATH = "js/basis/"
+KTX2_AFRAME_VERSION = ( 1, 3 )
+# KHR_mesh_quantization is read by the GLTFLoader of A-Frame 1.1+ (three r123), not by 1.0.x (r111)
+QUANTIZATION_AFRAME_VERSION = ( 1, 1 )
+# replaced by the script tag of the bundle once it is built (see bundle.py)
+BUNDLE_MARKER = "<!-- bundle -->"
+# preloaded assets of <a-assets>, the first ones in the page
+PRELOAD_LIMIT = 16
+PRELOAD_SOURCE = re.compile(r'<(a-asset-item|img)\b[^>]*\bsrc="([^"]+)"')
+# lights: custom property of the lights kept at run time when the scene is baked,
+# default light rig of the template (sun toward the origin), meters around the scene
+# bounds in the shadow camera
+DYNAMIC_LIGHT = "AFRAME_DYNAMIC"
+DEFAULT_SUN = ( 1.36586, 7.17965, 1.0 )
+SHADOW_MARGIN = 1.0
+
+# position / rotation (degrees, YXZ) / scale are the A-Frame (Y up) world transform
+# computed by transforms.py, properties are the (key, value) custom properties in
+# Blender order, lightmap is the matching file in lightmaps/, asset the glTF file in assets/,
+# instanced objects share their asset and are drawn by a single gltf-instances entity,
+# lods are the glTF files of the lower levels of detail in assets/, lightmap_uv the
+# ( offset x, offset y, scale x, scale y ) of the object in its lightmap atlas, radius the
+# bounding sphere (around the origin of the object) in meters. The reflection cubemaps
+# of Blender are objects of type 'LIGHT_PROBE' without asset
+SceneObject = namedtuple("SceneObject", [ "name", "type", "position", "rotation", "scale", "properties", "lightmap", "asset", "combined", "instanced", "lods", "lightmap_uv", "radius" ])
+
+# type is the A-Frame light type (ambient, directional, point, spot), position the
+# A-Frame world position, direction the unit vector the light shines along, color
+# "#rrggbb" (sRGB), intensity in three.js units, distance the range (0 unlimited),
+# angle the spot half angle in degrees, penumbra 0 - 1, shadow the Blender shadow
+# switch, static False for the lights with the DYNAMIC_LIGHT property
+SceneLight = namedtuple("SceneLight", [ "name", "type", "position", "direction", "color", "intensity", "distance", "angle", "penumbra", "shadow", "static" ])
+
+# settings are the exporter scene properties, template the index.html template,
+# lights the Blender lights and the world ambient
+SceneDescription = namedtuple("SceneDescription", [ "settings", "objects", "template", "lights" ], defaults=( (), ))
+
+
+def lightmap_index(files):
+    # "<object name>_baked.<ext>" -> file name, built once per export for exact lookups
+    index = {}
+    for file in sorted(files):
+        stem = os.path.splitext(file)[0]
+        if stem.endswith("_baked"):
+            index.setdefault(stem[:-len("_baked")], file)
+    return index
+
+
+def parse_numbers(text):
+    # "10, 25" or "10 25" -> [ 10.0, 25.0 ], anything else is ignored
+    numbers = []
+    for v in re.split("[,\\s]+", text.strip()):
+        try:
+            numbers.append(float(v))
+        except ValueError:
+            pass
+    return numbers
+
+
+def exports_gltf(obj_type, keys):
+    return obj_type in ( 'MESH', 'EMPTY' ) and not any(K in MEDIA_PROPERTIES for K in keys)
+
+
+def description_to_dict(description):
+    return {
+        "settings": description.settings,
+        "objects": [ o._asdict() for o in description.objects ],
+        "template": description.template,
+        "lights": [ l._asdict() for l in description.lights ],
+    }
+
+def description_from_dict(data):
+    objects = []
+    for o in data["objects"]:
+        o = dict(o)
+        for key in ( "position", "rotation", "scale" ):
+            o[key] = tuple(o[key])
+        o["properties"] = tuple( tuple(p) for p in o["properties"] )
+        o["lods"] = tuple(o["lods"])
+        if o["lightmap_uv"] is not None:
+            o["lightmap_uv"] = tuple(o["lightmap_uv"])
+        o.setdefault("radius", 0.0)
+        objects.append(SceneObject(**o))
+    lights = []
+    for l in data.get("lights", []):
+        l = dict(l)
+        l["position"] = tuple(l["position"])
+        l["direction"] = tuple(l["direction"])
+        lights.append(SceneLight(**l))
+    return SceneDescription(settings=data["settings"], objects=tuple(objects), template=data["template"], lights=tuple(lights))
+
+def save_description(description, filename):
+    with open(filename, "w") as file:
+        json.dump(description_to_dict(description), file)
+
+def load_description(filename):
+    with open(filename, "r") as file:
+        return description_from_dict(json.load(file))
+
+
+def format_number(value, precision):
+    # fixed point without trailing zeros: 1.5, 0, -2.25
+    text = "%.*f" % ( precision, value )
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+def format_vector(values, precision):
+    return " ".join( format_number(v, precision) for v in values )
+
+
+def spawn_position(settings):
+    # camera position at the scene start
+    x, y, z = PLAYER_POSITION
+    return ( x, y + settings["f_player_height"], z )
+
+def stream_priority(obj, eye):
+    # apparent size seen from eye: bounding radius over the distance to the bounding sphere
+    distance = math.sqrt(sum( ( p - e ) ** 2 for p, e in zip(obj.position, eye) ))
+    return obj.radius / max(distance - obj.radius, 0.01)
+
+def shows_model(obj):
+    # the entity shows the glTF model of the object
+    if obj.type != 'MESH' or not obj.asset:
+        return False
+    return not any(K in MEDIA_PROPERTIES or K == "AFRAME_NOGLTF" for K, value in obj.properties)
+
+def streamable(obj):
+    # glTF models in their own file, the shared files (combined scene, instances) are
+    # needed by many entities and stay in the blocking assets
+    return shows_model(obj) and not obj.combined and not obj.instanced
+
+def streamed_objects(description):
+    # the streamable objects in loading order, except the i_blocking_assets largest on
+    # screen from the spawn point, which are loaded before the scene starts
+    settings = description.settings
+    if not settings["b_progressive"]:
+        return []
+    eye = spawn_position(settings)
+    ranked = sorted(( o for o in description.objects if streamable(o) ), key=lambda o: ( -stream_priority(o, eye), o.name ))
+    return ranked[max(0, settings["i_blocking_assets"]):]
+
+def stream_manifest(description):
+    # content of STREAM_MANIFEST, the loader picks the closest entity to the camera first
+    precision = description.settings["i_precision"]
+    return { "entities": [ {
+        "id": obj.name,
+        "src": "./assets/"+obj.asset,
+        "position": [ round(v, precision) for v in obj.position ],
+        "radius": round(obj.radius, precision),
+    } for obj in streamed_objects(description) ] }
+
+
+def _distance2(a, b):
+    return sum( ( x - y ) ** 2 for x, y in zip(a, b) )
+
+def nearest(points, position):
+    return min(range(len(points)), key=lambda i: ( _distance2(points[i], position), i ))
+
+def cluster_positions(positions, count, iterations = 20):
+    # k-means centers of positions, seeded by farthest points from the first one
+    centers = [ tuple(positions[0]) ]
+    while len(centers) < min(count, len(positions)):
+        centers.append(tuple(max(positions, key=lambda p: min( _distance2(p, c) for c in centers ))))
+    for i in range(iterations):
+        groups = [ [] for c in centers ]
+        for p in positions:
+            groups[nearest(centers, p)].append(p)
+        moved = [ tuple( sum(v) / len(g) for v in zip(*g) ) if g else c for g, c in zip(groups, centers) ]
+        if moved == centers:
+            break
+        centers = moved
+    return centers
+
+def reflection_probes(description):
+    # ( probe positions, { object name: probe index } ) of the reflective objects
+    # (AFRAME_CUBEMAP): the reflection cubemaps of the Blender scene when it has some,
+    # else the centers of at most i_probe_count clusters of the objects
+    reflective = [ o for o in description.objects if o.type != 'LIGHT_PROBE' and any(K == "AFRAME_CUBEMAP" for K, value in o.properties) ]
+    if not reflective:
+        return [], {}
+    probes = [ o.position for o in description.objects if o.type == 'LIGHT_PROBE' ]
+    if not probes:
+        probes = cluster_positions([ o.position for o in reflective ], max(1, description.settings["i_probe_count"]))
+    assignment = { o.name: nearest(probes, o.position) for o in reflective }
+    # the probes without objects are left out
+    used = sorted(set(assignment.values()))
+    return [ probes[i] for i in used ], { name: used.index(i) for name, i in assignment.items() }
+
+
+def cell_name(position, size):
+    # uniform grid on the ground plane (A-Frame X / Z), at least 1 cm
+    size = max(size, 0.01)
+    return CELL_PREFIX + "%d_%d" % ( math.floor(position[0] / size), math.floor(position[2] / size) )
+
+def cell_index(description):
+    # content of CELL_INDEX: bounds (objects bounding spheres) and objects of every cell,
+    # the objects sharing a cell file are the combined objects of a spatial cells export
+    precision = description.settings["i_precision"]
+    cells = {}
+    for obj in description.objects:
+        if obj.combined and shows_model(obj):
+            cells.setdefault(obj.asset, []).append(obj)
+    index = []
+    for asset, objects in sorted(cells.items()):
+        low = [ min( o.position[i] - o.radius for o in objects ) for i in range(3) ]
+        high = [ max( o.position[i] + o.radius for o in objects ) for i in range(3) ]
+        index.append({
+            "id": os.path.splitext(asset)[0],
+            "src": "./assets/"+asset,
+            "bounds": [ [ round(v, precision) for v in low ], [ round(v, precision) for v in high ] ],
+            "objects": [ o.name for o in objects ],
+        })
+    return { "size": description.settings["f_cell_size"], "cells": index }
+
+
+def generate_entities(description):
+    settings = description.settings
+    assets = []
+    entities = []
+    videocount=0
+    imagecount=0
+    scalefactor = 2
+    combined_asset = None
+    instances = {}
+    precision = settings["i_precision"]
+    lod_distances = " ".join( format_number(d, precision) for d in parse_numbers(settings["s_lod_distances"]) )
+    streamed = { obj.name for obj in streamed_objects(description) }
+    probes, probe_of = [], {}
+    if settings["b_cubemap"] and settings["b_camera_cube"] and settings["b_reflection_probes"]:
+        probes, probe_of = reflection_probes(description)
+
+    for obj in description.objects:
+        if obj.type == 'LIGHT_PROBE':
+            continue
+        if obj.instanced:
+            instances.setdefault(obj.asset, []).append(obj)
+            continue
+        actualposition = format_vector(obj.position, precision)
+        actualrotation = format_vector(obj.rotation, precision)
+        # a-video / a-image are 1x1, the Blender plane they replace is 2x2
+        actualscale = format_vector(( scalefactor*s for s in obj.scale ), precision)
+        modelscale = format_vector(obj.scale, precision)
+
+        # custom aframe code read from CUSTOM PROPERTIES
+        reflections = ""
+        animation = ""
+        link = ""
+        baked = ""
+        custom = ""
+        toggle = ""
+        lod = ""
+        video = False
+        image = False
+        tag = "entity"
+        gltf_model = 'gltf-model="#'+obj.name+'"'
+        if obj.type == 'EMPTY':
+            gltf_model = ''
+
+        for K, value in obj.properties:
+            if K == "AFRAME_CUBEMAP" and settings["b_cubemap"]:
+                if obj.name in probe_of:
+                    reflections = ' probe-env="probe: #reflection_probe_'+str(probe_of[obj.name])+'" '
+                elif settings["b_camera_cube"]:
+                    reflections = ' geometry="" camera-cube-env="distance: 500; resolution: 512; repeat: true; interval: 400" '
+                else:
+                    reflections = ' geometry="" cube-env-map="path: '+settings["s_cubemap_path"]+'; extension: '+settings["s_cubemap_ext"]+'; reflectivity: 0.99;" '
+            elif K == "AFRAME_ANIMATION":
+                animation = ' animation= "'+value+'" '
+            elif K == "AFRAME_HTTP_LINK":
+                link = ' link-handler="target: '+value+'" class="clickable" '
+            elif K == "AFRAME_VIDEO":
+                assets.append('\n\t\t\t\t<video id="video_'+str(videocount)+'" loop="true" autoplay="true" src="./media/'+value+'"></video>')
+                entities.append('\n\t\t\t<a-video id="#v_'+str(videocount)+'" src="#video_'+str(videocount)+'" width="1" height="1" scale="'+actualscale+'" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: false" '+animation+link+'></a-video>')
+                video = True
+                videocount = videocount +1
+            elif K == "AFRAME_IMAGES":
+                image = True
+                imagecount = imagecount +1
+                json_dictionary = json.loads(value)
+                for key in json_dictionary:
+                    assets.append('\n\t\t\t\t<img id="image_'+key+'" src="./media/'+json_dictionary[key]+'"></img>')
+                entities.append('\n\t\t\t<a-image images-handler id="#i_'+str(imagecount)+'" src="#image_'+key+'" class="clickable" width="1" height="1" scale="'+actualscale+'" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: false"></a-image>')
+            elif K == "AFRAME_SHOW_HIDE_OBJECT":
+                toggle = ' toggle-handler="target: #'+value+';" class="clickable" '
+            elif K == "AFRAME_TAG":
+                tag = value
+            elif K == "AFRAME_NOGLTF":
+                gltf_model = ""
+            elif K.startswith('AFRAME_'):
+                attr   = K.split("AFRAME_")[1].lower()
+                custom = custom+' '+attr+'="'+str(value)+'"'
+
+        if video == False and image == False:
+            if obj.lods:
+                lod = ' lod-levels="levels: '+" ".join( "./assets/"+f for f in obj.lods )+'; distances: '+lod_distances+'" '
+            if obj.lightmap:
+                atlas_region = ""
+                if obj.lightmap_uv:
+                    atlas_region = '; offset: '+format_vector(obj.lightmap_uv[:2], 6)+'; repeat: '+format_vector(obj.lightmap_uv[2:], 6)
+                encoding = '; encoding: rgbm' if settings["e_lightmap_format"] == 'RGBM' else ''
+                baked = 'light-map-geometry="path: lightmaps/'+obj.lightmap+'; intensity: '+str(settings["f_lightMapIntensity"])+atlas_region+encoding+'"'
+            if obj.combined and settings["b_spatial_cells"]:
+                # the node of the cell file is set by spatial-cells near the player
+                gltf_model = ''
+            elif obj.combined:
+                # the entity points at its node in the shared file
+                combined_asset = obj.asset
+                if gltf_model:
+                    gltf_model = 'gltf-part="src: #'+COMBINED_SCENE_ID+'; part: '+obj.name+'"'
+            elif obj.name in streamed:
+                # the model is set by progressive-loader
+                gltf_model = ''
+            else:
+                assets.append('\n\t\t\t\t<a-asset-item id="'+obj.name+'" src="./assets/'+obj.asset+'"></a-asset-item>')
+            if settings["b_cast_shadows"]:
+                entities.append('\n\t\t\t<a-'+tag+' id="#'+obj.name+'" '+gltf_model+' scale="'+modelscale+'" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: true" '+reflections+animation+link+custom+toggle+lod+'></a-'+tag+'>')
+            else:
+                entities.append('\n\t\t\t<a-'+tag+' id="#'+obj.name+'" '+gltf_model+' '+baked+' scale="'+modelscale+'" position="'+actualposition+'" rotation="'+actualrotation+'" visible="true" shadow="cast: false" '+reflections+animation+link+custom+toggle+lod+'></a-'+tag+'>')
+
+    # one entity per instanced mesh: "x y z rx ry rz sx sy sz" for every object
+    for asset, objects in instances.items():
+        asset_id = os.path.splitext(asset)[0]
+        assets.append('\n\t\t\t\t<a-asset-item id="'+asset_id+'" src="./assets/'+asset+'"></a-asset-item>')
+        transforms = ", ".join( format_vector(obj.position + obj.rotation + obj.scale, precision) for obj in objects )
+        entities.append('\n\t\t\t<a-entity id="#'+asset_id+'" gltf-instances="src: #'+asset_id+'; instances: '+transforms+'" visible="true" shadow="cast: '+str(settings["b_cast_shadows"]).lower()+'"></a-entity>')
+
+    # shared cube cameras of the reflective objects, rendered by reflection-probes
+    for i, position in enumerate(probes):
+        entities.append('\n\t\t\t<a-entity id="reflection_probe_'+str(i)+'" reflection-probe="resolution: '+str(settings["i_probe_resolution"])+'" position="'+format_vector(position, precision)+'"></a-entity>')
+
+    if combined_asset:
+        assets.append('\n\t\t\t\t<a-asset-item id="'+COMBINED_SCENE_ID+'" src="./assets/'+combined_asset+'"></a-asset-item>')
+    return assets, entities
+
+
+def script_tag(src):
+    return '<script src="'+src+'"></script>'
+
+def version_tuple(version):
+    # "1.0.4" -> ( 1, 0, 4 ), the non numeric parts ("1.4.0-rc") are ignored
+    return tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+
+def ktx2_supported(settings):
+    return version_tuple(settings["s_aframe_version"]) >= KTX2_AFRAME_VERSION
+
+def quantization_supported(settings):
+    return version_tuple(settings["s_aframe_version"]) >= QUANTIZATION_AFRAME_VERSION
+
+def cdn_scripts(settings):
+    return "\n        ".join(( script_tag(AFRAME_URL.format(version=settings["s_aframe_version"])), script_tag(EXTRAS_URL) ))
+
+def page_scripts(settings):
+    # runtime scripts of resources/ used by the page, without bundling
+    scripts = [ "webxr.js" ]
+    if settings["b_joystick"]:
+        scripts.append("joystick.js")
+    if settings["b_cubemap"]:
+        if not settings["b_camera_cube"]:
+            scripts.append("cube-env-map.js")
+        elif not settings["b_reflection_probes"]:
+            scripts.append("camera-cube-env.js")
+    return scripts
+
+def preload_hints(assets, settings):
+    # the page discovers <a-assets> only once A-Frame runs: the downloads start with the head
+    links = []
+    for tag in assets:
+        match = PRELOAD_SOURCE.search(tag)
+        if match and len(links) < PRELOAD_LIMIT:
+            kind = 'as="fetch" crossorigin="anonymous"' if match.group(1) == "a-asset-item" else 'as="image"'
+            links.append('<link rel="preload" href="'+match.group(2)+'" '+kind+'>')
+    if settings["b_show_env_sky"]:
+        links.append('<link rel="preload" href="./resources/sky.jpg" as="image">')
+    if not ( settings["b_bundle_scripts"] and settings["b_vendor_aframe"] ):
+        links += [ '<link rel="preconnect" href="https://aframe.io">', '<link rel="preconnect" href="https://cdn.jsdelivr.net">' ]
+    return "\n        ".join(links)
+
+
+def template_values(settings):
+    # every template placeholder except ${asset}, ${entity} and ${preload}
+    # scene
+    if settings["b_stats"]:
+        showstats = "stats"
+    else:
+        showstats = ""
+
+    # joystick
+    if settings["b_joystick"]:
+        showjoystick = "joystick"
+    else:
+        showjoystick = ""
+
+    if settings["b_raycast"]:
+        raycaster='raycaster = "far: '+str(settings["f_raycast_length"])+'; interval: '+str(settings["f_raycast_interval"])+'; objects: .clickable,.links"'
+    else:
+        raycaster=""
+
+    #vr_controllers
+    if settings["b_vr_controllers"]:
+        showvr_controllers = '<a-entity id="leftHand" oculus-touch-controls="hand: left" vive-controls="hand: left"></a-entity>\n\t\t\t\t\t<a-entity id="rightHand" laser-controls oculus-touch-controls="hand: right" vive-controls="hand: right" '+raycaster+'></a-entity>'
+    else:
+        showvr_controllers = ""
+
+    #shadows
+    if settings["b_cast_shadows"]:
+        showcast_shadows = "true"
+        template_render_shadows = 'shadow="type: pcfsoft; autoUpdate: true;"'
+    else:
+        showcast_shadows = "false"
+        template_render_shadows = 'shadow="type: basic; autoUpdate: false;"'
+
+    # Sky
+    if settings["b_show_env_sky"]:
+        show_env_sky = '<a-sky src="#sky" material="" geometry="" rotation="0 90 0"></a-sky>'
+    else:
+        show_env_sky = '<a-sky color="#ECECEC"></a-sky>'
+
+    # if use bake, the light should have intensity near zero
+    if settings["b_use_lightmapper"]:
+        light_directional_intensity = "0"
+        light_ambient_intensity = "0.1"
+    else:
+        light_directional_intensity = "1.0"
+        light_ambient_intensity = "1.0"
+
+    #Renderer
+    showrenderer = 'renderer="antialias: '+str(settings["b_aa"]).lower()+'; colorManagement: '+str(settings["b_colorManagement"]).lower()+'; physicallyCorrectLights: '+str(settings["b_physicallyCorrectLights"]).lower()+';"'
+    if settings["b_live_sync"] and not settings["b_production"]:
+        # updates pushed by the preview server
+        showrenderer += ' live-sync'
+    if settings["b_optimize_textures"] and settings["b_ktx2"] and ktx2_supported(settings):
+        # KTX2 textures (KHR_texture_basisu) need the Basis Universal transcoder,
+        # its copy in BASIS_PATH, or its URL when it could not be downloaded
+        showrenderer += ' gltf-model="basisTranscoderPath: '+settings["s_basis_transcoder_path"]+'"'
+    if settings["b_progressive"]:
+        showrenderer += ' progressive-loader="src: '+STREAM_MANIFEST+'; concurrency: '+str(settings["i_stream_concurrency"])+'"'
+    if settings["b_cubemap"] and settings["b_camera_cube"] and settings["b_reflection_probes"]:
+        showrenderer += ' reflection-probes="budget: '+str(settings["f_probe_budget"])+'; interval: '+str(round(settings["f_probe_interval"] * 1000))+'"'
+    if settings["b_spatial_cells"]:
+        showrenderer += ' spatial-cells="src: '+CELL_INDEX+'; radius: '+str(settings["f_cell_load_radius"])+'; hysteresis: '+str(settings["f_cell_hysteresis"])+'"'
+
+    # scripts: the CDN libraries unless they are vendored in the bundle
+    scripts = []
+    if not ( settings["b_bundle_scripts"] and settings["b_vendor_aframe"] ):
+        scripts.append(cdn_scripts(settings))
+    if settings["b_bundle_scripts"]:
+        scripts.append(BUNDLE_MARKER)
+    else:
+        scripts += [ script_tag("js/"+name) for name in page_scripts(settings) ]
+
+    return dict(
+        scripts="\n        ".join(scripts),
+        stats=showstats,
+        aframe_version=settings["s_aframe_version"],
+        joystick=showjoystick,
+        vr_controllers=showvr_controllers,
+        cast_shadows=showcast_shadows,
+        player_height=settings["f_player_height"],
+        player_speed=settings["f_player_speed"],
+        show_raycast=raycaster,
+        sky=show_env_sky,
+        directional_intensity=light_directional_intensity,
+        ambient_intensity=light_ambient_intensity,
+        render_shadows=template_render_shadows,
+        renderer=showrenderer)
+
+
+def linear_to_hex(rgb):
+    # linear Blender color -> "#rrggbb" sRGB
+    channels = []
+    for c in rgb[:3]:
+        c = min(max(c, 0.0), 1.0)
+        c = c * 12.92 if c <= 0.0031308 else 1.055 * c ** ( 1 / 2.4 ) - 0.055
+        channels.append(int(round(c * 255)))
+    return "#%02X%02X%02X" % tuple(channels)
+
+def scene_bounds(description):
+    # ( min, max ) A-Frame corners around the bounding spheres of the models, None without models
+    spheres = [ ( o.position, o.radius ) for o in description.objects if shows_model(o) ]
+    if not spheres:
+        return None
+    return ( tuple( min(p[i] - r for p, r in spheres) for i in range(3) ),
+             tuple( max(p[i] + r for p, r in spheres) for i in range(3) ) )
+
+def _bounding_sphere(bounds):
+    if bounds is None:
+        return ( 0.0, 0.0, 0.0 ), 10.0
+    center = tuple( ( a + b ) / 2 for a, b in zip(*bounds) )
+    return center, math.sqrt(_distance2(*bounds)) / 2 + SHADOW_MARGIN
+
+def _importance(light, center):
+    # light reaching the scene center: the whole intensity of a sun, the inverse square
+    # falloff of the others
+    if light.type == "directional":
+        return light.intensity
+    return light.intensity / max(_distance2(light.position, center), 1.0)
+
+def runtime_lights(description):
+    # ( ambient, [ lights ] ) rendered in the page. Without b_blender_lights: the template
+    # rig. The static lights are left out of baked scenes (the lightmaps have them), else
+    # the most important i_max_lights lights are kept and the others added to the ambient
+    # light as their average over the normals (a quarter of the facing light)
+    settings = description.settings
+    baked = settings["b_use_lightmapper"]
+    if not settings["b_blender_lights"]:
+        length = math.sqrt(sum( v * v for v in DEFAULT_SUN ))
+        sun = SceneLight("sun", "directional", DEFAULT_SUN, tuple( -v / length for v in DEFAULT_SUN ), "#FFFFFF", 0.0 if baked else 1.0, 0.0, 0.0, 0.0, True, False)
+        return SceneLight("ambient", "ambient", ( 0.0, 0.0, 0.0 ), ( 0.0, -1.0, 0.0 ), "#FFFFFF", 0.1 if baked else 1.0, 0.0, 0.0, 0.0, False, False), [ sun ]
+
+    models = [ o for o in description.objects if shows_model(o) ]
+    baked = baked or ( bool(models) and all(o.lightmap for o in models) )
+    ambient = next(( l for l in description.lights if l.type == "ambient" ), None)
+    if ambient is None:
+        ambient = SceneLight("ambient", "ambient", ( 0.0, 0.0, 0.0 ), ( 0.0, -1.0, 0.0 ), "#FFFFFF", 0.5, 0.0, 0.0, 0.0, False, False)
+    center, radius = _bounding_sphere(scene_bounds(description))
+    lights = [ l for l in description.lights if l.type != "ambient" and not ( baked and l.static ) ]
+    # the dynamic lights first, then the most important
+    lights.sort(key=lambda l: ( l.static, -_importance(l, center), l.name ))
+    kept = lights[:max(0, settings["i_max_lights"])]
+    folded = [ ( _importance(l, center) / 4, l.color ) for l in lights[len(kept):] ]
+    if folded:
+        total = ambient.intensity + sum( i for i, c in folded )
+        color = [ 0.0, 0.0, 0.0 ]
+        for intensity, hex_color in [ ( ambient.intensity, ambient.color ) ] + folded:
+            for k in range(3):
+                color[k] += int(hex_color[1 + 2 * k:3 + 2 * k], 16) * intensity / max(total, 1e-9)
+        ambient = ambient._replace(intensity=total, color="#%02X%02X%02X" % tuple( int(round(c)) for c in color ))
+    return ambient, kept
+
+def light_entities(description):
+    # the <a-entity light> tags of runtime_lights(), the shadow cameras fitted to the
+    # bounding sphere of the models: a directional light is moved on the sphere, its
+    # orthographic camera encloses it
+    settings = description.settings
+    precision = settings["i_precision"]
+    ambient, lights = runtime_lights(description)
+    center, radius = _bounding_sphere(scene_bounds(description))
+    number = lambda v: format_number(v, precision)
+    tags = [ '<a-entity light="type: ambient; color: '+ambient.color+'; intensity: '+number(ambient.intensity)+'"></a-entity>' ]
+    for i, light in enumerate(lights):
+        attributes = 'type: '+light.type+'; color: '+light.color+'; intensity: '+number(light.intensity)
+        position = light.position
+        if light.type != "directional":
+            attributes += '; distance: '+number(light.distance)+'; decay: '+( "2" if settings["b_physicallyCorrectLights"] else "1" )
+        if light.type == "spot":
+            attributes += '; angle: '+number(light.angle)+'; penumbra: '+number(light.penumbra)
+        cast = settings["b_cast_shadows"] and light.shadow
+        attributes += '; castShadow: '+str(cast).lower()
+        if cast:
+            attributes += '; shadowBias: -0.001; shadowRadius: 2; shadowMapWidth: '+str(settings["i_shadow_map_size"])+'; shadowMapHeight: '+str(settings["i_shadow_map_size"])
+            if light.type == "directional":
+                position = tuple( c - d * radius for c, d in zip(center, light.direction) )
+                attributes += '; shadowCameraNear: 0; shadowCameraFar: '+number(2 * radius)
+                attributes += '; shadowCameraLeft: '+number(-radius)+'; shadowCameraRight: '+number(radius)+'; shadowCameraTop: '+number(radius)+'; shadowCameraBottom: '+number(-radius)
+            else:
+                attributes += '; shadowCameraNear: 0.1; shadowCameraFar: '+number(math.sqrt(_distance2(light.position, center)) + radius)
+        if light.type in ( "directional", "spot" ):
+            # an explicit target: the direction does not depend on the A-Frame version
+            target = tuple( p + d for p, d in zip(position, light.direction) )
+            attributes += '; target: #light_target_'+str(i)
+            tags.append('<a-entity id="light_target_'+str(i)+'" position="'+format_vector(target, precision)+'"></a-entity>')
+        tags.append('<a-entity light="'+attributes+'" position="'+format_vector(position, precision)+'"></a-entity>')
+    return "\n            ".join(tags)
+
+
+def render_index(description, assets, entities):
+    t = Template( description.template )
+    return t.substitute(asset="".join(assets), entity="".join(entities), preload=preload_hints(assets, description.settings), lights=light_entities(description), **template_values(description.settings))
+
+
+_ASSET_MARKER = "\0asset\0"
+_ENTITY_MARKER = "\0entity\0"
+
+def write_index(description, file):
+    # same page as render_index, the asset and entity lines are written one by one
+    assets, entities = generate_entities(description)
+    t = Template( description.template )
+    page = t.substitute(asset=_ASSET_MARKER, entity=_ENTITY_MARKER, preload=preload_hints(assets, description.settings), lights=light_entities(description), **template_values(description.settings))
+    for chunk in re.split("(\0asset\0|\0entity\0)", page):
+        if chunk == _ASSET_MARKER:
+            file.writelines(assets)
+        elif chunk == _ENTITY_MARKER:
+            file.writelines(entities)
+        else:
+            file.write(chunk)
+    return assets
+
+
+def generate(description):
+    # returns the index.html page and the asset tags of the scene
+    assets, entities = generate_entities(description)
+    return render_index(description, assets, entities), assets
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("usage: python generator.py scene_description.json index.html")
+        return 2
+    with open(argv[1], "w") as file:
+        assets = write_index(load_description(argv[0]), file)
+    print("%d assets written to %s" % ( len(assets), argv[1] ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
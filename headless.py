@@ -0,0 +1,17 @@
+'''
+AFRAME Exporter for Blender - background Blender expressions
+
+The --python-expr expressions run by "blender -b": the parallel export workers
+(__init__.py) and the command line export (__init__.py, cli.py) load the
+add-on from its __init__.py path (%r) as a package, so generator.py and the
+other modules are imported relatively. Shared by the add-on and cli.py, which
+runs outside Blender. It does not import bpy.
+'''
+
+LOAD_ADDON_EXPR = "import importlib.util, os, sys; path = %r; spec = importlib.util.spec_from_file_location('aframe_exporter_headless', path, submodule_search_locations=[os.path.dirname(path)]); module = importlib.util.module_from_spec(spec); sys.modules[spec.name] = module; spec.loader.exec_module(module); "
+# the job file path follows the add-on path
+WORKER_EXPR = LOAD_ADDON_EXPR + "sys.exit(module.worker_main(%r))"
+# the arguments after "--" go to cli_main()
+CLI_EXPR = LOAD_ADDON_EXPR + "sys.exit(module.cli_main(sys.argv[sys.argv.index('--') + 1:] if '--' in sys.argv else []))"
+# start of the JSON summary line printed by cli_main()
+SUMMARY_PREFIX = "AFRAME_EXPORT_SUMMARY "
@@ -0,0 +1,139 @@
+'''
+AFRAME Exporter for Blender - lightmap encoding
+
+Encodes the baked lightmap pixels, read in bulk from Blender with
+img.pixels.foreach_get (see save_lightmaps() in __init__.py), on a thread
+pool: the NumPy filters and zlib release the GIL, so the save time scales
+with the cores. It does not import bpy.
+
+- PNG: 8 bit RGBA, per row adaptive filter, tunable zlib level
+- WEBP: lossy, needs Pillow (the PNG encoder is used without it)
+- RGBM: high dynamic range in an 8 bit PNG, rgb * a * RGBM_RANGE, decoded by
+  the light-map-geometry component
+'''
+
+import zlib
+import struct
+import hashlib
+
+import numpy as np
+
+RGBM_RANGE = 8.0
+LIGHTMAP_FORMATS = ( "PNG", "WEBP", "RGBM" )
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def srgb(linear):
+    # linear -> sRGB transfer, for float (scene linear) images
+    linear = np.clip(linear, 0.0, 1.0)
+    return np.where(linear <= 0.0031308, linear * 12.92, 1.055 * np.power(linear, 1.0 / 2.4) - 0.055)
+
+
+def to_rgba8(pixels, is_float):
+    # ( height, width, 4 ) float pixels, rows bottom-up like Blender -> uint8, rows top-down
+    rgba = pixels[::-1].copy()
+    if is_float:
+        rgba[..., :3] = srgb(rgba[..., :3])
+    return np.round(np.clip(rgba, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+
+def to_rgbm8(pixels):
+    # linear float pixels -> RGBM uint8 (rows top-down), alpha holds the multiplier
+    rgb = np.clip(pixels[::-1, :, :3], 0.0, RGBM_RANGE) / RGBM_RANGE
+    m = np.ceil(np.clip(rgb.max(axis=2), 1.0 / 255.0, 1.0) * 255.0) / 255.0
+    rgbm = np.empty(pixels.shape[:2] + ( 4, ), dtype=np.uint8)
+    rgbm[..., :3] = np.round(np.clip(rgb / m[..., None], 0.0, 1.0) * 255.0)
+    rgbm[..., 3] = np.round(m * 255.0)
+    return rgbm
+
+
+def _png_filter(rgba, band = 256):
+    # filtered scanlines, the filter of each row picked by the smallest sum of
+    # absolute differences (the heuristic of libpng); every filter reads the raw
+    # bytes, so a band of rows is filtered at once
+    height, width = rgba.shape[:2]
+    rows = rgba.reshape(height, width * 4)
+    lines = np.empty(( height, width * 4 + 1 ), dtype=np.uint8)
+    for first in range(0, height, band):
+        raw = rows[first:first+band].astype(np.int16)
+        up = np.zeros_like(raw)
+        up[1:] = raw[:-1]
+        if first:
+            up[0] = rows[first-1]
+        left = np.zeros_like(raw)
+        left[:, 4:] = raw[:, :-4]
+        up_left = np.zeros_like(raw)
+        up_left[:, 4:] = up[:, :-4]
+        p = left + up - up_left
+        pa, pb, pc = np.abs(p - left), np.abs(p - up), np.abs(p - up_left)
+        paeth = np.where(( pa <= pb ) & ( pa <= pc ), left, np.where(pb <= pc, up, up_left))
+        candidates = np.stack(( raw, raw - left, raw - up, raw - (left + up) // 2, raw - paeth )).astype(np.uint8)
+        best = np.abs(candidates.view(np.int8).astype(np.int16)).sum(axis=2).argmin(axis=0)
+        lines[first:first+band, 0] = best
+        lines[first:first+band, 1:] = candidates[best, np.arange(len(raw))]
+    return lines
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+
+def png_bytes(rgba, level):
+    height, width = rgba.shape[:2]
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    data = zlib.compress(_png_filter(rgba).tobytes(), level)
+    return PNG_SIGNATURE + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", data) + _png_chunk(b"IEND", b"")
+
+
+def webp_bytes(rgba, quality):
+    # optional dependency: raises ImportError without Pillow
+    import io
+    from PIL import Image
+    output = io.BytesIO()
+    Image.fromarray(rgba, "RGBA").save(output, "WEBP", quality=quality)
+    return output.getvalue()
+
+
+def _resample_axis(pixels, size, axis):
+    # linear interpolation of the pixel centers along axis
+    count = pixels.shape[axis]
+    position = np.clip(( np.arange(size) + 0.5 ) * count / size - 0.5, 0, count - 1)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, count - 1)
+    shape = [ 1, 1, 1 ]
+    shape[axis] = size
+    weight = ( position - low ).reshape(shape)
+    return np.take(pixels, low, axis) * ( 1 - weight ) + np.take(pixels, high, axis) * weight
+
+
+def fit(pixels, size):
+    # resamples the image to size ( width, height ), textures.target_size() of the
+    # lightmap: halved (2x2 box filter) while it is twice as large, then interpolated
+    width, height = size
+    while pixels.shape[0] >= 2 * height and pixels.shape[1] >= 2 * width:
+        p = pixels[:pixels.shape[0] // 2 * 2, :pixels.shape[1] // 2 * 2]
+        pixels = ( p[0::2, 0::2] + p[1::2, 0::2] + p[0::2, 1::2] + p[1::2, 1::2] ) * 0.25
+    if pixels.shape[0] != height:
+        pixels = _resample_axis(pixels, height, 0)
+    if pixels.shape[1] != width:
+        pixels = _resample_axis(pixels, width, 1)
+    return pixels.astype(np.float32, copy=False)
+
+
+def pixel_hash(pixels, settings):
+    h = hashlib.sha1(repr(settings).encode())
+    h.update(np.ascontiguousarray(pixels).tobytes())
+    return h.hexdigest()
+
+
+def encode(pixels, is_float, lightmap_format, level):
+    # returns ( file extension, bytes ); WEBP falls back to PNG without Pillow
+    if lightmap_format == "RGBM":
+        return ".png", png_bytes(to_rgbm8(pixels), level)
+    rgba = to_rgba8(pixels, is_float)
+    if lightmap_format == "WEBP":
+        try:
+            return ".webp", webp_bytes(rgba, 90)
+        except ImportError:
+            pass
+    return ".png", png_bytes(rgba, level)
@@ -0,0 +1,286 @@
+'''
+AFRAME Exporter for Blender - preview server
+
+A threading HTTP/1.1 server for the exported project: keep-alive
+connections, one thread per connection (a stalled client no longer blocks
+the others), the .br / .gz files written next to the originals at export
+time (precompress()) served to the browsers accepting them, single byte
+ranges for the videos and a clean shutdown. The Cache-Control header is
+chosen by a function of the request path (production builds) or disables
+the cache. Live sync messages are pushed to the pages as Server-Sent Events
+on LIVE_PATH (PreviewServer.publish()). It does not import bpy.
+'''
+
+import io
+import os
+import re
+import sys
+import gzip
+import json
+import queue
+import threading
+import functools
+import http.server
+import email.utils
+from datetime import timezone
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# text formats worth compressing, the images and videos are already compressed
+COMPRESSIBLE = { ".html", ".js", ".css", ".json", ".gltf", ".glb", ".bin", ".svg", ".txt", ".obj", ".wasm" }
+MIN_COMPRESS_SIZE = 1024
+ENCODINGS = ( ( "br", ".br" ), ( "gzip", ".gz" ) )
+NO_CACHE = "no-cache, no-store, must-revalidate"
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+LIVE_PATH = "/__live"
+# comment lines sent to idle event streams, shorter than the connection timeout
+HEARTBEAT = 15
+
+
+def _compress_file(filename, ext, compress):
+    # writes filename + ext unless it is newer than filename; returns True if written
+    target = filename + ext
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(filename):
+        return False
+    with open(filename, "rb") as file:
+        data = compress(file.read())
+    with open(target + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(target + ".tmp", target)
+    return True
+
+
+def gzip_bytes(data):
+    # gzip.compress() takes mtime from Python 3.8 only, Blender 2.83 ships 3.7
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode="wb", compresslevel=9, mtime=0) as file:
+        file.write(data)
+    return output.getvalue()
+
+
+def precompress(dest):
+    # .gz (and .br with the brotli module) copies of the compressible files, the copies
+    # of removed files are deleted. Returns ( files written, files checked )
+    encoders = [ ( ".gz", gzip_bytes ) ]
+    if brotli:
+        encoders.append(( ".br", lambda data: brotli.compress(data, quality=11) ))
+    written = 0
+    checked = 0
+    for root, dirs, names in os.walk(dest):
+        dirs[:] = [ d for d in dirs if not d.startswith(".") ]
+        present = set(names)
+        for name in names:
+            filename = os.path.join ( root, name )
+            base, ext = os.path.splitext(name)
+            if ext in ( ".gz", ".br" ):
+                if base not in present and os.path.splitext(base)[1].lower() in COMPRESSIBLE:
+                    os.remove(filename)
+                continue
+            if ext.lower() not in COMPRESSIBLE or os.path.getsize(filename) < MIN_COMPRESS_SIZE:
+                continue
+            checked += 1
+            for suffix, compress in encoders:
+                written += _compress_file(filename, suffix, compress)
+    return written, checked
+
+
+def accepted_encodings(header):
+    # content codings of an Accept-Encoding header, without the ones refused with q=0
+    accepted = set()
+    for item in ( header or "" ).split(","):
+        parts = [ p.strip() for p in item.split(";") ]
+        if parts[0] and not any(p.replace(" ", "") in ( "q=0", "q=0.0", "q=0.00", "q=0.000" ) for p in parts[1:]):
+            accepted.add(parts[0].lower())
+    return accepted
+
+
+def byte_range(header, size):
+    # ( start, end ) inclusive of a single "bytes=" range, None to send the whole file,
+    # False if it cannot be satisfied
+    match = RANGE.match(( header or "" ).strip())
+    if not match or match.groups() == ( "", "" ):
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start, end = int(first), min(size - 1, int(last)) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class PreviewHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # idle keep-alive connections are closed after it, in seconds
+    timeout = 30
+    # headers and body are separate writes: without it every keep-alive answer waits for a delayed ACK
+    disable_nagle_algorithm = True
+    cache_control = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == LIVE_PATH:
+            self.send_events()
+        else:
+            http.server.SimpleHTTPRequestHandler.do_GET(self)
+
+    def send_events(self):
+        # event stream of the live sync messages, the body ends with the connection
+        events = self.server.subscribe()
+        self.close_connection = True
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            while True:
+                try:
+                    message = events.get(timeout=HEARTBEAT)
+                except queue.Empty:
+                    message = ""
+                if message is None:
+                    break
+                self.wfile.write(( "data: " + message + "\n\n" if message else ": heartbeat\n\n" ).encode("utf-8"))
+                self.wfile.flush()
+        except ( ConnectionError, TimeoutError ):
+            pass
+        finally:
+            self.server.unsubscribe(events)
+
+    def end_headers(self):
+        value = self.cache_control(self.path.split("?", 1)[0]) if self.cache_control else None
+        self.send_header("Cache-Control", value or NO_CACHE)
+        if not value:
+            self.send_header("Pragma", "no-cache")
+            self.send_header("Expires", "0")
+        http.server.SimpleHTTPRequestHandler.end_headers(self)
+
+    def send_head(self):
+        self.remaining = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split("?", 1)[0].endswith("/") and os.path.isfile(os.path.join ( path, "index.html" )):
+            path = os.path.join ( path, "index.html" )
+        if not os.path.isfile(path):
+            # redirects, directory listings and the 404 answers
+            return http.server.SimpleHTTPRequestHandler.send_head(self)
+        compressible = os.path.splitext(path)[1].lower() in COMPRESSIBLE
+        stat = os.stat(path)
+        if self._not_modified(stat):
+            self.send_response(304)
+            self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        content_type = self.guess_type(path)
+        requested = self.headers.get("Range")
+        span = byte_range(requested, stat.st_size) if requested else None
+        if span is False:
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */%d" % stat.st_size)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        encoding = None
+        if span is None and compressible:
+            accepted = accepted_encodings(self.headers.get("Accept-Encoding"))
+            for name, ext in ENCODINGS:
+                if name in accepted and os.path.isfile(path + ext) and os.path.getmtime(path + ext) >= stat.st_mtime:
+                    encoding = name
+                    path += ext
+                    break
+        file = open(path, "rb")
+        try:
+            size = os.fstat(file.fileno()).st_size
+            if span:
+                start, end = span
+                file.seek(start)
+                self.remaining = end - start + 1
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes %d-%d/%d" % ( start, end, size ))
+            else:
+                self.remaining = size
+                self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(self.remaining))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+            if compressible:
+                self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.end_headers()
+            return file
+        except Exception:
+            file.close()
+            raise
+
+    def _not_modified(self, stat):
+        if "If-Modified-Since" not in self.headers or "If-None-Match" in self.headers:
+            return False
+        try:
+            since = email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"])
+        except (TypeError, IndexError, OverflowError, ValueError):
+            return False
+        if since is None:
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return since.timestamp() >= int(stat.st_mtime)
+
+    def copyfile(self, source, outputfile):
+        # only the requested range
+        if self.remaining is None:
+            return http.server.SimpleHTTPRequestHandler.copyfile(self, source, outputfile)
+        remaining = self.remaining
+        while remaining > 0:
+            chunk = source.read(min(remaining, 1 << 16))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class PreviewServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, folder, cache_control = None):
+        handler = type("Handler", ( PreviewHandler, ), { "cache_control": staticmethod(cache_control) if cache_control else None })
+        http.server.ThreadingHTTPServer.__init__(self, address, functools.partial(handler, directory=folder))
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+
+    def subscribe(self):
+        events = queue.Queue()
+        with self.subscribers_lock:
+            self.subscribers.add(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self.subscribers_lock:
+            self.subscribers.discard(events)
+
+    def publish(self, message):
+        # sends the JSON message to every open page, returns their number
+        data = json.dumps(message, separators=(",", ":"))
+        with self.subscribers_lock:
+            for events in self.subscribers:
+                events.put(data)
+            return len(self.subscribers)
+
+    def shutdown(self):
+        # the event streams end first, their threads would wait for the next message
+        with self.subscribers_lock:
+            for events in self.subscribers:
+                events.put(None)
+        http.server.ThreadingHTTPServer.shutdown(self)
+
+    def handle_error(self, request, client_address):
+        # the browsers drop connections (page reloads, cancelled requests)
+        if not isinstance(sys.exc_info()[1], ( ConnectionError, TimeoutError )):
+            http.server.ThreadingHTTPServer.handle_error(self, request, client_address)
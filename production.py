@@ -0,0 +1,190 @@
+'''
+AFRAME Exporter for Blender - production build
+
+Gives every file referenced by index.html a content hashed name
+(name.<hash>.ext), so a web server can let the browsers cache it for a year
+(immutable) while index.html is revalidated on every visit. The hashed files
+are copies of the exported files, which keep their names for the incremental
+export (hard links would change with them, the exporter rewrites its files in
+place); the renames are listed in the asset manifest. The JSON manifests loaded
+by the page (stream.json) are rewritten like index.html. It does not import bpy.
+'''
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import urllib.parse
+
+HASH_LENGTH = 12
+ASSET_MANIFEST = "asset-manifest.json"
+# name.<hash>.ext, and the textures/<hash>.ext files of the glTF export
+HASHED_NAME = re.compile(r"(^|[/.])[0-9a-f]{12,}\.[A-Za-z0-9]+$")
+# a reference ends at one of them, or at a space (the names may contain spaces)
+REFERENCE_END = re.compile(r"[\"'`;)<>\n]")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def file_digest(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return root + "." + digest[:HASH_LENGTH] + ext
+
+
+def is_hashed(path):
+    return bool(HASHED_NAME.search(path))
+
+
+def cache_control(path, production):
+    # Cache-Control header of the preview server, None outside production mode
+    if not production:
+        return None
+    return IMMUTABLE if is_hashed(path) else REVALIDATE
+
+
+def project_files(dest):
+    # relative paths of the exported files, without the hashed copies and the hidden folders
+    files = set()
+    for root, dirs, names in os.walk(dest):
+        dirs[:] = [ d for d in dirs if not d.startswith(".") ]
+        folder = os.path.relpath(root, dest).replace(os.sep, "/")
+        for name in names:
+            path = name if folder == "." else folder + "/" + name
+            if not is_hashed(path):
+                files.add(path)
+    return files
+
+
+def find_references(text, files):
+    # [ ( start, end, path ) ] of the project files named in text, the longest name wins
+    prefixes = sorted({ f.split("/", 1)[0] + ( "/" if "/" in f else "" ) for f in files }, key=len, reverse=True)
+    if not prefixes:
+        return []
+    pattern = re.compile(r"(?<![\w.-])(?:\./)?(" + "|".join(re.escape(p) for p in prefixes) + ")")
+    found = []
+    position = 0
+    while True:
+        match = pattern.search(text, position)
+        if not match:
+            return found
+        start = match.start(1)
+        limit = REFERENCE_END.search(text, start)
+        limit = limit.start() if limit else len(text)
+        ends = [ limit ] + [ m.start() + start for m in reversed(list(re.finditer(r"\s", text[start:limit]))) ]
+        end = next(( e for e in ends if text[start:e] in files ), None)
+        if end is None:
+            position = match.end()
+        else:
+            found.append(( start, end, text[start:end] ))
+            position = end
+
+
+def copy(source, target):
+    if not os.path.exists(target):
+        shutil.copyfile(source, target)
+
+
+def _publish_gltf(dest, path, mapping):
+    # a .gltf with buffers / images next to it: they get hashed names first and the
+    # hashed .gltf is a rewritten copy pointing at them
+    folder = os.path.dirname(path)
+    with open(os.path.join ( dest, path ), "r") as file:
+        gltf = json.load(file)
+    changed = False
+    for item in gltf.get("buffers", []) + gltf.get("images", []):
+        uri = item.get("uri", "")
+        if not uri or uri.startswith("data:") or is_hashed(uri):
+            continue
+        name = urllib.parse.unquote(uri)
+        source = os.path.normpath(os.path.join ( dest, folder, name ))
+        target = hashed_name(name, file_digest(source))
+        copy(source, os.path.join ( dest, folder, target ))
+        mapping[os.path.relpath(source, dest).replace(os.sep, "/")] = os.path.relpath(os.path.join ( dest, folder, target ), dest).replace(os.sep, "/")
+        item["uri"] = urllib.parse.quote(target)
+        changed = True
+    if not changed:
+        return None
+    data = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    target = hashed_name(path, hashlib.sha1(data).hexdigest())
+    if not os.path.exists(os.path.join ( dest, target )):
+        with open(os.path.join ( dest, target ), "wb") as file:
+            file.write(data)
+    return target
+
+
+def load_manifest(dest):
+    try:
+        with open(os.path.join ( dest, ASSET_MANIFEST ), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return { "files": {} }
+
+
+def remove_stale(dest, keep):
+    # hashed copies of the previous build not in keep
+    for target in load_manifest(dest).get("files", {}).values():
+        if target not in keep and os.path.exists(os.path.join ( dest, target )):
+            os.remove(os.path.join ( dest, target ))
+
+
+def clean(dest):
+    # back to a development build: the hashed copies and the asset manifest are removed
+    remove_stale(dest, set())
+    if os.path.exists(os.path.join ( dest, ASSET_MANIFEST )):
+        os.remove(os.path.join ( dest, ASSET_MANIFEST ))
+
+
+def _rewrite(dest, text, files, mapping):
+    # text with the project files it names replaced by hashed copies, made once per file
+    references = find_references(text, files)
+    for path in sorted({ r[2] for r in references } - set(mapping)):
+        target = _publish_gltf(dest, path, mapping) if path.endswith(".gltf") else None
+        if not target:
+            target = hashed_name(path, file_digest(os.path.join ( dest, path )))
+            copy(os.path.join ( dest, path ), os.path.join ( dest, target ))
+        mapping[path] = target
+    chunks = []
+    position = 0
+    for start, end, path in references:
+        chunks += [ text[position:start], mapping[path] ]
+        position = end
+    chunks.append(text[position:])
+    return "".join(chunks)
+
+
+def publish(dest, index_file, manifests = ()):
+    # hashed copies of the files referenced by index_file, index_file rewritten to
+    # use them, the stale copies of the previous build removed. manifests are the files
+    # loaded by the page which name other files (stream.json): their hashed copies are
+    # rewritten the same way. Returns { file: hashed file }
+    files = project_files(dest)
+    files.discard(index_file)
+    mapping = {}
+    for path in manifests:
+        if path not in files:
+            continue
+        with open(os.path.join ( dest, path ), "r", encoding="utf-8") as file:
+            data = _rewrite(dest, file.read(), files - { path }, mapping).encode("utf-8")
+        target = hashed_name(path, hashlib.sha1(data).hexdigest())
+        if not os.path.exists(os.path.join ( dest, target )):
+            with open(os.path.join ( dest, target ), "wb") as file:
+                file.write(data)
+        mapping[path] = target
+    with open(os.path.join ( dest, index_file ), "r", encoding="utf-8") as file:
+        text = _rewrite(dest, file.read(), files, mapping)
+    with open(os.path.join ( dest, index_file ), "w", encoding="utf-8") as file:
+        file.write(text)
+
+    remove_stale(dest, set(mapping.values()))
+    with open(os.path.join ( dest, ASSET_MANIFEST ), "w") as file:
+        json.dump({ "index": index_file, "files": mapping }, file, indent=1, sort_keys=True)
+    return mapping
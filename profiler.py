@@ -0,0 +1,121 @@
+'''
+AFRAME Exporter for Blender - export profiler
+
+Wall time of the export stages (stage() ends the running stage and starts the
+next one), of every object and of the files shared by several objects
+(combined scene, spatial cells), the bytes of the exported files and,
+optionally, a cProfile capture of the whole export. write() saves the report
+to export_report.json in the project folder, the capture to
+export_profile.prof (snakeviz, pstats). It does not import bpy.
+'''
+
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+
+REPORT_FILE = "export_report.json"
+PROFILE_FILE = "export_profile.prof"
+# functions of the cProfile capture listed in the report, by cumulative time
+PROFILE_TOP = 40
+# slowest objects shown in the panel
+SLOWEST = 5
+
+
+def file_sizes(dest, folders):
+    # [ { "file", "bytes" } ] of the files in folders of dest, largest first
+    sizes = []
+    for folder in folders:
+        for root, dirs, names in os.walk(os.path.join ( dest, folder )):
+            dirs[:] = [ d for d in dirs if not d.startswith(".") ]
+            for name in names:
+                path = os.path.join ( root, name )
+                sizes.append({ "file": os.path.relpath(path, dest).replace(os.sep, "/"), "bytes": os.path.getsize(path) })
+    return sorted(sizes, key=lambda s: ( -s["bytes"], s["file"] ))
+
+
+def profile_rows(capture, count = PROFILE_TOP):
+    # [ { "function", "calls", "seconds", "cumulative" } ] of a cProfile.Profile
+    stats = pstats.Stats(capture, stream=io.StringIO())
+    rows = []
+    for ( filename, line, function ), ( primitive, calls, own, cumulative, callers ) in stats.stats.items():
+        rows.append({
+            "function": "%s:%d(%s)" % ( os.path.basename(filename), line, function ),
+            "calls": calls,
+            "seconds": own,
+            "cumulative": cumulative,
+        })
+    return sorted(rows, key=lambda r: -r["cumulative"])[:count]
+
+
+class Profiler:
+    def __init__(self, capture = False):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.stages = []
+        self.current = None
+        self.objects = {}
+        self.files = {}
+        self.capture = cProfile.Profile() if capture else None
+        if self.capture:
+            self.capture.enable()
+
+    def stage(self, name):
+        # ends the running stage and starts name (None: no new stage)
+        now = time.perf_counter()
+        if self.current:
+            self.stages.append({ "name": self.current[0], "seconds": now - self.current[1] })
+        self.current = ( name, now ) if name else None
+
+    def object(self, name, seconds, file = None):
+        # seconds spent on an object, added to the previous ones (LOD levels, workers)
+        entry = self.objects.setdefault(name, { "name": name, "seconds": 0.0 })
+        entry["seconds"] += seconds
+        if file:
+            entry["file"] = file
+
+    def file(self, name, seconds, objects):
+        # export of a file shared by objects
+        self.files[name] = { "file": name, "seconds": seconds, "objects": objects }
+
+    def finish(self):
+        self.stage(None)
+        if self.capture:
+            self.capture.disable()
+        self.seconds = time.perf_counter() - self.start
+
+    def slowest(self, count = SLOWEST):
+        # [ ( name, seconds ) ] of the slowest objects and shared files
+        entries = [ ( o["name"], o["seconds"] ) for o in self.objects.values() ] + [ ( f["file"], f["seconds"] ) for f in self.files.values() ]
+        return sorted(entries, key=lambda e: -e[1])[:count]
+
+    def report(self, dest, folders, summary = None, sections = None):
+        # sections: more { key: data } of the export (scene budget)
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "seconds": self.seconds,
+            "stages": self.stages,
+            "objects": sorted(self.objects.values(), key=lambda o: -o["seconds"]),
+            "files": sorted(self.files.values(), key=lambda f: -f["seconds"]),
+            "assets": file_sizes(dest, folders),
+        }
+        if summary is not None:
+            report["summary"] = summary
+        report.update(sections or {})
+        if self.capture:
+            report["profile"] = profile_rows(self.capture)
+        return report
+
+    def write(self, dest, folders, summary = None, sections = None):
+        # export_report.json (and export_profile.prof), returns the report
+        report = self.report(dest, folders, summary, sections)
+        with open(os.path.join ( dest, REPORT_FILE ), "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=1)
+        if self.capture:
+            self.capture.dump_stats(os.path.join ( dest, PROFILE_FILE ))
+        elif os.path.exists(os.path.join ( dest, PROFILE_FILE )):
+            os.remove(os.path.join ( dest, PROFILE_FILE ))
+        return report
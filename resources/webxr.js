@@ -81,6 +81,18 @@ function init() {
   }
 }
 
+// lightmap textures by path, shared by the objects of an atlas
+var lightMapTextures = {};
+
+// the lightmap chunk of the built-in materials with the RGBM decode of the texel
+function decodeRGBMLightMap(shader) {
+  // three.js r111 samples the texel inline, later versions through lightMapTexel
+  const chunk = THREE.ShaderChunk.lights_fragment_maps
+    .replace('texture2D( lightMap, vUv2 ).xyz', '( texture2D( lightMap, vUv2 ).rgb * texture2D( lightMap, vUv2 ).a * 8.0 )')
+    .replace('lightMapTexelToLinear( lightMapTexel ).rgb', '( lightMapTexel.rgb * lightMapTexel.a * 8.0 )');
+  shader.fragmentShader = shader.fragmentShader.replace('#include <lights_fragment_maps>', chunk);
+}
+
 /**
  * Specifies an envMap on an entity, without replacing any existing material
  * properties.
@@ -90,13 +102,22 @@ AFRAME.registerComponent('light-map-geometry', {
   schema: {
     path: { default: '' },
     format: { default: 'RGBFormat' },
-    intensity: { default: 1.0 }
+    intensity: { default: 1.0 },
+    // region of the object in a lightmap atlas (glTF UV space)
+    offset: { type: 'vec2', default: { x: 0, y: 0 } },
+    repeat: { type: 'vec2', default: { x: 1, y: 1 } },
+    // 'rgbm': HDR lightmap, rgb * a * 8.0 (Lightmap Format RGBM)
+    encoding: { default: '' }
   },
 
   init: function () {
     const data = this.data;
     const el = this.el;
-    this.texture = new THREE.TextureLoader().load(data.path);
+    // an atlas is loaded and uploaded once for all its objects
+    if (!lightMapTextures[data.path]) {
+      lightMapTextures[data.path] = new THREE.TextureLoader().load(data.path);
+    }
+    this.texture = lightMapTextures[data.path];
     this.intensity = data.intensity;
     this.applyLightMap();
     this.el.addEventListener('object3dset', this.applyLightMap.bind(this));
@@ -108,6 +129,8 @@ AFRAME.registerComponent('light-map-geometry', {
     this.texture.flipY = false;
     const el = this.el
     const value = this.intensity;
+    const data = this.data;
+    const atlas = data.offset.x !== 0 || data.offset.y !== 0 || data.repeat.x !== 1 || data.repeat.y !== 1;
 
     if (!mesh) return;
     mesh.traverse(function (node) {
@@ -116,11 +139,631 @@ AFRAME.registerComponent('light-map-geometry', {
       //console.log(node.geometry.attributes);
       //node.geometry.attributes.uv2 = node.geometry.attributes.uv.clone();
       //}
+      if (atlas && node.geometry && !node.geometry.userData.lightMapAtlas) {
+        const uv = node.geometry.attributes.uv2 || node.geometry.attributes.uv;
+        if (uv) {
+          // quantized UVs (Mesh Compression) are normalized integers
+          let range = 1;
+          if (uv.normalized) {
+            range = uv.array instanceof Uint16Array ? 65535 : (uv.array instanceof Uint8Array ? 255 : 1);
+          }
+          const uv2 = new Float32Array(uv.count * 2);
+          for (let i = 0; i < uv.count; i++) {
+            uv2[2 * i] = uv.getX(i) / range * data.repeat.x + data.offset.x;
+            uv2[2 * i + 1] = uv.getY(i) / range * data.repeat.y + data.offset.y;
+          }
+          const attribute = new THREE.BufferAttribute(uv2, 2);
+          if (node.geometry.setAttribute) {
+            node.geometry.setAttribute('uv2', attribute);
+          } else {
+            node.geometry.addAttribute('uv2', attribute);
+          }
+          node.geometry.userData.lightMapAtlas = true;
+        }
+      }
       if (node.material && 'lightMap' in node.material) {
         node.material.lightMap = lightMap;
         node.material.lightMapIntensity = value;
+        if (data.encoding === 'rgbm') {
+          node.material.onBeforeCompile = decodeRGBMLightMap;
+          node.material.customProgramCacheKey = function () { return 'rgbm'; };
+        }
+        node.material.needsUpdate = true;
+      }
+    });
+  }
+});
+
+// glTF files shared by gltf-part components: loading promises and requested node names
+var gltfPartCache = {};
+var gltfPartNames = {};
+
+/**
+ * Shows a single node of a shared glTF file (combined scene export).
+ * The file is loaded once and every entity clones its own node, so the
+ * entity keeps its own position, animations and click handlers.
+ */
+AFRAME.registerComponent('gltf-part', {
+  schema: {
+    src: { type: 'model' },
+    part: { default: '' }
+  },
+
+  init: function () {
+    if (!gltfPartNames[this.data.src]) {
+      gltfPartNames[this.data.src] = new Set();
+    }
+    gltfPartNames[this.data.src].add(this.sanitize(this.data.part));
+  },
+
+  update: function () {
+    const self = this;
+    const el = this.el;
+    const name = this.sanitize(this.data.part);
+    const others = gltfPartNames[this.data.src];
+    if (!this.data.src || !name) return;
+
+    this.load(this.data.src).then(function (gltf) {
+      // removed while loading (spatial-cells)
+      if (self.removed) return;
+      const node = gltf.scene.getObjectByName(name);
+      if (!node) {
+        console.warn('gltf-part: node ' + name + ' not found');
+        return;
+      }
+      const part = node.clone(true);
+      // the entity carries the whole transform
+      part.position.set(0, 0, 0);
+      // children exported as their own entities are removed from the clone
+      part.children.slice().forEach(function (child) {
+        if (others.has(child.name)) {
+          part.remove(child);
+        }
+      });
+      el.setObject3D('mesh', part);
+      el.emit('model-loaded', { format: 'gltf', model: part });
+    });
+  },
+
+  remove: function () {
+    this.removed = true;
+    if (this.el.getObject3D('mesh')) {
+      this.el.removeObject3D('mesh');
+    }
+  },
+
+  sanitize: function (name) {
+    return THREE.PropertyBinding.sanitizeNodeName ? THREE.PropertyBinding.sanitizeNodeName(name) : name;
+  },
+
+  load: function (src) {
+    if (!gltfPartCache[src]) {
+      gltfPartCache[src] = new Promise(function (resolve, reject) {
+        new THREE.GLTFLoader().load(src, resolve, undefined, reject);
+      });
+    }
+    return gltfPartCache[src];
+  }
+});
+
+/**
+ * GPU instancing of a mesh shared by many objects (linked duplicates).
+ * The glTF file holds the mesh once, instances lists "x y z rx ry rz sx sy sz"
+ * (position, rotation in degrees, scale) for every object, separated by commas.
+ * Each mesh / material pair of the file becomes one THREE.InstancedMesh,
+ * drawn with a single draw call for all the instances.
+ */
+AFRAME.registerComponent('gltf-instances', {
+  schema: {
+    src: { type: 'model' },
+    instances: { default: '' }
+  },
+
+  update: function () {
+    const el = this.el;
+    if (!this.data.src || !this.data.instances) return;
+    const matrices = this.parse(this.data.instances);
+
+    new THREE.GLTFLoader().load(this.data.src, function (gltf) {
+      const group = new THREE.Group();
+      gltf.scene.updateMatrixWorld(true);
+      gltf.scene.traverse(function (node) {
+        if (!node.isMesh) return;
+        const mesh = new THREE.InstancedMesh(node.geometry, node.material, matrices.length);
+        const matrix = new THREE.Matrix4();
+        matrices.forEach(function (instance, i) {
+          mesh.setMatrixAt(i, matrix.multiplyMatrices(instance, node.matrixWorld));
+        });
+        mesh.instanceMatrix.needsUpdate = true;
+        // the bounding sphere of the geometry does not cover the instances
+        mesh.frustumCulled = false;
+        group.add(mesh);
+      });
+      el.setObject3D('mesh', group);
+      el.emit('model-loaded', { format: 'gltf', model: group });
+    });
+  },
+
+  remove: function () {
+    if (this.el.getObject3D('mesh')) {
+      this.el.removeObject3D('mesh');
+    }
+  },
+
+  parse: function (instances) {
+    const deg = Math.PI / 180;
+    const position = new THREE.Vector3();
+    const rotation = new THREE.Euler(0, 0, 0, 'YXZ');
+    const quaternion = new THREE.Quaternion();
+    const scale = new THREE.Vector3();
+    return instances.split(',').map(function (instance) {
+      const v = instance.trim().split(/\s+/).map(parseFloat);
+      position.set(v[0], v[1], v[2]);
+      rotation.set(v[3] * deg, v[4] * deg, v[5] * deg, 'YXZ');
+      quaternion.setFromEuler(rotation);
+      scale.set(v[6], v[7], v[8]);
+      return new THREE.Matrix4().compose(position, quaternion, scale);
+    });
+  }
+});
+
+/**
+ * Distance based level of detail. The entity shows its gltf-model (level 0)
+ * near the camera and the glTF files in levels beyond the matching distances
+ * (meters). The lower levels are loaded the first time they are needed.
+ */
+AFRAME.registerComponent('lod-levels', {
+  schema: {
+    levels: { default: '' },
+    distances: { default: '' },
+    interval: { default: 250 }
+  },
+
+  init: function () {
+    const self = this;
+    this.level = 0;
+    this.models = [];
+    this.shown = [true];
+    this.loading = [];
+    this.position = new THREE.Vector3();
+    this.cameraPosition = new THREE.Vector3();
+    this.tick = AFRAME.utils.throttleTick(this.tick, this.data.interval, this);
+    // level 0 is the model loaded by gltf-model
+    this.el.addEventListener('model-loaded', function () {
+      if (!self.models[0]) {
+        self.models[0] = self.el.getObject3D('mesh');
+      }
+    });
+  },
+
+  update: function () {
+    this.urls = this.data.levels.split(/\s+/).filter(Boolean);
+    this.distances = this.data.distances.split(/\s+/).filter(Boolean).map(parseFloat);
+  },
+
+  tick: function () {
+    const camera = this.el.sceneEl.camera;
+    if (!camera || !this.models[0]) return;
+    this.el.object3D.getWorldPosition(this.position);
+    camera.getWorldPosition(this.cameraPosition);
+    const distance = this.position.distanceTo(this.cameraPosition);
+    let level = 0;
+    for (let i = 0; i < this.urls.length && i < this.distances.length; i++) {
+      if (distance > this.distances[i]) level = i + 1;
+    }
+    if (level !== this.level) this.show(level);
+  },
+
+  show: function (level) {
+    const self = this;
+    this.level = level;
+    if (this.models[level]) {
+      this.el.setObject3D('mesh', this.models[level]);
+      if (!this.shown[level]) {
+        // lets light-map-geometry and the other model components set up the level
+        this.shown[level] = true;
+        this.el.emit('model-loaded', { format: 'gltf', model: this.models[level] });
+      }
+      return;
+    }
+    if (this.loading[level]) return;
+    this.loading[level] = true;
+    new THREE.GLTFLoader().load(this.urls[level - 1], function (gltf) {
+      self.models[level] = gltf.scene || gltf.scenes[0];
+      if (self.level === level) self.show(level);
+    });
+  }
+});
+
+/**
+ * Live Sync: applies the changes pushed by the preview server while editing
+ * in Blender (Server-Sent Events): new transforms and re-exported models are
+ * swapped in place, a page reload is requested for the shared files.
+ */
+AFRAME.registerComponent('live-sync', {
+  schema: {
+    url: { default: '/__live' }
+  },
+
+  init: function () {
+    if (!window.EventSource) return;
+    this.source = new EventSource(this.data.url);
+    this.source.onmessage = this.apply.bind(this);
+  },
+
+  apply: function (event) {
+    const message = JSON.parse(event.data);
+    if (message.type === 'reload') {
+      window.location.reload();
+      return;
+    }
+    (message.entities || []).forEach(function (change) {
+      // the entity ids are "#" + object name
+      const el = document.getElementById('#' + change.id);
+      if (!el) return;
+      ['position', 'rotation', 'scale'].forEach(function (name) {
+        if (change[name]) el.setAttribute(name, change[name]);
+      });
+      if (change.src) {
+        const received = performance.now();
+        el.addEventListener('model-loaded', function () {
+          console.log('live-sync: ' + change.id + ' shown ' + Math.round(performance.now() - received) + ' ms after the update');
+        }, { once: true });
+        el.setAttribute('gltf-model', 'url(' + change.src + ')');
+      }
+    });
+  },
+
+  remove: function () {
+    if (this.source) this.source.close();
+  }
+});
+
+/**
+ * Progressive loading: the scene starts with the models of <a-assets>, the
+ * entities listed in the stream manifest get their gltf-model afterwards,
+ * the closest to the camera first and at most concurrency at a time.
+ */
+AFRAME.registerComponent('progressive-loader', {
+  schema: {
+    src: { default: 'stream.json' },
+    concurrency: { default: 4 }
+  },
+
+  init: function () {
+    const self = this;
+    this.queue = [];
+    this.active = 0;
+    this.done = 0;
+    this.cameraPosition = new THREE.Vector3();
+    fetch(this.data.src).then(function (response) {
+      return response.json();
+    }).then(function (manifest) {
+      self.queue = manifest.entities || [];
+      self.total = self.queue.length;
+      self.started = performance.now();
+      if (self.el.hasLoaded) {
+        self.next();
+      } else {
+        self.el.addEventListener('loaded', self.next.bind(self), { once: true });
+      }
+    }).catch(function (error) {
+      console.warn('progressive-loader: ' + self.data.src + ' not loaded', error);
+    });
+  },
+
+  next: function () {
+    while (this.active < this.data.concurrency && this.queue.length) {
+      this.load(this.closest());
+    }
+  },
+
+  closest: function () {
+    // the player moves while loading: the distances are measured at every dispatch
+    const camera = this.el.camera;
+    if (camera) camera.getWorldPosition(this.cameraPosition);
+    const c = this.cameraPosition;
+    let best = 0;
+    let bestDistance = Infinity;
+    for (let i = 0; i < this.queue.length; i++) {
+      const p = this.queue[i].position;
+      const distance = Math.hypot(p[0] - c.x, p[1] - c.y, p[2] - c.z) - this.queue[i].radius;
+      if (distance < bestDistance) {
+        best = i;
+        bestDistance = distance;
+      }
+    }
+    return this.queue.splice(best, 1)[0];
+  },
+
+  load: function (item) {
+    const self = this;
+    // the entity ids are "#" + object name
+    const el = document.getElementById('#' + item.id);
+    if (!el) {
+      this.finish();
+      return;
+    }
+    this.active++;
+    const loaded = function () {
+      el.removeEventListener('model-loaded', loaded);
+      el.removeEventListener('model-error', loaded);
+      self.active--;
+      self.finish();
+      self.next();
+    };
+    el.addEventListener('model-loaded', loaded);
+    el.addEventListener('model-error', loaded);
+    el.setAttribute('gltf-model', 'url(' + item.src + ')');
+  },
+
+  finish: function () {
+    this.done++;
+    if (this.done === this.total) {
+      console.log('progressive-loader: ' + this.total + ' models streamed in ' + Math.round(performance.now() - this.started) + ' ms');
+      this.el.emit('progressive-loaded', { count: this.total });
+    }
+  }
+});
+
+/**
+ * Spatial cells: the objects of the cells within radius (meters, on the
+ * ground plane) of the #player entity show their node of the cell glTF file
+ * (gltf-part). The cells beyond radius + hysteresis are removed and the
+ * geometries, materials and textures of their file disposed.
+ */
+AFRAME.registerComponent('spatial-cells', {
+  schema: {
+    src: { default: 'cells.json' },
+    radius: { default: 40 },
+    hysteresis: { default: 10 },
+    interval: { default: 500 }
+  },
+
+  init: function () {
+    const self = this;
+    this.cells = [];
+    this.loaded = {};
+    this.playerPosition = new THREE.Vector3();
+    this.tick = AFRAME.utils.throttleTick(this.tick, this.data.interval, this);
+    fetch(this.data.src).then(function (response) {
+      return response.json();
+    }).then(function (index) {
+      self.cells = index.cells || [];
+    }).catch(function (error) {
+      console.warn('spatial-cells: ' + self.data.src + ' not loaded', error);
+    });
+  },
+
+  tick: function () {
+    const player = document.getElementById('player');
+    if (!player || !this.cells.length) return;
+    player.object3D.getWorldPosition(this.playerPosition);
+    for (let i = 0; i < this.cells.length; i++) {
+      const cell = this.cells[i];
+      const distance = this.distance(cell.bounds, this.playerPosition);
+      if (!this.loaded[cell.id] && distance <= this.data.radius) {
+        this.load(cell);
+      } else if (this.loaded[cell.id] && distance > this.data.radius + this.data.hysteresis) {
+        this.unload(cell);
+      }
+    }
+  },
+
+  distance: function (bounds, p) {
+    // from the player to the cell bounds on the ground plane, 0 inside
+    const dx = Math.max(bounds[0][0] - p.x, 0, p.x - bounds[1][0]);
+    const dz = Math.max(bounds[0][2] - p.z, 0, p.z - bounds[1][2]);
+    return Math.hypot(dx, dz);
+  },
+
+  load: function (cell) {
+    this.loaded[cell.id] = true;
+    cell.objects.forEach(function (name) {
+      // the entity ids are "#" + object name
+      const el = document.getElementById('#' + name);
+      if (el) el.setAttribute('gltf-part', 'src: url(' + cell.src + '); part: ' + name);
+    });
+    this.el.emit('cell-loaded', { id: cell.id });
+  },
+
+  unload: function (cell) {
+    delete this.loaded[cell.id];
+    cell.objects.forEach(function (name) {
+      const el = document.getElementById('#' + name);
+      if (el) el.removeAttribute('gltf-part');
+    });
+    // the clones of the entities share the geometries and materials of the cached file
+    const cached = gltfPartCache[cell.src];
+    delete gltfPartCache[cell.src];
+    if (cached) {
+      cached.then(function (gltf) {
+        disposeObject3D(gltf.scene);
+      }, function () {});
+    }
+    this.el.emit('cell-unloaded', { id: cell.id });
+  }
+});
+
+// frees the GPU memory of an object tree, the shared lightmaps are kept
+function disposeObject3D(object) {
+  object.traverse(function (node) {
+    if (node.geometry) node.geometry.dispose();
+    const materials = Array.isArray(node.material) ? node.material : (node.material ? [node.material] : []);
+    materials.forEach(function (material) {
+      Object.keys(material).forEach(function (key) {
+        if (key !== 'lightMap' && material[key] && material[key].isTexture) material[key].dispose();
+      });
+      material.dispose();
+    });
+  });
+}
+
+/**
+ * Reflection probes: shared cube cameras (reflection-probe entities) rendered
+ * by the scene one face at a time, as many faces per frame as fit in budget
+ * (ms, at least one). A probe is rendered again every interval (ms, 0 renders
+ * it once); the objects using it (probe-env) are hidden while it renders.
+ */
+AFRAME.registerComponent('reflection-probes', {
+  schema: {
+    budget: { default: 2 },
+    interval: { default: 2000 }
+  },
+
+  init: function () {
+    const self = this;
+    this.probes = [];
+    this.current = 0;
+    // the entities are initialized before the scene components
+    this.el.querySelectorAll('[reflection-probe]').forEach(function (el) {
+      if (el.components['reflection-probe']) self.register(el.components['reflection-probe']);
+    });
+  },
+
+  register: function (probe) {
+    if (this.probes.indexOf(probe) < 0) this.probes.push(probe);
+  },
+
+  unregister: function (probe) {
+    const i = this.probes.indexOf(probe);
+    if (i >= 0) this.probes.splice(i, 1);
+  },
+
+  due: function (probe, time) {
+    if (probe.face > 0 || !probe.captures) return true;
+    return this.data.interval > 0 && time - probe.updated >= this.data.interval;
+  },
+
+  tick: function (time) {
+    const renderer = this.el.renderer;
+    if (!renderer || !this.probes.length) return;
+    const start = performance.now();
+    let checked = 0;
+    // round robin: a probe being rendered finishes first
+    while (checked < this.probes.length) {
+      if (this.current >= this.probes.length) this.current = 0;
+      const probe = this.probes[this.current];
+      if (!this.due(probe, time)) {
+        this.current++;
+        checked++;
+        continue;
+      }
+      checked = 0;
+      probe.renderFace(renderer, time);
+      if (probe.face === 0) this.current++;
+      if (performance.now() - start >= this.data.budget) return;
+    }
+  }
+});
+
+AFRAME.registerComponent('reflection-probe', {
+  schema: {
+    resolution: { default: 256 },
+    near: { default: 0.1 },
+    far: { default: 1000 }
+  },
+
+  init: function () {
+    const data = this.data;
+    // the render target moved out of the CubeCamera constructor in three.js r116
+    if (THREE.WebGLCubeRenderTarget && parseInt(THREE.REVISION, 10) >= 116) {
+      const target = new THREE.WebGLCubeRenderTarget(data.resolution, { generateMipmaps: true, minFilter: THREE.LinearMipmapLinearFilter });
+      this.camera = new THREE.CubeCamera(data.near, data.far, target);
+    } else {
+      this.camera = new THREE.CubeCamera(data.near, data.far, data.resolution, { generateMipmaps: true, minFilter: THREE.LinearMipmapLinearFilter });
+    }
+    this.texture = this.camera.renderTarget.texture;
+    this.el.object3D.add(this.camera);
+    this.users = [];
+    this.face = 0;
+    this.captures = 0;
+    this.updated = 0;
+    this.scheduler = this.el.sceneEl.components['reflection-probes'];
+    if (this.scheduler) this.scheduler.register(this);
+  },
+
+  renderFace: function (renderer, time) {
+    const scene = this.el.sceneEl.object3D;
+    const target = this.camera.renderTarget;
+    const xr = renderer.xr || renderer.vr;
+    const xrEnabled = xr && xr.enabled;
+    const autoClear = renderer.autoClear;
+    const previousTarget = renderer.getRenderTarget();
+    const hidden = this.users.map(function (el) {
+      const mesh = el.getObject3D('mesh');
+      if (!mesh || !mesh.visible) return null;
+      mesh.visible = false;
+      return mesh;
+    });
+    if (xr) xr.enabled = false;
+    renderer.autoClear = true;
+    // the mipmaps are generated once, after the last face
+    target.texture.generateMipmaps = this.face === 5;
+    this.camera.updateMatrixWorld();
+    renderer.setRenderTarget(target, this.face);
+    renderer.render(scene, this.camera.children[this.face]);
+    renderer.setRenderTarget(previousTarget);
+    renderer.autoClear = autoClear;
+    if (xr) xr.enabled = xrEnabled;
+    hidden.forEach(function (mesh) {
+      if (mesh) mesh.visible = true;
+    });
+    this.face = (this.face + 1) % 6;
+    if (this.face === 0) {
+      this.updated = time;
+      this.captures++;
+    }
+  },
+
+  remove: function () {
+    if (this.scheduler) this.scheduler.unregister(this);
+    this.el.object3D.remove(this.camera);
+    this.camera.renderTarget.dispose();
+  }
+});
+
+/**
+ * Sets the texture of a reflection-probe entity as envMap of the materials
+ * of the model, which is hidden while the probe renders.
+ */
+AFRAME.registerComponent('probe-env', {
+  schema: {
+    probe: { type: 'selector' }
+  },
+
+  init: function () {
+    this.apply = this.apply.bind(this);
+    this.el.addEventListener('object3dset', this.apply);
+  },
+
+  update: function (oldData) {
+    const old = oldData.probe && oldData.probe.components['reflection-probe'];
+    if (old) this.detach(old);
+    this.apply();
+  },
+
+  apply: function () {
+    const probe = this.data.probe && this.data.probe.components['reflection-probe'];
+    const mesh = this.el.getObject3D('mesh');
+    if (!probe || !mesh) return;
+    if (probe.users.indexOf(this.el) < 0) probe.users.push(this.el);
+    mesh.traverse(function (node) {
+      if (node.isMesh && node.material) {
+        node.material.envMap = probe.texture;
         node.material.needsUpdate = true;
       }
     });
+  },
+
+  detach: function (probe) {
+    const i = probe.users.indexOf(this.el);
+    if (i >= 0) probe.users.splice(i, 1);
+  },
+
+  remove: function () {
+    this.el.removeEventListener('object3dset', this.apply);
+    const probe = this.data.probe && this.data.probe.components['reflection-probe'];
+    if (probe) this.detach(probe);
   }
-});
\ No newline at end of file
+});
@@ -0,0 +1,138 @@
+'''
+AFRAME Exporter for Blender - texture optimization
+
+Decides the size of every texture from its role (color, normal, data,
+lightmap, sky): at most the largest dimension set for the role and rounded
+to power-of-two sizes, so WebGL can build mipmaps without resizing it at
+load time. The glTF images are read and replaced here whatever their
+storage (GLB buffer view, data URI or file next to the .gltf), optional
+KTX2 (Basis Universal) copies are declared with KHR_texture_basisu and the
+PNG / JPEG image kept as fallback. The resizing is done by Blender and the
+KTX2 encoding by the toktx tool of KTX-Software (see optimize_textures() in
+__init__.py), the results are cached by source hash. It does not import bpy.
+'''
+
+import os
+import math
+import base64
+import struct
+import hashlib
+import urllib.parse
+
+KTX2_EXTENSION = "KHR_texture_basisu"
+MIME_TYPES = { ".png": "image/png", ".jpg": "image/jpeg", ".ktx2": "image/ktx2" }
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG start of frame markers (baseline, progressive, ...), they carry the size
+JPEG_SOF = { 0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF }
+
+
+def image_size(data):
+    # ( width, height ) of PNG or JPEG bytes, None for other formats
+    if data[:8] == PNG_SIGNATURE and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+    if data[:2] == b"\xff\xd8":
+        offset = 2
+        while offset + 9 < len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset+1]
+            if marker == 0xFF:
+                offset += 1
+                continue
+            length, = struct.unpack(">H", data[offset+2:offset+4])
+            if marker in JPEG_SOF:
+                height, width = struct.unpack(">HH", data[offset+5:offset+9])
+                return ( width, height )
+            offset += 2 + length
+    return None
+
+
+def extension(data):
+    if data[:8] == PNG_SIGNATURE:
+        return ".png"
+    if data[:2] == b"\xff\xd8":
+        return ".jpg"
+    return None
+
+
+def target_size(size, max_size):
+    # nearest power of two of each side, halved (keeping the aspect ratio) to fit max_size
+    width, height = ( 1 << max(0, round(math.log2(max(1, s)))) for s in size )
+    while max(width, height) > max_size and min(width, height) > 1:
+        width //= 2
+        height //= 2
+    return ( max(1, min(width, max_size)), max(1, min(height, max_size)) )
+
+
+def cache_key(data, role, size, settings):
+    h = hashlib.sha1(repr(( role, size, settings )).encode())
+    h.update(data)
+    return h.hexdigest()
+
+
+def image_roles(gltf):
+    # { image index: role } from the material slots using it, color first
+    order = ( "color", "normal", "data" )
+    slots = []
+    for material in gltf.get("materials", []):
+        pbr = material.get("pbrMetallicRoughness", {})
+        slots += [ ( pbr.get("baseColorTexture"), "color" ), ( material.get("emissiveTexture"), "color" ), ( material.get("normalTexture"), "normal" ),
+                   ( pbr.get("metallicRoughnessTexture"), "data" ), ( material.get("occlusionTexture"), "data" ) ]
+    textures = gltf.get("textures", [])
+    roles = {}
+    for info, role in slots:
+        if info is None or info.get("index", -1) >= len(textures) or "source" not in textures[info["index"]]:
+            continue
+        source = textures[info["index"]]["source"]
+        if source not in roles or order.index(role) < order.index(roles[source]):
+            roles[source] = role
+    return roles
+
+
+def read_image(gltf, binary, folder, image):
+    # bytes of a glTF image: buffer view, data URI or file relative to the .gltf
+    if "bufferView" in image:
+        view = gltf["bufferViews"][image["bufferView"]]
+        start = view.get("byteOffset", 0)
+        return bytes(binary[start:start+view["byteLength"]])
+    uri = image.get("uri", "")
+    if uri.startswith("data:"):
+        return base64.b64decode(uri.split(",", 1)[1])
+    with open(os.path.join ( folder, urllib.parse.unquote(uri) ), "rb") as file:
+        return file.read()
+
+
+def write_image(gltf, folder, image, data, ext, like, new_views):
+    # stores data in image the way the exporter stored the image like (buffer view,
+    # data URI or file next to the .gltf); the buffer views are packed afterwards by
+    # compression.repack() with new_views { view index: bytes }
+    if "bufferView" in like:
+        views = gltf.setdefault("bufferViews", [])
+        views.append({ "buffer": 0, "byteLength": len(data) })
+        new_views[len(views) - 1] = data
+        image["bufferView"] = len(views) - 1
+        image["mimeType"] = MIME_TYPES[ext]
+    elif like.get("uri", "").startswith("data:"):
+        image["uri"] = "data:" + MIME_TYPES[ext] + ";base64," + base64.b64encode(data).decode("ascii")
+    else:
+        name = os.path.splitext(urllib.parse.unquote(like["uri"]))[0] + ext
+        with open(os.path.join ( folder, name ), "wb") as file:
+            file.write(data)
+        image["uri"] = urllib.parse.quote(name)
+
+
+def add_ktx2(gltf, texture_source, ktx2_image):
+    # the KTX2 copy is used by loaders with KHR_texture_basisu, the others keep the fallback
+    for texture in gltf.get("textures", []):
+        if texture.get("source") == texture_source:
+            texture.setdefault("extensions", {})[KTX2_EXTENSION] = { "source": ktx2_image }
+    used = gltf.setdefault("extensionsUsed", [])
+    if KTX2_EXTENSION not in used:
+        used.append(KTX2_EXTENSION)
+
+
+def toktx_command(tool, source, target, role):
+    # ETC1S for color, UASTC (higher quality) for the normal and data textures, mipmaps included
+    if role == "color" or role == "sky":
+        return [ tool, "--t2", "--encode", "etc1s", "--genmipmap", target, source ]
+    return [ tool, "--t2", "--encode", "uastc", "--assign_oetf", "linear", "--genmipmap", target, source ]
@@ -0,0 +1,51 @@
+'''
+AFRAME Exporter for Blender - world transforms
+
+Converts the Blender world matrices (Z up) of the whole scene to A-Frame
+position / rotation / scale (Y up) in one batched NumPy pass. It does not
+import bpy: export_project() gathers the matrices with foreach_get and
+benchmarks/bench_transforms.py checks the result against reference matrices.
+'''
+
+import numpy as np
+
+# Blender (x, y, z) -> A-Frame / glTF (x, z, -y)
+Y_UP = np.array((( 1.0, 0.0, 0.0 ), ( 0.0, 0.0, 1.0 ), ( 0.0, -1.0, 0.0 )))
+
+
+def matrices_from_buffer(buffer):
+    # foreach_get("matrix_world") fills column-major 4x4 matrices, returns them row-major
+    return np.asarray(buffer, dtype=np.float64).reshape(-1, 4, 4).transpose(0, 2, 1)
+
+
+def euler_yxz(rotations):
+    # rotation matrices -> A-Frame rotation (degrees, the YXZ order of THREE.Euler)
+    m13 = rotations[:, 0, 2]
+    m23 = np.clip(rotations[:, 1, 2], -1.0, 1.0)
+    m33 = rotations[:, 2, 2]
+    regular = np.abs(m23) < 0.9999999
+    x = np.arcsin(-m23)
+    y = np.where(regular, np.arctan2(m13, m33), np.arctan2(-rotations[:, 2, 0], rotations[:, 0, 0]))
+    z = np.where(regular, np.arctan2(rotations[:, 1, 0], rotations[:, 1, 1]), 0.0)
+    return np.degrees(np.stack(( x, y, z ), axis=1))
+
+
+def world_transforms(matrices, centers, media):
+    # matrices: (n, 4, 4) row-major world matrices, centers: (n, 3) local geometry
+    # centers the entities sit on, media: (n,) True for a-video / a-image planes.
+    # The glTF geometry is exported in Y up local coordinates, so its rotation is
+    # Y_UP R Y_UP^T; a media plane keeps its Blender local axes, so Y_UP R.
+    linear = matrices[:, :3, :3]
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    world = np.einsum("nij,nj->ni", linear, centers) + matrices[:, :3, 3]
+    positions = world @ Y_UP.T
+
+    converted = np.einsum("ij,njk->nik", Y_UP, linear)
+    gltf = ~np.asarray(media, dtype=bool)
+    converted[gltf] = converted[gltf] @ Y_UP.T
+
+    scales = np.linalg.norm(converted, axis=1)
+    # a mirrored object gets a negative x scale
+    scales[np.linalg.det(converted) < 0, 0] *= -1.0
+    rotations = converted / np.where(scales == 0.0, 1.0, scales)[:, None, :]
+    return positions, euler_yxz(rotations), scales